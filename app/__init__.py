@@ -4,19 +4,32 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_pymongo import PyMongo
 from .config import Config
+from . import metrics
 
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app)
 
 jwt = JWTManager(app)
-mongo = PyMongo(app)
+mongo = PyMongo(app, event_listeners=[metrics.MongoCommandListener()])
+metrics.init_app(app)
 
 from .api.terraform.terraform import get_terraform_api
+from .api.terraform.runner import get_terraform_runner
 from .api.proxmox.proxmox import get_proxmox_api
+from .api.proxmox.async_proxmox import get_async_proxmox_api
+from .api.proxmox.provisioning import get_provisioning_pipeline
+from .api.ansible.results import get_playbook_result_store
+from .api.ansible.runner import get_playbook_runner
 
 proxmox_api = get_proxmox_api(app)
+async_proxmox_api = get_async_proxmox_api(app, proxmox_api)
+provisioning_pipeline = get_provisioning_pipeline(app, proxmox_api)
 terraform_api = get_terraform_api(app)
+terraform_runner = get_terraform_runner(app)
+playbook_results = get_playbook_result_store(app, mongo.db.playbook_results)
+playbook_runner = get_playbook_runner(app, playbook_results)
+metrics.register_collectors(app, proxmox_api, provisioning_pipeline, playbook_runner, terraform_runner)
 
 from app import routes
 
@@ -1,13 +1,28 @@
 import os
+import shlex
 import tempfile
-from typing import Tuple, Optional, Any
+import uuid
+from typing import Tuple, Optional, Any, Callable, List
 from flask import current_app, request, jsonify
 import yaml
+from requests.exceptions import HTTPError
 from app.ssh_connection import SSHConnection
+from .catalog import get_playbook_catalog
+from .facts import get_fact_cache
+from .inventory import check_host_entry, get_inventory_cache
+from .local import get_local_executor
+from .profiles import profile_environment
+from .results import JSONL_CALLBACK_ENV, ResultRecorder
+from .scheduler import get_control_host_scheduler
+from .sync import get_playbook_sync, remote_paths
 
 class Ansible:
-    def __init__(self):
+    def __init__(self, results=None):
         self.ssh_connection = SSHConnection()
+        self.results = results
+        self.catalog = get_playbook_catalog(current_app.config)
+        self.inventory = get_inventory_cache()
+        self.facts = get_fact_cache(current_app.config)
 
     def handle_exception(self, exception: Exception) -> Tuple[bool, Optional[Any], Optional[int]]:
         if isinstance(exception, HTTPError):
@@ -28,6 +43,7 @@ class Ansible:
                 self.ssh_connection.upload_file(local_path, remote_path)
             finally:
                 self.ssh_connection.disconnect()
+                self.catalog.invalidate(remote_path)
                 os.remove(local_path)
 
             return True, f"Playbook {playbook_name} deployed successfully.", None
@@ -36,23 +52,137 @@ class Ansible:
         
         
 
-    def execute_playbook(self, playbook_name: str) -> Tuple[bool, Optional[str], Optional[int]]:
+    def _recorder(self, playbook_name: str, control_host: str) -> ResultRecorder:
+        run_id = uuid.uuid4().hex
+        return (self.results.recorder(run_id, playbook_name, control_host) if self.results is not None
+                else ResultRecorder(None, run_id, playbook_name, control_host))
+
+    @staticmethod
+    def _render_into(recorder: ResultRecorder, rendered: List[str]) -> Callable[[str], None]:
+        """Callback feeding each output line to `recorder` and collecting its text rendering."""
+        def on_line(line: str) -> None:
+            display = recorder.feed(line)
+            if display is not None:
+                rendered.append(display)
+        return on_line
+
+    def _finish_recording(self, recorder: ResultRecorder) -> None:
+        recorder.flush()
+        self.facts.record(recorder.control_host, recorder.stats, recorder.gathered)
+
+    def _run_environment(self, profile: Optional[str]) -> dict:
+        return dict(self.facts.environment(), **profile_environment(current_app.config, profile))
+
+    def execute_playbook(self, playbook_name: str, profile: Optional[str] = None) -> Tuple[bool, Optional[str], Optional[int]]:
+        try:
+            env = self._run_environment(profile)
+        except ValueError as e:
+            return False, str(e), 400
+        if current_app.config['ANSIBLE_EXECUTION_BACKEND'] == 'local':
+            return self.execute_playbook_locally(playbook_name, env)
         playbook_dir = current_app.config['REMOTE_PLAYBOOKS_DIR']
         inventory_path = current_app.config['INVENTORY_PATH']
-        command = f"ansible-playbook -i {inventory_path} {playbook_name}"
+        settings = ' '.join(f"{key}={shlex.quote(value)}" for key, value in env.items())
+        command = f"{JSONL_CALLBACK_ENV} {settings} ansible-playbook -i {inventory_path} {playbook_name}"
+        scheduler = get_control_host_scheduler(current_app._get_current_object())
         try:
-            self.ssh_connection.connect()
+            host = scheduler.acquire(current_app.config['ANSIBLE_SCHEDULE_TIMEOUT'])
+        except TimeoutError as e:
+            return False, str(e), 503
+        try:
+            # The default connection already points at the primary control host
+            ssh_connection = self.ssh_connection if host.primary else host.connection()
+            scheduler.sync(host)
+            ssh_connection.connect()
+            recorder, rendered = self._recorder(playbook_name, host.hostname), []
             try:
-                stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"cd {playbook_dir} && {command}")
-                output = stdout.read().decode()
-                error = stderr.read().decode()
-                if error:
-                    return False, error, None
+                exit_status, error = ssh_connection.run_lines(f"cd {playbook_dir} && {command}",
+                                                              self._render_into(recorder, rendered))
+                # Warnings on stderr are not failures, the exit status tells
+                output = '\n'.join(rendered)
+                if exit_status != 0:
+                    return False, error.strip() or output, None
                 return True, output, None
             finally:
-                self.ssh_connection.disconnect()
+                self._finish_recording(recorder)
+                ssh_connection.disconnect()
         except Exception as e:
             return self.handle_exception(e)
+        finally:
+            scheduler.release(host)
+
+    def execute_playbook_locally(self, playbook_name: str, env: dict) -> Tuple[bool, Optional[str], Optional[int]]:
+        """
+        Run a playbook from LOCAL_PLAYBOOKS_DIR on the application host, without the
+        control host round trip. Same result contract as execute_playbook.
+        """
+        if '/' in playbook_name or playbook_name.startswith('.'):
+            return False, "Invalid playbook name", 400
+        recorder, rendered = self._recorder(playbook_name, 'local'), []
+        try:
+            exit_status = get_local_executor(current_app.config).run([playbook_name], env,
+                                                                     self._render_into(recorder, rendered),
+                                                                     current_app.config['ANSIBLE_SCHEDULE_TIMEOUT'])
+        except TimeoutError as e:
+            return False, str(e), 503
+        except Exception as e:
+            return self.handle_exception(e)
+        finally:
+            self._finish_recording(recorder)
+        output = '\n'.join(rendered)
+        if exit_status != 0:
+            return False, output, None
+        return True, output, None
+
+    def invalidate_facts(self, host: Optional[str] = None) -> Tuple[bool, Optional[Any], Optional[int]]:
+        """
+        Drop the cached facts of `host`, or of every host when None, wherever playbooks run,
+        so the next run gathers them again.
+
+        Returns:
+            tuple: (success, list of locations cleared or error message, status_code)
+        """
+        if host is not None and (not host or '/' in host or host.startswith('.')):
+            return False, "Invalid host name", 400
+        cleared = []
+        try:
+            if current_app.config['ANSIBLE_EXECUTION_BACKEND'] == 'local':
+                self.facts.remove_local(host)
+                cleared.append('local')
+            else:
+                command = self.facts.remove_command(host)
+                for control_host in get_control_host_scheduler(current_app._get_current_object()).hosts:
+                    with control_host.connection() as ssh:
+                        ssh.run(command)
+                    cleared.append(control_host.hostname)
+        except Exception as e:
+            return False, f"Error invalidating facts: {str(e)}", 500
+        finally:
+            self.facts.forget(host)
+        return True, cleared, None
+
+    def sync_playbooks(self, prune: bool = False) -> Tuple[bool, Optional[Any], Optional[int]]:
+        """
+        Upload the files of LOCAL_PLAYBOOKS_DIR that differ from the control host copy.
+
+        Args:
+            prune: Also delete remote files that no longer exist locally.
+
+        Returns:
+            tuple: (success, sync summary or error message, status_code)
+        """
+        local_dir = current_app.config['LOCAL_PLAYBOOKS_DIR']
+        remote_dir = current_app.config['REMOTE_PLAYBOOKS_DIR']
+        if not local_dir or not os.path.isdir(local_dir):
+            return False, "LOCAL_PLAYBOOKS_DIR is not a directory.", 400
+        try:
+            with self.ssh_connection as ssh:
+                result = get_playbook_sync().sync(ssh, local_dir, remote_dir, prune=prune)
+        except Exception as e:
+            return False, f"Error syncing playbooks: {str(e)}", 500
+        for path in remote_paths(remote_dir, result['uploaded'] + result['deleted']):
+            self.catalog.invalidate(path)
+        return True, result, None
 
     def modify_playbook(self, playbook_name: str) -> Tuple[bool, Optional[str], Optional[int]]:
         remote_path = os.path.join(current_app.config['REMOTE_PLAYBOOKS_DIR'], playbook_name)
@@ -61,8 +191,8 @@ class Ansible:
         self.ssh_connection.connect()
         try:
             # Check if file exists
-            stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"test -f {remote_path} && echo exists")
-            if stdout.read().decode().strip() != "exists":
+            exit_status, output, error = self.ssh_connection.run(f"test -f {remote_path} && echo exists")
+            if output.strip() != "exists":
                 return False, "Playbook does not exist.", 404
 
             # Parse new content into YAML
@@ -78,6 +208,7 @@ class Ansible:
 
             # Upload the new content to the remote playbook
             self.ssh_connection.upload_file(local_path, remote_path)
+            self.catalog.invalidate(remote_path)
             return True, "Playbook modified successfully.", None
         except Exception as e:
             return False, f"Error modifying playbook: {str(e)}", 500
@@ -87,17 +218,16 @@ class Ansible:
                 os.remove(local_path)
 
     def list_playbooks(self) -> Tuple[bool, Optional[list[str]], Optional[int]]:
+        success, playbooks, status_code = self.playbook_catalog()
+        if not success:
+            return success, playbooks, status_code
+        return True, [playbook['name'] for playbook in playbooks if playbook['name'].endswith('.yml')], None
+
+    def playbook_catalog(self) -> Tuple[bool, Optional[list[dict]], Optional[int]]:
         playbook_dir = current_app.config['REMOTE_PLAYBOOKS_DIR']
         self.ssh_connection.connect()
         try:
-            stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"ls {playbook_dir}/*.yml")
-            error = stderr.read().decode()
-            if error:
-                return False, None, 500
-
-            playbooks = stdout.read().decode().strip().split('\n')
-            playbooks = [os.path.basename(pb) for pb in playbooks]
-            return True, playbooks, None
+            return True, self.catalog.list(self.ssh_connection.sftp, playbook_dir), None
         except Exception as e:
             return False, None, 500
         finally:
@@ -107,14 +237,14 @@ class Ansible:
         remote_path = os.path.join(current_app.config['REMOTE_PLAYBOOKS_DIR'], playbook_name)
         self.ssh_connection.connect()
         try:
-            stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"test -f {remote_path} && echo exists")
-            if stdout.read().decode().strip() != "exists":
+            exit_status, output, error = self.ssh_connection.run(f"test -f {remote_path} && echo exists")
+            if output.strip() != "exists":
                 return False, "Playbook does not exist.", 404
 
-            stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"rm {remote_path}")
-            error = stderr.read().decode()
+            exit_status, output, error = self.ssh_connection.run(f"rm {remote_path}")
             if error:
                 return False, error, 500
+            self.catalog.invalidate(remote_path)
 
             return True, "Playbook deleted successfully.", None
         except Exception as e:
@@ -126,37 +256,118 @@ class Ansible:
         hosts_path = current_app.config['INVENTORY_PATH']
         self.ssh_connection.connect()
         try:
-            stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"test -f {hosts_path} && echo exists")
-            if stdout.read().decode().strip() != "exists":
+            exit_status, output, error = self.ssh_connection.run(f"test -f {hosts_path} && echo exists")
+            if output.strip() != "exists":
                 return False, "hosts.ini does not exist.", 404
 
-            with tempfile.NamedTemporaryFile('w', delete=False) as tmp_file:
-                tmp_file.write(new_content)
-                local_path = tmp_file.name
-
-            self.ssh_connection.upload_file(local_path, hosts_path)
-            os.remove(local_path)
+            self.inventory.write(self.ssh_connection.sftp, hosts_path, new_content)
             return True, "hosts.ini modified successfully.", None
         except Exception as e:
             return False, f"Error modifying hosts.ini: {str(e)}", 500
         finally:
             self.ssh_connection.disconnect()
 
+    def inventory_content(self) -> Tuple[bool, Optional[str], Optional[int]]:
+        return self._read_inventory(lambda inventory: inventory.render())
+
+    def write_inventory(self, content: str) -> Tuple[bool, Optional[str], Optional[int]]:
+        try:
+            with self.ssh_connection as ssh:
+                self.inventory.write(ssh.sftp, current_app.config['INVENTORY_PATH'], content)
+            return True, "hosts.ini modified successfully.", None
+        except Exception as e:
+            return False, f"Error modifying hosts.ini: {str(e)}", 500
+
+    def _read_inventory(self, query) -> Tuple[bool, Optional[Any], Optional[int]]:
+        try:
+            with self.ssh_connection as ssh:
+                inventory = self.inventory.get(ssh.sftp, current_app.config['INVENTORY_PATH'])
+            return True, query(inventory), None
+        except FileNotFoundError:
+            return False, "hosts.ini does not exist.", 404
+        except Exception as e:
+            return False, f"Error reading hosts.ini: {str(e)}", 500
+
+    def _edit_inventory(self, change) -> Tuple[bool, Optional[Any], Optional[int]]:
+        try:
+            with self.ssh_connection as ssh:
+                result = self.inventory.edit(ssh, current_app.config['INVENTORY_PATH'], change)
+            return True, result, None
+        except FileNotFoundError:
+            return False, "hosts.ini does not exist.", 404
+        except LookupError as e:
+            return False, f"Host {e.args[0]} does not exist.", 404
+        except ValueError as e:
+            return False, str(e), 409
+        except Exception as e:
+            return False, f"Error modifying hosts.ini: {str(e)}", 500
+
+    def inventory_groups(self) -> Tuple[bool, Optional[Any], Optional[int]]:
+        return self._read_inventory(lambda inventory: inventory.groups())
+
+    def inventory_group(self, group: str) -> Tuple[bool, Optional[Any], Optional[int]]:
+        success, data, status_code = self._read_inventory(lambda inventory: inventory.group(group))
+        if success and data is None:
+            return False, f"Group {group} does not exist.", 404
+        return success, data, status_code
+
+    def inventory_hosts(self, group: Optional[str] = None) -> Tuple[bool, Optional[Any], Optional[int]]:
+        return self._read_inventory(lambda inventory: inventory.hosts(group))
+
+    def inventory_host(self, host: str) -> Tuple[bool, Optional[Any], Optional[int]]:
+        success, data, status_code = self._read_inventory(lambda inventory: inventory.host(host))
+        if success and data is None:
+            return False, f"Host {host} does not exist.", 404
+        return success, data, status_code
+
+    def add_inventory_host(self, host: str, groups: list, variables: dict) -> Tuple[bool, Optional[Any], Optional[int]]:
+        """
+        Add a host to the inventory, rewriting only its lines.
+
+        Args:
+            host: Host name or address.
+            groups: Groups to add it to, created when missing; 'ungrouped' when empty.
+            variables: Host variables, written inline.
+
+        Returns:
+            tuple: (success, host data or error message, status_code)
+        """
+        error = check_host_entry(host, groups, variables)
+        if error:
+            return False, error, 400
+
+        def change(inventory):
+            inventory.add_host(host, groups, variables)
+            return inventory.host(host)
+        return self._edit_inventory(change)
+
+    def update_inventory_host(self, host: str, variables: dict, remove: list) -> Tuple[bool, Optional[Any], Optional[int]]:
+        error = check_host_entry(variables=variables, remove=remove)
+        if error:
+            return False, error, 400
+
+        def change(inventory):
+            if not inventory.update_host(host, variables, remove):
+                raise LookupError(host)
+            return inventory.host(host)
+        return self._edit_inventory(change)
+
+    def remove_inventory_host(self, host: str, group: Optional[str] = None) -> Tuple[bool, Optional[Any], Optional[int]]:
+        def change(inventory):
+            if not inventory.remove_host(host, group):
+                raise LookupError(host)
+            return f"Host {host} removed."
+        return self._edit_inventory(change)
+
     def playbook_detail(self, playbook_name: str) -> Tuple[bool, Optional[Any], Optional[int]]:
         playbook_path = os.path.join(current_app.config['REMOTE_PLAYBOOKS_DIR'], playbook_name)
         self.ssh_connection.connect()
         try:
-            stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"test -f {playbook_path} && echo exists")
-            if stdout.read().decode().strip() != "exists":
+            content, parsed_content, error = self.catalog.get(self.ssh_connection.sftp, playbook_path)
+            if content is None:
                 return False, "Playbook does not exist.", 404
-
-            stdin, stdout, stderr = self.ssh_connection.client.exec_command(f"cat {playbook_path}")
-            content = stdout.read().decode()
-            try:
-                parsed_content = yaml.safe_load(content)
-            except yaml.YAMLError as e:
-                return False, f"Error parsing YAML: {str(e)}", 500
-
+            if error:
+                return False, error, 500
             return True, parsed_content, None
         except Exception as e:
             return False, f"Error retrieving playbook: {str(e)}", 500
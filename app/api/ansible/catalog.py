@@ -0,0 +1,135 @@
+import posixpath
+import stat
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import yaml
+
+PLAYBOOK_EXTENSIONS = ('.yml', '.yaml')
+
+
+class _CachedPlaybook:
+    __slots__ = ('mtime', 'size', 'content', 'parsed', 'error')
+
+    def __init__(self, mtime: int, size: int, content: str) -> None:
+        self.mtime = mtime
+        self.size = size
+        self.content = content
+        self.parsed: Any = None
+        self.error: Optional[str] = None
+        try:
+            self.parsed = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            self.error = f"Error parsing YAML: {str(e)}"
+
+    @property
+    def plays(self) -> Optional[int]:
+        if self.error is not None:
+            return None
+        return len(self.parsed) if isinstance(self.parsed, list) else 0
+
+
+class PlaybookCatalog:
+    """
+    Playbook listing and contents read over SFTP, with the file contents and parsed YAML
+    cached by (path, mtime, size).
+
+    Listing a directory is a single listdir_attr round trip; only the playbooks whose
+    mtime or size changed since they were cached are read again.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, _CachedPlaybook]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, path: str, mtime: int, size: int) -> Optional[_CachedPlaybook]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.mtime != mtime or entry.size != size:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+
+    def _load(self, sftp: Any, path: str, mtime: int, size: int) -> _CachedPlaybook:
+        entry = self._cached(path, mtime, size)
+        if entry is not None:
+            return entry
+        with sftp.open(path, 'rb') as remote_file:
+            remote_file.prefetch(size)  # Pipeline the read requests instead of one round trip per block
+            content = remote_file.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', errors='replace')
+        entry = _CachedPlaybook(mtime, size, content)
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[path] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return entry
+
+    def list(self, sftp: Any, directory: str) -> List[Dict[str, Any]]:
+        """
+        List the playbooks of `directory` with their size, modification time and number
+        of plays (None when the YAML does not parse).
+        """
+        playbooks = []
+        for attr in sftp.listdir_attr(directory):
+            if not stat.S_ISREG(attr.st_mode or 0) or not attr.filename.endswith(PLAYBOOK_EXTENSIONS):
+                continue
+            entry = self._load(sftp, posixpath.join(directory, attr.filename), attr.st_mtime, attr.st_size)
+            playbooks.append({'name': attr.filename, 'size': attr.st_size, 'modified': attr.st_mtime,
+                              'plays': entry.plays, 'valid': entry.error is None})
+        return sorted(playbooks, key=lambda playbook: playbook['name'])
+
+    def get(self, sftp: Any, path: str) -> Tuple[Optional[str], Any, Optional[str]]:
+        """
+        Read one playbook, revalidating the cached copy with a single stat.
+
+        Returns:
+            tuple: (content, parsed YAML, parse error), content is None when the file does not exist.
+        """
+        try:
+            attr = sftp.stat(path)
+        except FileNotFoundError:
+            return None, None, None
+        if not stat.S_ISREG(attr.st_mode or 0):
+            return None, None, None
+        entry = self._load(sftp, path, attr.st_mtime, attr.st_size)
+        return entry.content, entry.parsed, entry.error
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses,
+                    'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+_catalog: Optional[PlaybookCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_playbook_catalog(config: Any) -> PlaybookCatalog:
+    """
+    Return the process-wide playbook catalog, creating it on first use.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = PlaybookCatalog(config['ANSIBLE_CATALOG_MAX_BYTES'])
+        return _catalog
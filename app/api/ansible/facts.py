@@ -0,0 +1,107 @@
+import os
+import shlex
+import shutil
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+# Gathering task names and modules whose results mean facts were gathered, not read from the cache
+GATHER_TASKS = ('Gathering Facts',)
+GATHER_ACTIONS = ('gather_facts', 'setup', 'ansible.builtin.gather_facts', 'ansible.builtin.setup')
+
+
+class FactCache:
+    """
+    Ansible's jsonfile fact cache, shared by every run on a host and managed by the app.
+
+    Runs are configured with 'smart' gathering: facts are gathered for a host only when
+    its cache file is missing or older than `ttl` seconds, so they are collected once per
+    TTL window instead of on every run. The cache lives in `directory` on the host
+    running ansible-playbook: each control host, or the application host for the
+    'local' backend. A leading ~ is the home of the user running it there, which keeps
+    the cache out of reach of other users who could otherwise plant facts.
+
+    Ansible does not report cache hits, so they are inferred. A host a run did not
+    gather facts for counts as a hit when the app saw its facts gathered on the same
+    location within the TTL. Gathering always counts as a miss.
+    """
+
+    def __init__(self, directory: str, ttl: int) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self._gathered: Dict[str, Dict[str, float]] = {}  # location -> host -> when facts were gathered
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def environment(self) -> Dict[str, str]:
+        return {
+            'ANSIBLE_GATHERING': 'smart',
+            'ANSIBLE_CACHE_PLUGIN': 'jsonfile',
+            'ANSIBLE_CACHE_PLUGIN_CONNECTION': self.directory,
+            'ANSIBLE_CACHE_PLUGIN_TIMEOUT': str(self.ttl),
+        }
+
+    def record(self, location: str, hosts: Iterable[str], gathered: Iterable[str]) -> None:
+        """Account for a finished run on `location` over `hosts`, of which `gathered` had facts gathered."""
+        now = time.time()
+        gathered = set(gathered)
+        with self._lock:
+            known = self._gathered.setdefault(location, {})
+            for host in set(hosts) - gathered:
+                if now - known.get(host, float('-inf')) < self.ttl:
+                    self.hits += 1
+            self.misses += len(gathered)
+            known.update(dict.fromkeys(gathered, now))
+
+    def remove_command(self, host: Optional[str] = None) -> str:
+        """Shell command dropping the cached facts of `host`, or of every host when None."""
+        if self.directory.startswith('~/'):
+            directory = '"$HOME"/' + shlex.quote(self.directory[2:])
+        else:
+            directory = shlex.quote(self.directory)
+        return f'rm -f -- {directory}/{shlex.quote(host)}' if host else f'rm -rf -- {directory}/*'
+
+    def remove_local(self, host: Optional[str] = None) -> None:
+        """Drop the cached facts of `host`, or of every host when None, on the application host."""
+        directory = os.path.expanduser(self.directory)
+        if host:
+            if os.path.lexists(os.path.join(directory, host)):
+                os.remove(os.path.join(directory, host))
+        elif os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+
+    def forget(self, host: Optional[str] = None) -> None:
+        with self._lock:
+            for known in self._gathered.values():
+                if host is None:
+                    known.clear()
+                else:
+                    known.pop(host, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            now = time.time()
+            fresh = sum(1 for known in self._gathered.values() for when in known.values() if now - when < self.ttl)
+            return {'directory': self.directory, 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses,
+                    'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0, 'entries': fresh}
+
+
+_cache: Optional[FactCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_fact_cache(config: Any) -> FactCache:
+    """
+    Return the process-wide fact cache, creating it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FactCache(config['ANSIBLE_FACT_CACHE_DIR'], config['ANSIBLE_FACT_CACHE_TTL'])
+        return _cache
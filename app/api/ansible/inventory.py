@@ -0,0 +1,413 @@
+import posixpath
+import re
+import shlex
+import stat
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Hosts listed before any section header belong to this implicit group
+UNGROUPED = 'ungrouped'
+
+# Names accepted from API callers, none of which can break out of their line or section
+_HOST_NAME = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.:@-]*')
+_GROUP_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_-]*')
+_VAR_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+class _Line:
+    """One inventory line. Lines not touched by an edit are written back verbatim."""
+
+    __slots__ = ('raw', 'key', 'vars')
+
+    def __init__(self, raw: str, key: Optional[str] = None, variables: Optional[Dict[str, str]] = None) -> None:
+        self.raw = raw
+        self.key = key
+        self.vars = variables or {}
+
+
+class _Section:
+    __slots__ = ('header', 'group', 'kind', 'lines')
+
+    def __init__(self, header: Optional[str], group: str, kind: str) -> None:
+        self.header = header
+        self.group = group
+        self.kind = kind  # 'hosts', 'vars' or 'children'
+        self.lines: List[_Line] = []
+
+
+def _parse_host(raw: str) -> _Line:
+    try:
+        tokens = shlex.split(raw, comments=True)
+    except ValueError:
+        tokens = raw.split()
+    variables = {}
+    for token in tokens[1:]:
+        key, _, value = token.partition('=')
+        variables[key] = value
+    return _Line(raw, tokens[0], variables)
+
+
+def check_host_entry(name: Any = None, groups: Any = (), variables: Any = None, remove: Any = ()) -> Optional[str]:
+    """
+    Return why a host entry sent by a caller cannot be written to the inventory, or None
+    when it can: names must match a strict pattern and values must be single-line
+    scalars, so an entry always stays on its own line. A `name` of None is not checked,
+    for edits of a host already in the inventory.
+    """
+    if name is not None and (not isinstance(name, str) or not _HOST_NAME.fullmatch(name)):
+        return f'Invalid host name: {name!r}'
+    if not isinstance(groups, (list, tuple)):
+        return 'groups must be a list of group names'
+    for group in groups:
+        if not isinstance(group, str) or not _GROUP_NAME.fullmatch(group):
+            return f'Invalid group name: {group!r}'
+    if variables is not None and not isinstance(variables, dict):
+        return 'vars must be an object'
+    for key, value in (variables or {}).items():
+        if not _VAR_NAME.fullmatch(key):
+            return f'Invalid variable name: {key!r}'
+        if isinstance(value, (dict, list)) or value is None or any(c in str(value) for c in '\r\n'):
+            return f'Variable {key} must be a single-line scalar'
+    if not isinstance(remove, (list, tuple)):
+        return 'remove_vars must be a list of variable names'
+    for key in remove:
+        if not isinstance(key, str) or not _VAR_NAME.fullmatch(key):
+            return f'Invalid variable name: {key!r}'
+    return None
+
+
+def _format_host(name: str, variables: Dict[str, str]) -> str:
+    return ' '.join([name] + [f'{key}={shlex.quote(str(value))}' for key, value in variables.items()])
+
+
+class Inventory:
+    """
+    An INI inventory as groups, hosts and vars, editable host by host.
+
+    Comments, blank lines and untouched entries keep their original text, so writing an
+    edited inventory back only changes the lines of the hosts that were edited.
+    """
+
+    def __init__(self, sections: List[_Section], newline: str = '\n', final_newline: bool = True) -> None:
+        self.sections = sections
+        self.newline = newline
+        self.final_newline = final_newline
+        self._reindex()
+
+    @classmethod
+    def parse(cls, text: str) -> 'Inventory':
+        section = _Section(None, UNGROUPED, 'hosts')
+        sections = [section]
+        for raw in text.splitlines():
+            line = raw.strip()
+            if line.startswith('[') and line.endswith(']'):
+                group, _, kind = line[1:-1].partition(':')
+                section = _Section(raw, group, kind or 'hosts')
+                sections.append(section)
+            elif not line or line[0] in '#;':
+                section.lines.append(_Line(raw))
+            elif section.kind == 'hosts':
+                section.lines.append(_parse_host(raw))
+            elif section.kind == 'vars':
+                key, _, value = line.partition('=')
+                section.lines.append(_Line(raw, key.strip(), {key.strip(): value.strip()}))
+            else:
+                section.lines.append(_Line(raw, line.split()[0]))
+        return cls(sections, '\r\n' if '\r\n' in text else '\n', not text or text.endswith('\n'))
+
+    def render(self) -> str:
+        out = []
+        for section in self.sections:
+            if section.header is not None:
+                out.append(section.header)
+            out.extend(line.raw for line in section.lines)
+        if not out:
+            return ''
+        return self.newline.join(out) + (self.newline if self.final_newline else '')
+
+    def _reindex(self) -> None:
+        self._groups: Dict[str, Dict[str, _Section]] = {}
+        self._hosts: Dict[str, List[Tuple[_Section, _Line]]] = {}
+        for section in self.sections:
+            self._groups.setdefault(section.group, {}).setdefault(section.kind, section)
+            if section.kind == 'hosts':
+                for line in section.lines:
+                    if line.key:
+                        self._hosts.setdefault(line.key, []).append((section, line))
+
+    def _entries(self, group: str, kind: str) -> List[_Line]:
+        return [line for section in self.sections if section.group == group and section.kind == kind
+                for line in section.lines if line.key]
+
+    def groups(self) -> List[Dict[str, Any]]:
+        return [{'name': name, 'hosts': len(self._entries(name, 'hosts')),
+                 'children': [line.key for line in self._entries(name, 'children')]}
+                for name in sorted(self._groups) if name != UNGROUPED or self._entries(name, 'hosts')]
+
+    def group(self, name: str) -> Optional[Dict[str, Any]]:
+        if name not in self._groups:
+            return None
+        variables = {}
+        for line in self._entries(name, 'vars'):
+            variables.update(line.vars)
+        return {'name': name, 'hosts': [{'name': line.key, 'vars': line.vars} for line in self._entries(name, 'hosts')],
+                'children': [line.key for line in self._entries(name, 'children')], 'vars': variables}
+
+    def hosts(self, group: Optional[str] = None) -> List[str]:
+        if group is not None:
+            return [line.key for line in self._entries(group, 'hosts')]
+        return sorted(self._hosts)
+
+    def host(self, name: str) -> Optional[Dict[str, Any]]:
+        entries = self._hosts.get(name)
+        if not entries:
+            return None
+        variables = {}
+        for section, line in entries:
+            variables.update(line.vars)
+        return {'name': name, 'groups': sorted({section.group for section, line in entries}), 'vars': variables}
+
+    def add_host(self, name: str, groups: List[str], variables: Dict[str, str]) -> None:
+        """Add a host to each of `groups`, creating the groups that do not exist yet."""
+        for group in groups or [UNGROUPED]:
+            if any(section.group == group for section, line in self._hosts.get(name, [])):
+                raise ValueError(f'Host {name} is already in group {group}')
+            section = self._groups.get(group, {}).get('hosts')
+            if section is None:
+                section = _Section(f'[{group}]', group, 'hosts')
+                if self.sections[-1].lines and self.sections[-1].lines[-1].raw.strip():
+                    self.sections[-1].lines.append(_Line(''))
+                self.sections.append(section)
+            # Insert after the last host of the section, before trailing comments and blank lines
+            position = max((index + 1 for index, line in enumerate(section.lines) if line.key), default=0)
+            section.lines.insert(position, _Line(_format_host(name, variables), name, dict(variables)))
+        self._reindex()
+
+    def remove_host(self, name: str, group: Optional[str] = None) -> bool:
+        """Remove a host from `group`, or from every group when None."""
+        removed = False
+        for section, line in self._hosts.get(name, []):
+            if group is None or section.group == group:
+                section.lines.remove(line)
+                removed = True
+        self._reindex()
+        return removed
+
+    def update_host(self, name: str, variables: Dict[str, str], remove: List[str]) -> bool:
+        """Set and remove host variables on every line of the host."""
+        entries = self._hosts.get(name)
+        if not entries:
+            return False
+        for section, line in entries:
+            line.vars = {key: value for key, value in line.vars.items() if key not in remove}
+            line.vars.update(variables)
+            indent = line.raw[:len(line.raw) - len(line.raw.lstrip())]
+            line.raw = indent + _format_host(name, line.vars)
+        return True
+
+
+class _CachedInventory:
+    __slots__ = ('mtime', 'size', 'content', 'inventory')
+
+    def __init__(self, mtime: int, size: int, content: bytes, inventory: Inventory) -> None:
+        self.mtime = mtime
+        self.size = size
+        self.content = content
+        self.inventory = inventory
+
+
+class InventoryChanged(Exception):
+    """The inventory file changed on the remote host while an edit was being applied."""
+
+
+def _changed_span(old: bytes, new: bytes) -> Tuple[int, int]:
+    """
+    Return the lengths of the common prefix and suffix of `old` and `new`, not
+    overlapping and widened to whole lines, so new[prefix:len(new) - suffix] holds the
+    lines that changed.
+    """
+    limit = min(len(old), len(new))
+    prefix = 0
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    prefix = new.rfind(b'\n', 0, prefix) + 1
+    start = len(new) - suffix
+    if 0 < start < len(new) and new[start - 1:start] != b'\n':
+        end_of_line = new.find(b'\n', start)
+        start = len(new) if end_of_line == -1 else end_of_line + 1
+    return prefix, len(new) - start
+
+
+class InventoryCache:
+    """
+    Parsed inventories read over SFTP, revalidated with one stat against the remote
+    mtime and size.
+
+    Edits are applied to a copy of the cached model under a per-path lock. Only the lines
+    that changed are sent to the host: a shell command there splices them between the
+    unchanged head and tail of the current file into a temporary file, which takes the
+    mode and owner of the inventory and is renamed over it. The command first checks
+    the file is still the cached version, so a concurrent outside change is never lost.
+    """
+
+    # Edits larger than this are uploaded whole rather than passed on a command line
+    MAX_PATCH_BYTES = 64 * 1024
+    _CONFLICT = 75
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, _CachedInventory] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path_lock(self, path: str) -> threading.RLock:
+        with self._lock:
+            return self._locks.setdefault(path, threading.RLock())
+
+    def get(self, sftp: Any, path: str) -> Inventory:
+        """
+        Return the inventory at `path`.
+
+        Raises:
+            FileNotFoundError: When the inventory does not exist.
+        """
+        return self._entry(sftp, path).inventory
+
+    def _entry(self, sftp: Any, path: str) -> _CachedInventory:
+        with self._path_lock(path):
+            attr = sftp.stat(path)
+            entry = self._entries.get(path)
+            if entry is not None and (entry.mtime, entry.size) == (attr.st_mtime, attr.st_size):
+                self.hits += 1
+                return entry
+            self.misses += 1
+            with sftp.open(path, 'rb') as remote_file:
+                remote_file.prefetch(attr.st_size)
+                content = remote_file.read()
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            entry = _CachedInventory(attr.st_mtime, attr.st_size, content,
+                                     Inventory.parse(content.decode('utf-8', errors='replace')))
+            self._entries[path] = entry
+            return entry
+
+    def write(self, sftp: Any, path: str, content: str, inventory: Optional[Inventory] = None) -> None:
+        """
+        Replace the whole inventory atomically with `content`, whose parsed form
+        `inventory` may be given, keeping the mode and owner of the file it replaces.
+        """
+        with self._path_lock(path):
+            temporary = posixpath.join(posixpath.dirname(path), f'.{posixpath.basename(path)}.{uuid.uuid4().hex}')
+            data = content.encode('utf-8')
+            try:
+                try:
+                    current = sftp.stat(path)
+                except FileNotFoundError:
+                    current = None
+                with sftp.open(temporary, 'wb') as remote_file:
+                    remote_file.write(data)
+                if current is not None:
+                    sftp.chmod(temporary, stat.S_IMODE(current.st_mode))
+                    try:
+                        sftp.chown(temporary, current.st_uid, current.st_gid)
+                    except (IOError, OSError):
+                        pass  # Only root may give the file away, the mode is what matters
+                sftp.posix_rename(temporary, path)
+            except Exception:
+                self._entries.pop(path, None)
+                try:
+                    sftp.remove(temporary)
+                except Exception:
+                    pass
+                raise
+            attr = sftp.stat(path)
+            self._entries[path] = _CachedInventory(attr.st_mtime, attr.st_size, data,
+                                                   inventory or Inventory.parse(content))
+
+    def edit(self, ssh: Any, path: str, change: Callable[[Inventory], Any]) -> Any:
+        """
+        Apply `change` to the current inventory and write back the lines it changed,
+        returning what `change` returned. Nothing is written when `change` raises.
+
+        Args:
+            ssh: An open SSHConnection to the host holding the inventory.
+            path: Remote inventory path.
+            change: Callable editing the Inventory it is given.
+
+        Raises:
+            InventoryChanged: When the file keeps changing remotely during the edit.
+        """
+        with self._path_lock(path):
+            for attempt in range(2):
+                entry = self._entry(ssh.sftp, path)
+                inventory = Inventory.parse(entry.inventory.render())  # Edits never touch the cached copy
+                result = change(inventory)
+                content = inventory.render()
+                data = content.encode('utf-8')
+                if data == entry.content:
+                    return result
+                prefix, suffix = _changed_span(entry.content, data)
+                if len(data) - prefix - suffix > self.MAX_PATCH_BYTES:
+                    self.write(ssh.sftp, path, content, inventory)
+                    return result
+                try:
+                    mtime, size = self._splice(ssh, path, entry, data, prefix, suffix)
+                except InventoryChanged:
+                    self._entries.pop(path, None)
+                    if attempt:
+                        raise
+                    continue
+                self._entries[path] = _CachedInventory(mtime, size, data, inventory)
+                return result
+
+    def _splice(self, ssh: Any, path: str, entry: _CachedInventory, data: bytes,
+                prefix: int, suffix: int) -> Tuple[int, int]:
+        """
+        Replace the bytes of the remote file between its first `prefix` and last `suffix`
+        bytes with the changed lines of `data`, through a temporary file renamed over it.
+
+        Returns:
+            tuple: The new (mtime, size) of the file.
+        """
+        target = shlex.quote(path)
+        temporary = shlex.quote(posixpath.join(posixpath.dirname(path),
+                                               f'.{posixpath.basename(path)}.{uuid.uuid4().hex}'))
+        middle = shlex.quote(data[prefix:len(data) - suffix].decode('utf-8'))
+        exit_status, output, error = ssh.run(
+            f'[ "$(stat -c %Y:%s {target})" = "{entry.mtime}:{entry.size}" ] || exit {self._CONFLICT}; '
+            f'{{ head -c {prefix} {target} && printf %s {middle} && tail -c {suffix} {target}; }} > {temporary} '
+            f'&& chmod --reference={target} {temporary} '
+            f'&& {{ chown --reference={target} {temporary} 2>/dev/null || true; }} '
+            f'&& mv -f {temporary} {target} && stat -c %Y:%s {target} '
+            f'|| {{ status=$?; rm -f {temporary}; exit $status; }}')
+        if exit_status == self._CONFLICT:
+            raise InventoryChanged(path)
+        if exit_status != 0:
+            raise RuntimeError(error.strip() or f'Editing {path} failed with status {exit_status}')
+        mtime, size = output.strip().rsplit('\n', 1)[-1].split(':')
+        return int(mtime), int(size)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+_cache: Optional[InventoryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_inventory_cache() -> InventoryCache:
+    """
+    Return the process-wide inventory cache, creating it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = InventoryCache()
+        return _cache
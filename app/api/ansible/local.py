@@ -0,0 +1,157 @@
+import contextlib
+import os
+import shutil
+import signal
+import stat
+import subprocess
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from app.metrics import track_outbound
+from .results import JSONL_CALLBACK_ENV
+
+EXECUTION_BACKENDS = ('ssh', 'local')
+
+
+def _private_dir(path: str) -> None:
+    """
+    Create `path` if missing and make sure only the current user can reach it.
+
+    Raises:
+        PermissionError: When it is a symlink or belongs to another user, whose sockets
+            could then be planted or hijacked.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    attr = os.lstat(path)
+    if not stat.S_ISDIR(attr.st_mode) or attr.st_uid != os.getuid():
+        raise PermissionError(f'{path} must be a directory owned by the application user')
+    if stat.S_IMODE(attr.st_mode) != 0o700:
+        os.chmod(path, 0o700)
+
+
+class LocalExecutor:
+    """
+    Runs ansible-playbook as a subprocess of the application host, for the 'local'
+    execution backend, instead of over SSH on a control host.
+
+    At most `max_processes` playbooks run at once, background and synchronous runs
+    together. Each run gets its own temporary directory for Ansible's local temp files
+    and retry files, so concurrent runs do not share state. SSH control sockets live in
+    ~/.ansible/cp, private to the application user and kept across runs, so a master left
+    by ControlPersist is reused by the next run to the same host instead of being
+    orphaned when the run's directory goes.
+    """
+
+    def __init__(self, playbook_dir: str, inventory_path: str, max_processes: int) -> None:
+        self.playbook_dir = playbook_dir
+        self.inventory_path = inventory_path
+        self.max_processes = max_processes
+        self._slots = threading.BoundedSemaphore(max_processes)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.control_path_dir = os.path.join(os.path.expanduser('~'), '.ansible', 'cp')
+
+    def environment(self, workdir: str, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        callback_key, _, callback_value = JSONL_CALLBACK_ENV.partition('=')
+        env = dict(os.environ)
+        env.update({
+            'PYTHONUNBUFFERED': '1',
+            callback_key: callback_value,
+            'ANSIBLE_LOCAL_TEMP': os.path.join(workdir, 'tmp'),
+            'ANSIBLE_SSH_CONTROL_PATH_DIR': self.control_path_dir,
+            'ANSIBLE_RETRY_FILES_ENABLED': 'False',
+        })
+        env.update(extra or {})
+        return env
+
+    @contextlib.contextmanager
+    def process(self, args: List[str], env: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None) -> Iterator[subprocess.Popen]:
+        """
+        Start ansible-playbook with `args` (everything after the program name) and the
+        additional environment `env` once a process slot is free, stdout and stderr
+        merged into `process.stdout`. The process leads its own process group, which is
+        killed if still running when the block exits, and its directory is removed.
+
+        Raises:
+            TimeoutError: When no process slot freed up within `timeout` seconds.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f'All {self.max_processes} local playbook processes are busy')
+        try:
+            _private_dir(self.control_path_dir)
+            workdir = tempfile.mkdtemp(prefix='ansible-run-')
+            with self._lock:
+                self.running += 1
+            try:
+                process = subprocess.Popen(['ansible-playbook', '-i', self.inventory_path] + args,
+                                           cwd=self.playbook_dir, env=self.environment(workdir, env),
+                                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           start_new_session=True)
+                try:
+                    yield process
+                finally:
+                    if process.poll() is None:
+                        os.killpg(process.pid, signal.SIGKILL)
+                    process.wait()
+                    process.stdout.close()
+            finally:
+                with self._lock:
+                    self.running -= 1
+                shutil.rmtree(workdir, ignore_errors=True)
+        finally:
+            self._slots.release()
+
+    def run(self, args: List[str], env: Optional[Dict[str, str]], on_line: Callable[[str], None],
+            timeout: Optional[float] = None) -> int:
+        """
+        Run a playbook to completion, passing each output line to `on_line` as it is read,
+        and return its exit status. `timeout` bounds the wait for a process slot.
+        """
+        with track_outbound('ansible', 'local') as call, self.process(args, env, timeout) as process:
+            for line in process.stdout:
+                on_line(line.decode(errors='replace').rstrip('\n'))
+            exit_status = process.wait()
+            if exit_status != 0:
+                call.outcome = 'error'
+            return exit_status
+
+    def stats(self) -> Dict[str, Any]:
+        return {'running': self.running, 'max_processes': self.max_processes}
+
+
+_executor: Optional[LocalExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def execution_backend(config: Any) -> str:
+    """
+    Return ANSIBLE_EXECUTION_BACKEND.
+
+    Raises:
+        ValueError: When it is not one of EXECUTION_BACKENDS.
+    """
+    backend = config['ANSIBLE_EXECUTION_BACKEND']
+    if backend not in EXECUTION_BACKENDS:
+        raise ValueError(f'ANSIBLE_EXECUTION_BACKEND must be one of {", ".join(EXECUTION_BACKENDS)}, not {backend!r}')
+    return backend
+
+
+def get_local_executor(config: Any) -> LocalExecutor:
+    """
+    Return the process-wide local executor, creating it on first use.
+
+    Raises:
+        ValueError: When LOCAL_PLAYBOOKS_DIR is not a directory or ANSIBLE_LOCAL_INVENTORY_PATH
+            does not exist.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            playbook_dir, inventory_path = config['LOCAL_PLAYBOOKS_DIR'], config['ANSIBLE_LOCAL_INVENTORY_PATH']
+            if not playbook_dir or not os.path.isdir(playbook_dir):
+                raise ValueError('The local backend needs LOCAL_PLAYBOOKS_DIR set to a directory')
+            if not inventory_path or not os.path.exists(inventory_path):
+                raise ValueError('The local backend needs ANSIBLE_LOCAL_INVENTORY_PATH set to an existing inventory')
+            _executor = LocalExecutor(playbook_dir, inventory_path, config['ANSIBLE_LOCAL_MAX_PROCESSES'])
+        return _executor
@@ -0,0 +1,50 @@
+from typing import Any, Dict, List, Optional
+
+# Settings of each preset, as the ANSIBLE_* environment variables equivalent to ansible.cfg
+# keys. 'fast' trades the ordering guarantees of the linear strategy for throughput.
+PROFILES: Dict[str, Dict[str, str]] = {
+    'fast': {
+        'ANSIBLE_PIPELINING': 'True',
+        'ANSIBLE_STRATEGY': 'free',
+        'ANSIBLE_SSH_ARGS': '-o ControlMaster=auto -o ControlPersist=300s',
+        'ANSIBLE_TIMEOUT': '10',
+    },
+    'safe': {
+        'ANSIBLE_PIPELINING': 'False',
+        'ANSIBLE_STRATEGY': 'linear',
+        'ANSIBLE_SSH_ARGS': '-o ControlMaster=auto -o ControlPersist=60s',
+        'ANSIBLE_TIMEOUT': '30',
+    },
+}
+
+
+def _forks(config: Any, profile: str) -> int:
+    return config['ANSIBLE_FAST_FORKS'] if profile == 'fast' else config['ANSIBLE_SAFE_FORKS']
+
+
+def profile_environment(config: Any, profile: Optional[str] = None, forks: Optional[Any] = None) -> Dict[str, str]:
+    """
+    Environment configuring ansible-playbook for a run with the `profile` preset,
+    ANSIBLE_DEFAULT_PROFILE when None.
+
+    Args:
+        config: The application configuration.
+        profile: 'fast' or 'safe'.
+        forks: Overrides the fork count of the profile, up to ANSIBLE_MAX_FORKS.
+
+    Raises:
+        ValueError: On an unknown profile or an invalid fork count.
+    """
+    profile = profile or config['ANSIBLE_DEFAULT_PROFILE']
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown profile {profile}, expected one of {", ".join(sorted(PROFILES))}')
+    if forks is None:
+        forks = _forks(config, profile)
+    elif isinstance(forks, bool) or not isinstance(forks, int) or not 1 <= forks <= config['ANSIBLE_MAX_FORKS']:
+        raise ValueError(f'forks must be an integer between 1 and {config["ANSIBLE_MAX_FORKS"]}')
+    return dict(PROFILES[profile], ANSIBLE_FORKS=str(forks))
+
+
+def list_profiles(config: Any) -> List[Dict[str, Any]]:
+    return [{'name': name, 'default': name == config['ANSIBLE_DEFAULT_PROFILE'],
+             'settings': profile_environment(config, name)} for name in sorted(PROFILES)]
@@ -0,0 +1,255 @@
+import datetime
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+import pymongo
+from .facts import GATHER_ACTIONS, GATHER_TASKS
+
+# Environment making ansible-playbook print one JSON event per line
+JSONL_CALLBACK_ENV = 'ANSIBLE_STDOUT_CALLBACK=ansible.posix.jsonl'
+
+_RUNNER_STATUSES = {
+    'v2_runner_on_ok': 'ok',
+    'v2_runner_on_failed': 'failed',
+    'v2_runner_on_unreachable': 'unreachable',
+    'v2_runner_on_skipped': 'skipped',
+}
+
+# Failure messages are truncated to keep result documents small
+_MAX_MESSAGE = 2000
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_time_arg(value: Optional[str], default: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+    """Parse an ISO 8601 query argument, `default` when missing. Raises ValueError when malformed."""
+    if not value:
+        return default
+    parsed = _parse_time(value)
+    if parsed is None:
+        raise ValueError(f'Invalid date: {value}')
+    return parsed
+
+
+class ResultRecorder:
+    """
+    Turns the JSON lines of one run into per-host task results.
+
+    Each line fed is rendered back into the usual human readable form for the run log,
+    while the results are written to the store in batches of `batch_size`, or at least
+    every `flush_interval` seconds, as the run progresses.
+    """
+
+    def __init__(self, store: Optional['PlaybookResultStore'], run_id: str, playbook: str,
+                 control_host: Optional[str], batch_size: int = 200, flush_interval: float = 2.0) -> None:
+        self.store = store
+        self.run_id = run_id
+        self.playbook = playbook
+        self.control_host = control_host
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.error: Optional[str] = None
+        self.stats: Dict[str, Any] = {}
+        self.gathered: Set[str] = set()  # Hosts whose facts were gathered rather than read from the cache
+        self._play: Optional[str] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._flushed_at = time.monotonic()
+
+    def feed(self, line: str) -> Optional[str]:
+        """
+        Record one output line.
+
+        Returns:
+            str: The line to show in the run log, None for events that show nothing.
+        """
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return line
+        if not isinstance(event, dict) or '_event' not in event:
+            return line
+        display = self._handle(event)
+        if len(self._batch) >= self.batch_size or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+        return display
+
+    def _handle(self, event: Dict[str, Any]) -> Optional[str]:
+        name = event['_event']
+        if name == 'v2_playbook_on_play_start':
+            self._play = (event.get('play') or {}).get('name')
+            return f'PLAY [{self._play or ""}] ***'
+        if name == 'v2_playbook_on_task_start':
+            return f'TASK [{(event.get("task") or {}).get("name", "")}] ***'
+        if name == 'v2_playbook_on_stats':
+            self.stats = event.get('stats') or {}
+            recap = ['PLAY RECAP ***']
+            for host, counts in sorted(self.stats.items()):
+                recap.append(f'{host} : ' + ' '.join(f'{key}={value}' for key, value in sorted(counts.items())))
+            return '\n'.join(recap)
+        if name not in _RUNNER_STATUSES:
+            return None
+
+        task = event.get('task') or {}
+        duration = task.get('duration') or {}
+        started_at, ended_at = _parse_time(duration.get('start')), _parse_time(duration.get('end'))
+        timestamp = ended_at or _parse_time(event.get('_timestamp')) or datetime.datetime.utcnow()
+        lines = []
+        for host, result in (event.get('hosts') or {}).items():
+            result = result if isinstance(result, dict) else {}
+            status = _RUNNER_STATUSES[name]
+            changed = bool(result.get('changed'))
+            if status == 'ok' and changed:
+                status = 'changed'
+            message = result.get('msg') or result.get('stderr') or ''
+            if task.get('name') in GATHER_TASKS or result.get('action') in GATHER_ACTIONS:
+                self.gathered.add(host)
+            self._batch.append({
+                'run_id': self.run_id,
+                'playbook': self.playbook,
+                'control_host': self.control_host,
+                'play': self._play,
+                'task': task.get('name'),
+                'task_id': task.get('id'),
+                'host': host,
+                'status': status,
+                'changed': changed,
+                'action': result.get('action'),
+                'message': str(message)[:_MAX_MESSAGE],
+                'started_at': started_at,
+                'ended_at': ended_at,
+                'duration': (ended_at - started_at).total_seconds() if started_at and ended_at else None,
+                'timestamp': timestamp,
+            })
+            suffix = f' => {message}' if status in ('failed', 'unreachable') and message else ''
+            lines.append(f'{status}: [{host}]{suffix}')
+        return '\n'.join(lines) or None
+
+    def flush(self) -> None:
+        batch, self._batch = self._batch, []
+        self._flushed_at = time.monotonic()
+        if not batch or self.store is None:
+            return
+        try:
+            self.store.insert(batch)
+            self.recorded += len(batch)
+        except Exception as e:
+            # Losing results must not fail the run itself
+            self.error = f'Could not store {len(batch)} results: {e}'
+
+
+class PlaybookResultStore:
+    """
+    Per-host task results of playbook runs, in a Mongo collection indexed on run id,
+    host, playbook, status and timestamp.
+    """
+
+    INDEXES = ['run_id', 'host', 'playbook', 'status', 'timestamp']
+
+    def __init__(self, collection: Any, batch_size: int, flush_interval: float) -> None:
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._indexed = False
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self) -> None:
+        with self._lock:
+            if self._indexed:
+                return
+            self.collection.create_indexes([pymongo.IndexModel([(field, pymongo.ASCENDING)])
+                                            for field in self.INDEXES[:-1]]
+                                           + [pymongo.IndexModel([('timestamp', pymongo.DESCENDING)])])
+            self._indexed = True
+
+    def recorder(self, run_id: str, playbook: str, control_host: Optional[str]) -> ResultRecorder:
+        return ResultRecorder(self, run_id, playbook, control_host, self.batch_size, self.flush_interval)
+
+    def insert(self, documents: List[Dict[str, Any]]) -> None:
+        self.ensure_indexes()
+        self.collection.insert_many(documents, ordered=False)
+
+    @staticmethod
+    def _match(filters: Dict[str, Any], since: Optional[datetime.datetime],
+               until: Optional[datetime.datetime]) -> Dict[str, Any]:
+        match = {key: value for key, value in filters.items() if value}
+        if since or until:
+            match['timestamp'] = {}
+            if since:
+                match['timestamp']['$gte'] = since
+            if until:
+                match['timestamp']['$lt'] = until
+        return match
+
+    def query(self, filters: Dict[str, Any], since: Optional[datetime.datetime] = None,
+              until: Optional[datetime.datetime] = None, page: int = 1, per_page: int = 50) -> Dict[str, Any]:
+        """
+        Page through results, newest first.
+
+        Args:
+            filters: Exact match on run_id, host, playbook, status or task.
+            since: Only results at or after this time.
+            until: Only results before this time.
+            page: 1-based page number.
+            per_page: Page size.
+        """
+        match = self._match(filters, since, until)
+        cursor = (self.collection.find(match, {'_id': 0}).sort('timestamp', pymongo.DESCENDING)
+                  .skip((page - 1) * per_page).limit(per_page))
+        return {'items': list(cursor), 'page': page, 'per_page': per_page,
+                'total': self.collection.count_documents(match)}
+
+    def failures_by_host(self, since: datetime.datetime, playbook: Optional[str] = None,
+                         limit: int = 50) -> List[Dict[str, Any]]:
+        """Hosts with the most failed or unreachable tasks since `since`."""
+        match = self._match({'playbook': playbook}, since, None)
+        match['status'] = {'$in': ['failed', 'unreachable']}
+        return list(self.collection.aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$host', 'failures': {'$sum': 1}, 'tasks': {'$addToSet': '$task'},
+                        'last_failure': {'$max': '$timestamp'}}},
+            {'$sort': {'failures': -1}},
+            {'$limit': limit},
+            {'$project': {'_id': 0, 'host': '$_id', 'failures': 1, 'tasks': 1, 'last_failure': 1}},
+        ]))
+
+    def slowest_tasks(self, since: datetime.datetime, playbook: Optional[str] = None,
+                      limit: int = 20) -> List[Dict[str, Any]]:
+        """Tasks with the highest average duration since `since`, over every host they ran on."""
+        match = self._match({'playbook': playbook}, since, None)
+        match['duration'] = {'$ne': None}
+        return list(self.collection.aggregate([
+            {'$match': match},
+            {'$group': {'_id': {'playbook': '$playbook', 'task': '$task'}, 'avg_duration': {'$avg': '$duration'},
+                        'max_duration': {'$max': '$duration'}, 'count': {'$sum': 1}}},
+            {'$sort': {'avg_duration': -1}},
+            {'$limit': limit},
+            {'$project': {'_id': 0, 'playbook': '$_id.playbook', 'task': '$_id.task', 'avg_duration': 1,
+                          'max_duration': 1, 'count': 1}},
+        ]))
+
+
+def get_playbook_result_store(app: Any, collection: Any) -> PlaybookResultStore:
+    """
+    Factory function to create a PlaybookResultStore.
+
+    Args:
+        app: The application holding the ANSIBLE_RESULTS_* configuration.
+        collection: The Mongo collection results are written to.
+
+    Returns:
+        PlaybookResultStore: A new instance of PlaybookResultStore.
+    """
+    return PlaybookResultStore(collection, app.config['ANSIBLE_RESULTS_BATCH_SIZE'],
+                               app.config['ANSIBLE_RESULTS_FLUSH_INTERVAL'])
@@ -0,0 +1,261 @@
+import codecs
+import json
+import os
+import shlex
+import signal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.jobs import JobManager, ProcessJob, pipe_reader, pump_output
+from .facts import get_fact_cache
+from .local import LocalExecutor, execution_backend, get_local_executor
+from .profiles import profile_environment
+from .results import JSONL_CALLBACK_ENV, PlaybookResultStore, ResultRecorder
+from .scheduler import ControlHost, get_control_host_scheduler
+
+# Seconds between two checks for cancellation while waiting for output
+_POLL_INTERVAL = 0.5
+
+
+def playbook_args(playbook_name: str, options: Dict[str, Any]) -> List[str]:
+    """ansible-playbook arguments for a playbook and the run options, inventory excluded."""
+    args = [playbook_name]
+    if options.get('limit'):
+        args += ['--limit', str(options['limit'])]
+    if options.get('tags'):
+        args += ['--tags', ','.join(options['tags']) if isinstance(options['tags'], list) else str(options['tags'])]
+    if options.get('extra_vars'):
+        args += ['--extra-vars', json.dumps(options['extra_vars'])]
+    if options.get('check'):
+        args.append('--check')
+    return args
+
+
+def playbook_command(playbook_dir: str, inventory_path: str, playbook_name: str, options: Dict[str, Any],
+                     env: Optional[Dict[str, str]] = None) -> str:
+    """
+    Build the shell command running a playbook on the control host, with the additional
+    environment `env`.
+
+    The run gets its own session: the shell leading it prints its PID, which is also the
+    process group ID, then execs ansible-playbook. Cancelling signals that whole group, so
+    the forks go with ansible-playbook. Output is one JSON event per line, for the
+    per-host results.
+    """
+    args = ['ansible-playbook', '-i', inventory_path] + playbook_args(playbook_name, options)
+    command = ' '.join([f'{key}={shlex.quote(value)}' for key, value in (env or {}).items()]
+                       + [shlex.quote(arg) for arg in args])
+    run = f'echo $$ && exec env PYTHONUNBUFFERED=1 {JSONL_CALLBACK_ENV} {command}'
+    return f'cd {shlex.quote(playbook_dir)} && exec setsid -w sh -c {shlex.quote(run)}'
+
+
+class PlaybookJob(ProcessJob):
+    """
+    One ansible-playbook run, on a control host or on the application host with the
+    'local' backend.
+
+    Output is read as it is produced, stdout and stderr merged. The JSON events are
+    recorded as per-host results and rendered as text into a bounded log buffer that
+    clients can poll or follow. Cancelling sends SIGINT to ansible-playbook, then
+    SIGKILL if it did not stop within the grace period.
+    """
+
+    kind = 'playbook'
+
+    def __init__(self, runner: 'PlaybookRunner', playbook_name: str, options: Dict[str, Any],
+                 env: Dict[str, str]) -> None:
+        super().__init__(dict(options, playbook=playbook_name), runner.app.config['ANSIBLE_RUN_LOG_MAX_BYTES'])
+        self.runner = runner
+        self.playbook_name = playbook_name
+        self.env = env
+        self.pid: Optional[int] = None
+        self.host: Optional[ControlHost] = None
+        self.recorder: Optional[ResultRecorder] = None
+        self._partial = ''
+
+    def run(self) -> bool:
+        try:
+            with self.runner.app.app_context():
+                self.exit_code = self._execute()
+        finally:
+            self.log.close()
+        if self.exit_code is None:
+            return False
+        if self.exit_code != 0 and not self.cancel_requested.is_set():
+            self.error = f'ansible-playbook exited with status {self.exit_code}'
+        return self.exit_code == 0
+
+    def _start_recording(self, control_host: str) -> None:
+        results = self.runner.results
+        self.recorder = (results.recorder(self.id, self.playbook_name, control_host) if results is not None
+                         else ResultRecorder(None, self.id, self.playbook_name, control_host))
+
+    def _stop_recording(self) -> None:
+        self.runner.facts.record(self.recorder.control_host, self.recorder.stats, self.recorder.gathered)
+        self.recorder.flush()
+        if self.recorder.error:
+            self.log.write(f'\n[results] {self.recorder.error}\n')
+
+    def _execute(self) -> Optional[int]:
+        if self.runner.local is not None:
+            return self._execute_local(self.runner.local)
+        config = self.runner.app.config
+        command = playbook_command(config['REMOTE_PLAYBOOKS_DIR'], config['INVENTORY_PATH'], self.playbook_name,
+                                   self.params, self.env)
+        scheduler = self.runner.scheduler
+        while self.host is None:
+            if self.cancel_requested.is_set():
+                return None
+            try:
+                self.host = scheduler.acquire(_POLL_INTERVAL)
+            except TimeoutError:
+                continue
+        try:
+            scheduler.sync(self.host)
+            self._start_recording(self.host.hostname)
+            try:
+                return self._execute_on(command)
+            finally:
+                self._stop_recording()
+        finally:
+            scheduler.release(self.host)
+
+    def _execute_on(self, command: str) -> Optional[int]:
+        with self.host.connection() as ssh:
+            channel = ssh.open_channel()
+            try:
+                channel.set_combine_stderr(True)
+                channel.settimeout(_POLL_INTERVAL)
+                channel.exec_command(command)
+                return channel.recv_exit_status() if self._pump(channel.recv, self._signal) else None
+            finally:
+                channel.close()
+
+    def _execute_local(self, executor: LocalExecutor) -> Optional[int]:
+        self._start_recording('local')
+        try:
+            with executor.process(playbook_args(self.playbook_name, self.params), self.env) as process:
+                self.pid = process.pid
+
+                def send_signal(name: str) -> None:
+                    # Like Ctrl-C in a terminal, the signal goes to ansible-playbook and its forks
+                    os.killpg(process.pid, getattr(signal, f'SIG{name}'))
+
+                return process.wait() if self._pump(pipe_reader(process.stdout, _POLL_INTERVAL), send_signal) else None
+        finally:
+            self._stop_recording()
+
+    def _pump(self, recv: Callable[[int], bytes], send_signal: Callable[[str], None]) -> bool:
+        """
+        Copy the output read with `recv` into the log until EOF, handling cancellation.
+        The first line is the PID printed before exec; a cancel arriving earlier is held
+        until it is read.
+
+        Returns:
+            bool: True on EOF, False when the run was abandoned before ending.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        head: List[str] = []
+
+        def on_data(data: bytes) -> None:
+            text = decoder.decode(data)
+            if self.pid is None:
+                head.append(text)
+                if '\n' not in text:
+                    return
+                pid, text = ''.join(head).split('\n', 1)
+                self.pid = int(pid.strip()) if pid.strip().isdigit() else 0
+            self._write(text)
+
+        if not pump_output(recv, on_data, self.cancel_requested, send_signal,
+                           self.runner.app.config['ANSIBLE_RUN_CANCEL_GRACE'], lambda: self.pid is not None):
+            if self.pid is None:
+                self.log.write('\n[cancel] the run did not report its PID, it may still be running\n')
+            return False
+        self._write(decoder.decode(b'', final=True), final=True)
+        return True
+
+    def _write(self, text: str, final: bool = False) -> None:
+        # Events are parsed a whole line at a time, the partial last line waits for the next chunk
+        lines = (self._partial + text).split('\n')
+        self._partial = '' if final else lines.pop()
+        for line in lines:
+            if final and not line:
+                continue
+            display = self.recorder.feed(line)
+            if display is not None:
+                self.log.write(display + '\n')
+
+    def _signal(self, name: str) -> None:
+        if not self.pid:
+            return
+        try:
+            with self.host.connection() as ssh:
+                ssh.run(f'kill -{name} -- -{self.pid}')
+        except Exception as e:
+            self.log.write(f'\n[cancel] could not send SIG{name}: {e}\n')
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = super().to_dict()
+        data['host'] = self.host.hostname if self.host else ('local' if self.runner.local is not None else None)
+        data['results'] = self.recorder.recorded if self.recorder else 0
+        return data
+
+
+class PlaybookRunner:
+    """
+    Runs playbooks as background jobs, at most ANSIBLE_MAX_CONCURRENT_RUNS at a time on
+    each control host, or ANSIBLE_LOCAL_MAX_PROCESSES at a time on the application host
+    with the 'local' backend; further runs wait in the queue.
+    """
+
+    def __init__(self, app: Any, results: Optional[PlaybookResultStore] = None) -> None:
+        self.app = app
+        self.results = results
+        self.scheduler = get_control_host_scheduler(app)
+        self.facts = get_fact_cache(app.config)
+        self.local = get_local_executor(app.config) if execution_backend(app.config) == 'local' else None
+        capacity = self.local.max_processes if self.local is not None else self.scheduler.capacity
+        self.jobs = JobManager(max_concurrent=capacity,
+                               retention=app.config['ANSIBLE_RUN_RETENTION'], name='playbook')
+
+    def submit(self, playbook_name: str, options: Dict[str, Any]) -> Tuple[bool, Optional[Any], Optional[int]]:
+        """
+        Queue a playbook run.
+
+        Args:
+            playbook_name: Playbook file in REMOTE_PLAYBOOKS_DIR.
+            options: {'limit': str, 'tags': str or [str], 'extra_vars': dict, 'check': bool,
+                      'profile': 'fast' or 'safe', 'forks': int}
+
+        Returns:
+            tuple: (success, job data or error message, status_code)
+        """
+        if not playbook_name or '/' in playbook_name or playbook_name.startswith('.'):
+            return False, 'Invalid playbook name', 400
+        if options.get('extra_vars') is not None and not isinstance(options['extra_vars'], dict):
+            return False, 'extra_vars must be an object', 400
+        try:
+            env = dict(self.facts.environment(),
+                       **profile_environment(self.app.config, options.get('profile'), options.get('forks')))
+        except ValueError as e:
+            return False, str(e), 400
+        allowed = {key: options[key] for key in ('limit', 'tags', 'extra_vars', 'check', 'profile', 'forks')
+                   if key in options}
+        job = self.jobs.submit(PlaybookJob(self, playbook_name, allowed, env))
+        return True, job.to_dict(), None
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in self.jobs.list()]
+
+
+def get_playbook_runner(app: Any, results: Optional[PlaybookResultStore] = None) -> PlaybookRunner:
+    """
+    Factory function to create a PlaybookRunner.
+
+    Args:
+        app: The application whose configuration and context the runs use.
+        results: Where the per-host results of the runs are stored.
+
+    Returns:
+        PlaybookRunner: A new instance of PlaybookRunner.
+    """
+    return PlaybookRunner(app, results)
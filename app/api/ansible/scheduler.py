@@ -0,0 +1,213 @@
+import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from app.ssh_connection import SSHConnection
+
+
+def parse_control_hosts(spec: Optional[str], default_host: str, default_port: int) -> List[Tuple[str, int]]:
+    """
+    Parse ANSIBLE_CONTROL_HOSTS, "host[:port],host[:port],...". The first host is the
+    primary, where playbooks and inventory are edited. Defaults to SSH_HOSTNAME alone.
+    """
+    hosts = []
+    for entry in (spec or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        hostname, _, port = entry.partition(':')
+        hosts.append((hostname, int(port) if port else default_port))
+    return hosts or [(default_host, default_port)]
+
+
+class ControlHost:
+    """An Ansible control host and the scheduling state kept about it."""
+
+    def __init__(self, hostname: str, port: int, primary: bool) -> None:
+        self.hostname = hostname
+        self.port = port
+        self.primary = primary
+        self.active_runs = 0
+        self.load: Optional[float] = None  # 1 minute load average per CPU
+        self.healthy = True
+        self.probed_at = 0.0
+        self.synced_fingerprint: Optional[str] = None
+        self.sync_lock = threading.Lock()
+
+    def connection(self) -> SSHConnection:
+        return SSHConnection(self.hostname, self.port)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'host': self.hostname,
+            'port': self.port,
+            'primary': self.primary,
+            'active_runs': self.active_runs,
+            'load_per_cpu': self.load,
+            'healthy': self.healthy,
+        }
+
+
+class ControlHostScheduler:
+    """
+    Places playbook runs on the least loaded healthy control host.
+
+    A host's score is its share of the per-host run cap in use plus its load average per
+    CPU, probed at most once per `probe_ttl` seconds. A host never carries more than
+    `max_runs_per_host` runs: when every healthy host is full, acquire() waits for a
+    slot. Before a run is placed on a secondary host, the playbook directory and
+    inventory are copied from the primary if they changed since the last copy.
+    """
+
+    def __init__(self, app: Any, hosts: List[Tuple[str, int]], max_runs_per_host: int, probe_ttl: float) -> None:
+        self.app = app
+        self.hosts = [ControlHost(hostname, port, index == 0) for index, (hostname, port) in enumerate(hosts)]
+        self.max_runs_per_host = max_runs_per_host
+        self.probe_ttl = probe_ttl
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._probe_lock = threading.Lock()
+
+    @property
+    def primary(self) -> ControlHost:
+        return self.hosts[0]
+
+    @property
+    def capacity(self) -> int:
+        return self.max_runs_per_host * len(self.hosts)
+
+    def _score(self, host: ControlHost) -> float:
+        return host.active_runs / self.max_runs_per_host + (host.load or 0.0)
+
+    def acquire(self, timeout: Optional[float] = None) -> ControlHost:
+        """
+        Reserve a run slot on the best host, release() it once the run is over.
+
+        Args:
+            timeout: Seconds to wait for a free slot, None to wait as long as it takes.
+
+        Raises:
+            TimeoutError: When every healthy host stays at its run cap for `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if len(self.hosts) > 1:
+                self._refresh_probes()
+            with self._lock:
+                candidates = [host for host in self.hosts
+                              if host.healthy and host.active_runs < self.max_runs_per_host]
+                if candidates:
+                    host = min(candidates, key=self._score)
+                    host.active_runs += 1
+                    return host
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError('Every control host is running its maximum number of playbooks')
+                # Wake up at least once per probe TTL, an unhealthy host may have recovered
+                self._slot_freed.wait(self.probe_ttl if remaining is None else min(remaining, self.probe_ttl))
+
+    def release(self, host: ControlHost) -> None:
+        with self._lock:
+            host.active_runs -= 1
+            self._slot_freed.notify()
+
+    def _refresh_probes(self) -> None:
+        """Probe the hosts whose load is older than the TTL, one refresh at a time."""
+        if not self._stale_hosts():
+            return
+        with self._probe_lock:
+            # Callers that queued behind a refresh find the hosts probed already
+            stale = self._stale_hosts()
+            if not stale:
+                return
+            with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+                list(executor.map(self._probe, stale))
+        with self._lock:
+            self._slot_freed.notify_all()
+
+    def _stale_hosts(self) -> List[ControlHost]:
+        now = time.monotonic()
+        return [host for host in self.hosts if now - host.probed_at > self.probe_ttl]
+
+    def _probe(self, host: ControlHost) -> None:
+        try:
+            with self.app.app_context(), host.connection() as ssh:
+                exit_status, output, error = ssh.run('cat /proc/loadavg && nproc')
+            loadavg, cpus = output.split('\n')[:2]
+            host.load = round(float(loadavg.split()[0]) / max(1, int(cpus)), 3)
+            host.healthy = exit_status == 0
+        except Exception:
+            host.healthy = False
+        host.probed_at = time.monotonic()
+
+    def _fingerprint(self, paths: List[str]) -> str:
+        quoted = ' '.join(shlex.quote(path) for path in paths)
+        with self.primary.connection() as ssh:
+            exit_status, output, error = ssh.run(
+                f"find {quoted} -type f -printf '%p %s %T@\\n' 2>/dev/null | sort | sha256sum")
+        return output.split(' ')[0]
+
+    def sync(self, host: ControlHost) -> bool:
+        """
+        Copy the playbook directory and inventory from the primary to `host` when their
+        fingerprint (path, size and mtime of every file) changed since the last copy. The
+        copy is streamed as a tar archive from one host to the other, through this process.
+
+        Returns:
+            bool: True when files were copied.
+        """
+        if host.primary:
+            return False
+        paths = [self.app.config['REMOTE_PLAYBOOKS_DIR'], self.app.config['INVENTORY_PATH']]
+        with host.sync_lock:
+            fingerprint = self._fingerprint(paths)
+            if fingerprint == host.synced_fingerprint:
+                return False
+            relative = ' '.join(shlex.quote(path.lstrip('/')) for path in paths)
+            with self.primary.connection() as source, host.connection() as target:
+                reader, writer = source.open_channel(), target.open_channel()
+                try:
+                    reader.exec_command(f'tar -C / -cf - {relative}')
+                    writer.exec_command('tar -C / -xf -')
+                    while True:
+                        data = reader.recv(65536)
+                        if not data:
+                            break
+                        writer.sendall(data)
+                    writer.shutdown_write()
+                    if reader.recv_exit_status() != 0 or writer.recv_exit_status() != 0:
+                        raise RuntimeError(f'Copying playbooks to {host.hostname} failed')
+                finally:
+                    reader.close()
+                    writer.close()
+            host.synced_fingerprint = fingerprint
+            return True
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [host.to_dict() for host in self.hosts]
+
+
+_scheduler: Optional[ControlHostScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_control_host_scheduler(app: Any) -> ControlHostScheduler:
+    """
+    Return the process-wide control host scheduler, creating it on first use.
+
+    Args:
+        app: The application holding the ANSIBLE_CONTROL_HOSTS configuration.
+
+    Returns:
+        ControlHostScheduler: The shared scheduler.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            hosts = parse_control_hosts(app.config['ANSIBLE_CONTROL_HOSTS'], app.config['SSH_HOSTNAME'],
+                                        int(app.config['SSH_PORT']))
+            _scheduler = ControlHostScheduler(app, hosts, app.config['ANSIBLE_MAX_CONCURRENT_RUNS'],
+                                              app.config['ANSIBLE_LOAD_PROBE_TTL'])
+        return _scheduler
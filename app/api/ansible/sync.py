@@ -0,0 +1,180 @@
+import hashlib
+import os
+import posixpath
+import shlex
+import tarfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from app.metrics import track_outbound
+
+# Read size when hashing local files
+_CHUNK_SIZE = 65536
+
+# Local files skipped by the sync
+_IGNORED_NAMES = ('.git', '__pycache__', '.DS_Store')
+
+
+class _ChannelWriter:
+    """File-like adapter so tarfile can stream straight into an SSH channel."""
+
+    def __init__(self, channel: Any) -> None:
+        self.channel = channel
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self.channel.sendall(data)
+        self.bytes += len(data)
+        return len(data)
+
+
+class LocalManifest:
+    """
+    sha256 of every file under a local directory, keyed by POSIX relative path.
+
+    Digests are cached by (path, mtime, size), so only the files touched since the
+    previous sync are read and hashed again.
+    """
+
+    def __init__(self) -> None:
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def _digest(self, path: str, stat: os.stat_result) -> str:
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as local_file:
+            for block in iter(lambda: local_file.read(_CHUNK_SIZE), b''):
+                sha256.update(block)
+        digest = sha256.hexdigest()
+        with self._lock:
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def scan(self, local_dir: str) -> Dict[str, str]:
+        manifest = {}
+        for root, dirs, files in os.walk(local_dir):
+            dirs[:] = [name for name in dirs if name not in _IGNORED_NAMES]
+            for name in files:
+                if name in _IGNORED_NAMES:
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, local_dir).replace(os.sep, '/')
+                manifest[relative] = self._digest(path, os.stat(path))
+        return manifest
+
+
+def remote_manifest(ssh_connection: Any, remote_dir: str) -> Dict[str, str]:
+    """sha256 of every file under `remote_dir` on the control host, in one command."""
+    quoted = shlex.quote(remote_dir)
+    exit_status, output, error = ssh_connection.run(
+        f"mkdir -p {quoted} && cd {quoted} && "
+        f"find . -path './.sync.*' -prune -o -type f -print0 | xargs -0 -r sha256sum")
+    if exit_status != 0:
+        raise RuntimeError(f'Could not checksum {remote_dir}: {error.strip()}')
+    manifest = {}
+    for line in output.splitlines():
+        # Names with unusual characters are escaped by sha256sum, they never match and get uploaded
+        digest, _, path = line.partition('  ')
+        if path.startswith('./'):
+            manifest[path[2:]] = digest
+    return manifest
+
+
+def apply_script(remote_dir: str, deleted: List[str]) -> str:
+    """
+    Shell script unpacking the tar stream read on stdin into a staging directory next to
+    the playbooks, then renaming each file into place. rename(2) is atomic, so a running
+    playbook sees either the old or the new version of a file, never a partial one.
+    """
+    target = shlex.quote(remote_dir)
+    script = [
+        'set -e',
+        f'mkdir -p {target}',
+        f'staging=$(mktemp -d {target}/.sync.XXXXXX)',
+        'trap \'rm -rf "$staging"\' EXIT',
+        'tar -xzf - -C "$staging"',
+        'cd "$staging"',
+        f'find . -type f | while IFS= read -r f; do mkdir -p {target}/"${{f%/*}}"; mv -f "$f" {target}/"$f"; done',
+    ]
+    if deleted:
+        script.append(f'cd {target} && rm -f -- ' + ' '.join(shlex.quote(path) for path in deleted))
+    return '\n'.join(script)
+
+
+class PlaybookSync:
+    """
+    Delta sync of LOCAL_PLAYBOOKS_DIR (playbooks, roles, vars) to the control host.
+
+    Local and remote checksums are compared, and only the changed files are sent, as a
+    single gzipped tar stream over one exec channel, then swapped in atomically.
+    """
+
+    def __init__(self) -> None:
+        self.manifest = LocalManifest()
+
+    def plan(self, local_dir: str, remote: Dict[str, str], prune: bool) -> Tuple[List[str], List[str], int]:
+        """Return (files to upload, files to delete, number of files already up to date)."""
+        local = self.manifest.scan(local_dir)
+        changed = sorted(path for path, digest in local.items() if remote.get(path) != digest)
+        deleted = sorted(set(remote) - set(local)) if prune else []
+        return changed, deleted, len(local) - len(changed)
+
+    def sync(self, ssh_connection: Any, local_dir: str, remote_dir: str, prune: bool = False) -> Dict[str, Any]:
+        """
+        Bring `remote_dir` in line with `local_dir`.
+
+        Args:
+            ssh_connection: A connected SSHConnection to the control host.
+            local_dir: Directory on the application host.
+            remote_dir: Directory on the control host.
+            prune: Also delete the remote files that no longer exist locally.
+
+        Returns:
+            dict: {'uploaded': [paths], 'deleted': [paths], 'unchanged': int, 'bytes': int}
+        """
+        remote = remote_manifest(ssh_connection, remote_dir)
+        changed, deleted, unchanged = self.plan(local_dir, remote, prune)
+        result = {'uploaded': changed, 'deleted': deleted, 'unchanged': unchanged, 'bytes': 0}
+        if not changed and not deleted:
+            return result
+
+        with track_outbound('ssh', 'sync') as call:
+            channel = ssh_connection.open_channel()
+            try:
+                channel.exec_command(apply_script(remote_dir, deleted))
+                writer = _ChannelWriter(channel)
+                with tarfile.open(fileobj=writer, mode='w|gz') as archive:
+                    for path in changed:
+                        archive.add(os.path.join(local_dir, *path.split('/')), arcname=path, recursive=False)
+                channel.shutdown_write()
+                error = channel.makefile_stderr('rb').read().decode(errors='replace')
+                exit_status = channel.recv_exit_status()
+            finally:
+                channel.close()
+            if exit_status != 0:
+                call.outcome = 'error'
+                raise RuntimeError(f'Applying the sync failed: {error.strip()}')
+        result['bytes'] = writer.bytes
+        return result
+
+
+_sync: Optional[PlaybookSync] = None
+_sync_lock = threading.Lock()
+
+
+def get_playbook_sync() -> PlaybookSync:
+    """
+    Return the process-wide playbook sync, whose digest cache outlives requests.
+    """
+    global _sync
+    with _sync_lock:
+        if _sync is None:
+            _sync = PlaybookSync()
+        return _sync
+
+
+def remote_paths(remote_dir: str, paths: List[str]) -> List[str]:
+    return [posixpath.join(remote_dir, path) for path in paths]
@@ -1,55 +1,383 @@
 # app/api/prometheus/dashboardProxmox.py
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
 from flask import jsonify, current_app
+from .downsample import downsample_result
+from .range_cache import PrometheusCache
+from .live import LiveMetrics
+from app.metrics import track_outbound
+
+# Label used to tag the series of each sub-query inside a merged query
+PANEL_KEY_LABEL = 'dashboard_panel'
+
+# Dashboard panels: a single PromQL template, or named sub-query templates merged into one
+# request. {filters} marks where the label matchers of the request are inserted.
+PANELS: Dict[str, Union[str, Dict[str, str]]] = {
+    'cpu': 'rate(node_cpu_seconds_total{filters}[1m])',
+    'memory': {
+        'total': 'node_memory_MemTotal_bytes{filters}',
+        'free': 'node_memory_MemFree_bytes{filters}',
+        'available': 'node_memory_MemAvailable_bytes{filters}',
+        'buffers': 'node_memory_Buffers_bytes{filters}',
+        'cached': 'node_memory_Cached_bytes{filters}'
+    },
+    'disk': {
+        'size': 'node_filesystem_size_bytes{filters}',
+        'free': 'node_filesystem_free_bytes{filters}',
+        'available': 'node_filesystem_avail_bytes{filters}',
+        'used': 'node_filesystem_size_bytes{filters} - node_filesystem_free_bytes{filters}'
+    },
+    'network': {
+        'receive_bytes': 'rate(node_network_receive_bytes_total{filters}[1m])',
+        'transmit_bytes': 'rate(node_network_transmit_bytes_total{filters}[1m])',
+        'receive_errors': 'rate(node_network_receive_errs_total{filters}[1m])',
+        'transmit_errors': 'rate(node_network_transmit_errs_total{filters}[1m])'
+    },
+    'system_load': 'node_load1{filters}',
+    'uptime': 'node_time_seconds{filters} - node_boot_time_seconds{filters}',
+}
+
+# Aggregation operator of each panel and the labels kept by each grouping level
+PANEL_GROUPS: Dict[str, Tuple[str, Dict[str, List[str]]]] = {
+    'cpu': ('sum', {'host': ['instance'], 'mode': ['mode'], 'host_mode': ['instance', 'mode'], 'cluster': []}),
+    'memory': ('sum', {'host': ['instance'], 'cluster': []}),
+    'disk': ('sum', {'host': ['instance'], 'mountpoint': ['instance', 'mountpoint'], 'cluster': []}),
+    'network': ('sum', {'host': ['instance'], 'device': ['instance', 'device'], 'cluster': []}),
+    'system_load': ('avg', {'host': ['instance'], 'cluster': []}),
+    'uptime': ('min', {'host': ['instance'], 'cluster': []}),
+}
+
+# Label matchers of a request: ((label, (value, ...)), ...), hashable so it can key caches
+Filters = Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+_LABEL_NAME = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+_session = requests.Session()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_cache: Optional[PrometheusCache] = None
+_live: Optional[LiveMetrics] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Lazily create the pool running panel queries concurrently, and size the session's
+    connection pool to match it.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = current_app.config['PROMETHEUS_MAX_WORKERS']
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prometheus')
+        return _executor
+
+
+def get_cache() -> PrometheusCache:
+    """
+    Lazily create the query cache shared by every dashboard user of this process.
+    """
+    global _cache
+    with _executor_lock:
+        if _cache is None:
+            config = current_app.config
+            _cache = PrometheusCache(max_bytes=config['PROMETHEUS_CACHE_MAX_BYTES'],
+                                     chunk_steps=config['PROMETHEUS_CACHE_CHUNK_STEPS'],
+                                     settle_delay=config['PROMETHEUS_CACHE_SETTLE_DELAY'],
+                                     instant_align=config['PROMETHEUS_INSTANT_ALIGN'])
+        return _cache
+
+
+def _fetch(prometheus_url: str, path: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    with track_outbound('prometheus', path.rsplit('/', 1)[-1]):
+        response = _session.get(f"{prometheus_url}{path}", params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def _query(cache: PrometheusCache, prometheus_url: str, query: str, timeout: float) -> Dict[str, Any]:
+    def fetch(at: Optional[float]) -> Dict[str, Any]:
+        params = {'query': query} if at is None else {'query': query, 'time': at}
+        return _fetch(prometheus_url, '/api/v1/query', params, timeout)
+    return cache.instant(fetch, (prometheus_url, query), time.time())
+
 
 def query_prometheus(query):
-    url = f"{current_app.config['PROMETHEUS_URL']}/api/v1/query"
-    response = requests.get(url, params={'query': query})
-    response.raise_for_status()
-    return response.json()
-
-def get_cpu_usage():
-    query = 'rate(node_cpu_seconds_total[1m])'
-    result = query_prometheus(query)
-    return jsonify(result)
-
-def get_memory_usage():
-    queries = {
-        'total': 'node_memory_MemTotal_bytes',
-        'free': 'node_memory_MemFree_bytes',
-        'available': 'node_memory_MemAvailable_bytes',
-        'buffers': 'node_memory_Buffers_bytes',
-        'cached': 'node_memory_Cached_bytes'
-    }
-    results = {key: query_prometheus(query) for key, query in queries.items()}
-    return jsonify(results)
-
-def get_disk_usage():
-    queries = {
-        'size': 'node_filesystem_size_bytes',
-        'free': 'node_filesystem_free_bytes',
-        'available': 'node_filesystem_avail_bytes',
-        'used': 'node_filesystem_size_bytes - node_filesystem_free_bytes'
-    }
-    results = {key: query_prometheus(query) for key, query in queries.items()}
-    return jsonify(results)
-
-def get_network_usage():
-    queries = {
-        'receive_bytes': 'rate(node_network_receive_bytes_total[1m])',
-        'transmit_bytes': 'rate(node_network_transmit_bytes_total[1m])',
-        'receive_errors': 'rate(node_network_receive_errs_total[1m])',
-        'transmit_errors': 'rate(node_network_transmit_errs_total[1m])'
+    return _query(get_cache(), current_app.config['PROMETHEUS_URL'], query, current_app.config['PROMETHEUS_TIMEOUT'])
+
+
+def _query_range(cache: PrometheusCache, prometheus_url: str, query: str, start: float, end: float, step: float,
+                 timeout: float) -> Dict[str, Any]:
+    def fetch(chunk_start: float, chunk_end: float) -> Dict[str, Any]:
+        params = {'query': query, 'start': chunk_start, 'end': chunk_end, 'step': step}
+        return _fetch(prometheus_url, '/api/v1/query_range', params, timeout)
+    return cache.query_range(fetch, (prometheus_url, query), start, end, step)
+
+
+def query_prometheus_range(query, start, end, step):
+    return _query_range(get_cache(), current_app.config['PROMETHEUS_URL'], query, start, end, step,
+                        current_app.config['PROMETHEUS_TIMEOUT'])
+
+
+def _promql_string(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def label_selector(filters: Filters) -> str:
+    """
+    Build the label matchers of `filters`: an equality matcher for a single value, an
+    anchored regex alternation of the escaped values otherwise.
+    """
+    matchers = []
+    for label, values in filters:
+        if not _LABEL_NAME.match(label):
+            raise ValueError(f'Invalid label name: {label}')
+        if len(values) == 1:
+            matchers.append(f'{label}="{_promql_string(values[0])}"')
+        else:
+            matchers.append(f'{label}=~"{_promql_string("|".join(re.escape(value) for value in values))}"')
+    return '{' + ','.join(matchers) + '}' if matchers else ''
+
+
+def panel_queries(name: str, filters: Filters = (), group: Optional[str] = None) -> Union[str, Dict[str, str]]:
+    """
+    Build the PromQL of a panel with the label filters and the grouping pushed down to
+    Prometheus, so that only the reduced series are evaluated and sent back.
+
+    Args:
+        name: Panel name.
+        filters: Label matchers applied to every selector of the panel.
+        group: Grouping level from PANEL_GROUPS, None keeps the raw series.
+
+    Returns:
+        The query, or the named sub-queries, of the panel.
+    """
+    operator, levels = PANEL_GROUPS[name]
+    if group is not None and group not in levels:
+        raise ValueError(f"Panel {name} supports the groupings: {', '.join(levels)}")
+    selector = label_selector(filters)
+
+    def build(template: str) -> str:
+        query = template.replace('{filters}', selector)
+        if group is None:
+            return query
+        labels = levels[group]
+        return f"{operator} by ({', '.join(labels)}) ({query})" if labels else f'{operator}({query})'
+
+    panel = PANELS[name]
+    return build(panel) if isinstance(panel, str) else {key: build(template) for key, template in panel.items()}
+
+
+def parsepanel_options(args: Any) -> Tuple[Filters, Optional[str]]:
+    """
+    Read the `instance` and `node` filters, comma separated, and the `group` level of a request.
+    """
+    filters = []
+    for param, label in (('instance', 'instance'), ('node', current_app.config['PROMETHEUS_NODE_LABEL'])):
+        values = sorted({value.strip() for value in (args.get(param) or '').split(',') if value.strip()})
+        if values:
+            filters.append((label, tuple(values)))
+    return tuple(filters), args.get('group') or None
+
+
+def merge_queries(queries: Dict[str, str]) -> str:
+    """
+    Merge named queries into one PromQL expression. Each sub-query's series are tagged
+    with a PANEL_KEY_LABEL label, which keeps their label sets distinct so the `or`
+    union keeps them all, and lets split_merged_result route them back.
+    """
+    return ' or '.join(
+        f'label_replace({query}, "{PANEL_KEY_LABEL}", "{key}", "", "")' for key, query in queries.items()
+    )
+
+
+def split_merged_result(result: Dict[str, Any], keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Split the response of a merged query into one Prometheus-shaped response per key.
+    """
+    series_by_key: Dict[str, List[Dict[str, Any]]] = {key: [] for key in keys}
+    data = result.get('data', {})
+    for series in data.get('result', []):
+        metric = dict(series.get('metric', {}))
+        key = metric.pop(PANEL_KEY_LABEL, None)
+        if key in series_by_key:
+            series_by_key[key].append(dict(series, metric=metric))
+    return {
+        key: {'status': result.get('status'), 'data': {'resultType': data.get('resultType'), 'result': series}}
+        for key, series in series_by_key.items()
     }
-    results = {key: query_prometheus(query) for key, query in queries.items()}
-    return jsonify(results)
-
-def get_system_load():
-    query = 'node_load1'
-    result = query_prometheus(query)
-    return jsonify(result)
-
-def get_uptime():
-    query = 'node_time_seconds - node_boot_time_seconds'
-    result = query_prometheus(query)
-    return jsonify(result)
+
+
+def _query_panel(cache: PrometheusCache, prometheus_url: str, timeout: float, name: str,
+                 filters: Filters = (), group: Optional[str] = None) -> Dict[str, Any]:
+    panel = panel_queries(name, filters, group)
+    if isinstance(panel, str):
+        return _query(cache, prometheus_url, panel, timeout)
+    return split_merged_result(_query(cache, prometheus_url, merge_queries(panel), timeout), panel)
+
+
+def query_panel(name: str, filters: Filters = (), group: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Evaluate one dashboard panel with a single Prometheus request.
+    """
+    return _query_panel(get_cache(), current_app.config['PROMETHEUS_URL'], current_app.config['PROMETHEUS_TIMEOUT'],
+                        name, filters, group)
+
+
+def query_panel_range(name: str, start: float, end: float, step: float, max_points: int,
+                      filters: Filters = (), group: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Evaluate one dashboard panel over a time range and downsample every series to at
+    most max_points points, whatever the length of the range.
+    """
+    panel = panel_queries(name, filters, group)
+    query = panel if isinstance(panel, str) else merge_queries(panel)
+    result = query_prometheus_range(query, start, end, step)
+    if isinstance(panel, str):
+        return downsample_result(result, max_points)
+    return {key: downsample_result(part, max_points) for key, part in split_merged_result(result, panel).items()}
+
+
+_DURATION = re.compile(r'^(\d+(?:\.\d+)?)([smhdw])$')
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_time(value: Optional[str], default: float, now: float) -> float:
+    """
+    Parse a range bound given as a unix timestamp or as a duration before now, e.g. "6h".
+    """
+    if not value:
+        return default
+    match = _DURATION.match(value)
+    if match:
+        return now - float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+    return float(value)
+
+
+def query_snapshot(panels: Optional[Iterable[str]] = None, filters: Filters = (),
+                   group: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Evaluate several dashboard panels concurrently, one merged request per panel.
+
+    Args:
+        panels: Panel names, all panels by default.
+        filters: Label matchers applied to every panel.
+        group: Grouping level applied to every panel.
+
+    Returns:
+        dict: Panel name -> panel result, or {'error': message} for a failed panel.
+    """
+    names = list(panels or PANELS)
+    prometheus_url = current_app.config['PROMETHEUS_URL']
+    timeout = current_app.config['PROMETHEUS_TIMEOUT']
+    cache = get_cache()
+    futures = {name: _get_executor().submit(_query_panel, cache, prometheus_url, timeout, name, filters, group)
+               for name in names}
+    snapshot = {}
+    for name, future in futures.items():
+        try:
+            snapshot[name] = future.result()
+        except Exception as e:
+            snapshot[name] = {'error': str(e)}
+    return snapshot
+
+def panel_options(names, args):
+    """
+    Check the given panels exist, then parse and validate the filters and grouping of a
+    request for them.
+
+    Returns:
+        tuple: (filters, group, error response or None)
+    """
+    unknown = [name for name in names if name not in PANELS]
+    if unknown:
+        return None, None, (jsonify({'error': f"Unknown panels: {', '.join(unknown)}"}), 400)
+    try:
+        filters, group = parsepanel_options(args or {})
+        for name in names:
+            panel_queries(name, filters, group)
+    except ValueError as e:
+        return None, None, (jsonify({'error': str(e)}), 400)
+    return filters, group, None
+
+def get_panel(name, args=None):
+    filters, group, error = panel_options([name], args)
+    if error:
+        return error
+    return jsonify(query_panel(name, filters, group))
+
+def get_cpu_usage(args=None):
+    return get_panel('cpu', args)
+
+def get_memory_usage(args=None):
+    return get_panel('memory', args)
+
+def get_disk_usage(args=None):
+    return get_panel('disk', args)
+
+def get_network_usage(args=None):
+    return get_panel('network', args)
+
+def get_system_load(args=None):
+    return get_panel('system_load', args)
+
+def get_uptime(args=None):
+    return get_panel('uptime', args)
+
+def get_snapshot(panels=None, args=None):
+    filters, group, error = panel_options(panels or PANELS, args)
+    if error:
+        return error
+    return jsonify(query_snapshot(panels, filters, group))
+
+def get_live_metrics() -> LiveMetrics:
+    """
+    Lazily create the samplers shared by every client of the live metrics stream.
+    """
+    global _live
+    cache = get_cache()
+    prometheus_url = current_app.config['PROMETHEUS_URL']
+    timeout = current_app.config['PROMETHEUS_TIMEOUT']
+    with _executor_lock:
+        if _live is None:
+            _live = LiveMetrics(lambda key: _query_panel(cache, prometheus_url, timeout, *key),
+                                current_app.config['PROMETHEUS_LIVE_INTERVAL'])
+        return _live
+
+
+def stream_panels(panels: Optional[Iterable[str]] = None, heartbeat: float = 15.0, filters: Filters = (),
+                  group: Optional[str] = None):
+    """
+    Stream dashboard panels: a full snapshot first, then only the series that changed.
+    Clients asking for the same panel, filters and grouping share one sampler.
+    """
+    return get_live_metrics().stream({name: (name, filters, group) for name in panels or PANELS}, heartbeat)
+
+def get_cache_stats():
+    return jsonify(get_cache().stats())
+
+def get_panel_range(name, args):
+    if name not in PANELS:
+        return jsonify({'error': f'Unknown panel: {name}'}), 404
+    now = time.time()
+    try:
+        end = parse_time(args.get('end'), now, now)
+        start = parse_time(args.get('start'), end - 3600, now)
+        step = float(args.get('step', current_app.config['PROMETHEUS_RANGE_DEFAULT_STEP']))
+        max_points = int(args.get('max_points', current_app.config['PROMETHEUS_RANGE_MAX_POINTS']))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid range parameter: {e}'}), 400
+    if start >= end or step <= 0 or max_points < 3:
+        return jsonify({'error': 'Expected start < end, step > 0 and max_points >= 3'}), 400
+    filters, group, error = panel_options([name], args)
+    if error:
+        return error
+    max_points = min(max_points, current_app.config['PROMETHEUS_RANGE_MAX_POINTS_LIMIT'])
+    return jsonify(query_panel_range(name, start, end, step, max_points, filters, group))
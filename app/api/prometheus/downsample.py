@@ -0,0 +1,66 @@
+# app/api/prometheus/downsample.py
+from typing import Any, Dict, List
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Select the points kept by the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are always kept. The points in between are split into
+    threshold - 2 buckets, and each bucket keeps the point forming the largest triangle
+    with the point kept in the previous bucket and the average of the next bucket.
+    The area of every candidate of a bucket is computed in one vectorised pass.
+
+    Args:
+        x: Timestamps, in increasing order.
+        y: Values, NaN and infinities are treated as 0 for the selection only.
+        threshold: Number of points to keep.
+
+    Returns:
+        np.ndarray: Sorted indices of the selected points.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    y = np.nan_to_num(y, nan=0.0, posinf=0.0, neginf=0.0)
+
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_values(values: List[List[Any]], max_points: int) -> List[List[Any]]:
+    """
+    Reduce a Prometheus range series ([[timestamp, "value"], ...]) to at most max_points points.
+    """
+    if len(values) <= max_points:
+        return values
+    x = np.fromiter((point[0] for point in values), dtype=np.float64, count=len(values))
+    y = np.fromiter((float(point[1]) for point in values), dtype=np.float64, count=len(values))
+    return [values[index] for index in lttb_indices(x, y, max_points)]
+
+
+def downsample_result(result: Dict[str, Any], max_points: int) -> Dict[str, Any]:
+    """
+    Downsample every series of a Prometheus matrix response, leaving other responses untouched.
+    """
+    data = result.get('data', {})
+    if data.get('resultType') != 'matrix':
+        return result
+    series = [dict(entry, values=downsample_values(entry.get('values', []), max_points))
+              for entry in data.get('result', [])]
+    return dict(result, data=dict(data, result=series))
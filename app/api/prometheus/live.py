@@ -0,0 +1,166 @@
+# app/api/prometheus/live.py
+import threading
+import time
+from typing import Any, Callable, Dict, Generator, Hashable, List, Optional, Tuple
+
+# Flattened panel result: series id -> {'metric': labels, 'value': value}
+FlatResult = Dict[str, Dict[str, Any]]
+
+
+def _series_id(metric: Dict[str, str], part: Optional[str] = None) -> str:
+    labels = ','.join(f'{name}={value}' for name, value in sorted(metric.items()))
+    return f'{part}|{labels}' if part else labels
+
+
+def flatten_panel(result: Dict[str, Any]) -> FlatResult:
+    """
+    Flatten a panel result, a Prometheus response or one response per sub-query, into
+    series id -> {'metric', 'value'} entries that can be compared between two samples.
+    """
+    parts = [(None, result)] if 'data' in result else list(result.items())
+    flat: FlatResult = {}
+    for part, response in parts:
+        for series in response.get('data', {}).get('result', []):
+            metric = series.get('metric', {})
+            entry = {'metric': metric, 'value': (series.get('value') or [None, None])[1]}
+            if part:
+                entry['part'] = part
+            flat[_series_id(metric, part)] = entry
+    return flat
+
+
+def diff_panel(previous: FlatResult, current: FlatResult) -> Dict[str, Any]:
+    """
+    Series that appeared or changed value, and the ids of series that disappeared.
+    """
+    return {
+        'changed': {key: entry for key, entry in current.items() if previous.get(key) != entry},
+        'removed': [key for key in previous if key not in current],
+    }
+
+
+class _Sample:
+    __slots__ = ('version', 'time', 'flat', 'error', 'delta')
+
+    def __init__(self, version: int, sampled_at: float, flat: FlatResult, error: Optional[str],
+                 delta: Optional[Dict[str, Any]]) -> None:
+        self.version = version
+        self.time = sampled_at
+        self.flat = flat
+        self.error = error
+        self.delta = delta  # Difference with the previous version, shared by every subscriber
+
+
+class LiveMetrics:
+    """
+    Fans dashboard panel samples out to every streaming client.
+
+    One sampler thread per subscribed query set evaluates it once per interval, however
+    many clients are watching, and stops once its last subscriber has gone. Clients
+    receive a full snapshot first, then only the series whose value changed.
+    """
+
+    def __init__(self, evaluate: Callable[[Hashable], Dict[str, Any]], interval: float) -> None:
+        """
+        Args:
+            evaluate: Callable(key) returning the panel result of a query set.
+            interval: Seconds between two samples of the same query set.
+        """
+        self.evaluate = evaluate
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._samples: Dict[Hashable, _Sample] = {}
+        self._subscribers: Dict[Hashable, int] = {}
+        self._wakeups: Dict[Hashable, threading.Event] = {}
+
+    def _subscribe(self, keys: List[Hashable]) -> None:
+        with self._cond:
+            for key in keys:
+                self._subscribers[key] = self._subscribers.get(key, 0) + 1
+                if key in self._wakeups:
+                    self._wakeups[key].clear()  # Keep a sampler that was about to stop
+                else:
+                    self._wakeups[key] = threading.Event()
+                    threading.Thread(target=self._sample, args=(key, self._wakeups[key]),
+                                     name=f'live-metrics-{key}', daemon=True).start()
+
+    def _unsubscribe(self, keys: List[Hashable]) -> None:
+        with self._cond:
+            for key in keys:
+                self._subscribers[key] -= 1
+                if not self._subscribers[key]:
+                    del self._subscribers[key]
+                    self._wakeups[key].set()
+
+    def _sample(self, key: Hashable, wakeup: threading.Event) -> None:
+        while True:
+            with self._cond:
+                if not self._subscribers.get(key):
+                    del self._wakeups[key]
+                    self._samples.pop(key, None)
+                    return
+            started = time.monotonic()
+            try:
+                flat, error = flatten_panel(self.evaluate(key)), None
+            except Exception as e:
+                flat, error = {}, str(e)
+            with self._cond:
+                previous = self._samples.get(key)
+                if previous is None:
+                    self._samples[key] = _Sample(1, time.time(), flat, error, None)
+                    self._cond.notify_all()
+                elif flat != previous.flat or error != previous.error:
+                    self._samples[key] = _Sample(previous.version + 1, time.time(), flat, error,
+                                                 diff_panel(previous.flat, flat))
+                    self._cond.notify_all()
+            wakeup.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stream(self, keys: Dict[str, Hashable], heartbeat: float = 15.0
+               ) -> Generator[Optional[Tuple[str, Dict[str, Any]]], None, None]:
+        """
+        Yield ('snapshot', panels) once every panel has been sampled, then ('delta', panels)
+        whenever some of them changed, and None as a heartbeat when nothing changed for
+        `heartbeat` seconds. Runs until the consumer closes the generator.
+
+        Args:
+            keys: Panel name as sent to the client -> query set key passed to evaluate.
+            heartbeat: Maximum silence between two yielded items.
+        """
+        subscribed = list(keys.values())
+        self._subscribe(subscribed)
+        seen: Dict[str, _Sample] = {}
+        try:
+            while True:
+                with self._cond:
+                    def pending() -> Dict[str, _Sample]:
+                        current = {name: self._samples.get(key) for name, key in keys.items()}
+                        if not seen and any(sample is None for sample in current.values()):
+                            return {}
+                        return {name: sample for name, sample in current.items()
+                                if sample is not None and (name not in seen or seen[name] is not sample)}
+                    self._cond.wait_for(lambda: bool(pending()), heartbeat)
+                    updates = pending()
+                if not updates:
+                    yield None
+                    continue
+                event = 'delta' if seen else 'snapshot'
+                payload = {}
+                for name, sample in updates.items():
+                    previous = seen.get(name)
+                    if sample.error:
+                        payload[name] = {'time': sample.time, 'error': sample.error}
+                    elif previous is None:
+                        payload[name] = {'time': sample.time, 'series': sample.flat} if event == 'snapshot' else \
+                            dict(diff_panel({}, sample.flat), time=sample.time)
+                    elif sample.delta is not None and previous.version == sample.version - 1:
+                        payload[name] = dict(sample.delta, time=sample.time)
+                    else:
+                        payload[name] = dict(diff_panel(previous.flat, sample.flat), time=sample.time)
+                    seen[name] = sample
+                yield event, payload
+        finally:
+            self._unsubscribe(subscribed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {'samplers': len(self._wakeups), 'subscriptions': sum(self._subscribers.values())}
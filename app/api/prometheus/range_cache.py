@@ -0,0 +1,257 @@
+# app/api/prometheus/range_cache.py
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+SeriesKey = Tuple[Tuple[str, str], ...]
+
+# Rough memory cost used for the byte budget: a [timestamp, "value"] pair, and a series
+_POINT_BYTES = 120
+_SERIES_BYTES = 400
+
+# Queries are serialized per key on one of a fixed set of locks, so the locks do not
+# grow with the number of distinct queries
+_FETCH_STRIPES = 64
+
+
+def _series_key(metric: Dict[str, str]) -> SeriesKey:
+    return tuple(sorted(metric.items()))
+
+
+def _matrix(series: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {'status': 'success', 'data': {'resultType': 'matrix', 'result': series}}
+
+
+class _Chunk:
+    """
+    Cached points of one query for `chunk_steps` consecutive steps.
+
+    Points up to `filled_to` are settled and kept until eviction. Points after it are
+    recent enough to still change (late scrapes, rule evaluation lag); they are kept as
+    a short-lived tail so a refresh wave shares a single fetch.
+    """
+
+    __slots__ = ('first_slot', 'last_slot', 'filled_to', 'series', 'tail', 'tail_to', 'tail_expires', 'size')
+
+    def __init__(self, first_slot: int, last_slot: int) -> None:
+        self.first_slot = first_slot
+        self.last_slot = last_slot
+        self.filled_to = first_slot - 1
+        self.series: Dict[SeriesKey, Tuple[Dict[str, str], List[List[Any]]]] = {}
+        self.tail: Dict[SeriesKey, Tuple[Dict[str, str], List[List[Any]]]] = {}
+        self.tail_to = first_slot - 1
+        self.tail_expires = 0.0
+        self.size = 0
+
+    def covered_to(self, now: float) -> int:
+        return self.tail_to if now < self.tail_expires else self.filled_to
+
+    def measure(self) -> int:
+        self.size = sum(_SERIES_BYTES + _POINT_BYTES * len(points)
+                        for store in (self.series, self.tail) for _, points in store.values())
+        return self.size
+
+
+class PrometheusCache:
+    """
+    Shared cache in front of Prometheus queries.
+
+    Range queries are aligned to their step and split into chunks of `chunk_steps`
+    steps. A request only fetches the steps its chunks do not hold yet, usually just
+    the tail since the previous refresh, with contiguous gaps merged into one
+    query_range call, and the response is stitched from the chunks. Instant queries are
+    evaluated at a time aligned to `instant_align` seconds so that every user polling
+    within the same window shares one result. Entries are evicted least recently used
+    first once the estimated size exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, chunk_steps: int, settle_delay: float, instant_align: float) -> None:
+        """
+        Args:
+            max_bytes: Memory budget of the cache, estimated.
+            chunk_steps: Number of steps held by one range chunk.
+            settle_delay: Age in seconds after which a point is considered final.
+            instant_align: Alignment of instant query evaluation times, 0 disables their caching.
+        """
+        self.max_bytes = max_bytes
+        self.chunk_steps = chunk_steps
+        self.settle_delay = settle_delay
+        self.instant_align = instant_align
+        self._entries: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._fetch_locks: List[threading.Lock] = [threading.Lock() for _ in range(_FETCH_STRIPES)]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.points_fetched = 0
+
+    def _fetch_lock(self, key: Hashable) -> threading.Lock:
+        return self._fetch_locks[hash(key) % len(self._fetch_locks)]
+
+    def _count(self, hits: int = 0, misses: int = 0, points: int = 0) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.points_fetched += points
+
+    def _get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: Hashable, entry: Any, size: int) -> None:
+        with self._lock:
+            self._bytes += size - self._sizes.get(key, 0)
+            self._entries[key] = entry
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+
+    def _evict(self) -> None:
+        with self._lock:
+            while self._bytes > self.max_bytes and self._entries:
+                key, _ = self._entries.popitem(last=False)
+                self._bytes -= self._sizes.pop(key)
+                self.evictions += 1
+
+    def query_range(self, fetch: Callable[[float, float], Dict[str, Any]], query_key: Hashable,
+                    start: float, end: float, step: float) -> Dict[str, Any]:
+        """
+        Return the matrix of a range query, fetching only the steps not cached yet.
+
+        Args:
+            fetch: Callable(start, end) running the range query at `step` resolution.
+            query_key: Identifies the query (e.g. Prometheus URL and PromQL).
+            start: Range start, rounded up to a multiple of step.
+            end: Range end, rounded down to a multiple of step.
+            step: Query resolution in seconds.
+
+        Returns:
+            dict: A Prometheus range query response.
+        """
+        first, last = math.ceil(start / step), math.floor(end / step)
+        if last < first:
+            return _matrix([])
+        width = self.chunk_steps
+        key_prefix = (query_key, step)
+
+        with self._fetch_lock(key_prefix):
+            now = time.time()
+            settled = math.floor((now - self.settle_delay) / step)
+
+            chunks: Dict[int, _Chunk] = {}
+            gaps: List[Tuple[int, int]] = []
+            hits = misses = 0
+            for index in range(first // width, last // width + 1):
+                chunk = self._get(key_prefix + (index,)) or _Chunk(index * width, index * width + width - 1)
+                chunks[index] = chunk
+                need_to = min(chunk.last_slot, last)
+                if chunk.covered_to(now) >= need_to:
+                    hits += 1
+                    continue
+                misses += 1
+                gap_from = chunk.filled_to + 1
+                if gaps and gaps[-1][1] + 1 == gap_from:
+                    gaps[-1] = (gaps[-1][0], need_to)
+                else:
+                    gaps.append((gap_from, need_to))
+            self._count(hits=hits, misses=misses)
+
+            for gap_from, gap_to in gaps:
+                self._absorb(chunks, fetch(gap_from * step, gap_to * step), step, gap_from, gap_to, settled, now)
+
+            for index, chunk in chunks.items():
+                self._store(key_prefix + (index,), chunk, chunk.measure())
+            result = self._stitch(chunks.values(), first, last, step)
+        self._evict()
+        return result
+
+    def _absorb(self, chunks: Dict[int, _Chunk], result: Dict[str, Any], step: float,
+                gap_from: int, gap_to: int, settled: int, now: float) -> None:
+        """
+        Distribute the points of a fetched gap over the chunks it spans.
+        """
+        width = self.chunk_steps
+        touched = [chunks[index] for index in range(gap_from // width, gap_to // width + 1)]
+        for chunk in touched:
+            chunk.tail = {}
+        points_fetched = 0
+        for series in result.get('data', {}).get('result', []):
+            metric = series.get('metric', {})
+            key = _series_key(metric)
+            for point in series.get('values', []):
+                points_fetched += 1
+                slot = round(point[0] / step)
+                chunk = chunks.get(slot // width)
+                if chunk is None:
+                    continue
+                store = chunk.series if slot <= settled else chunk.tail
+                store.setdefault(key, (metric, []))[1].append(point)
+        self._count(points=points_fetched)
+        for chunk in touched:
+            chunk_to = min(chunk.last_slot, gap_to)
+            chunk.filled_to = max(chunk.filled_to, min(chunk_to, settled))
+            chunk.tail_to = chunk_to
+            chunk.tail_expires = now + min(step, self.settle_delay)
+
+    @staticmethod
+    def _stitch(chunks: Any, first: int, last: int, step: float) -> Dict[str, Any]:
+        merged: Dict[SeriesKey, Tuple[Dict[str, str], List[List[Any]]]] = {}
+        for chunk in chunks:
+            for store in (chunk.series, chunk.tail):
+                for key, (metric, points) in store.items():
+                    selected = [point for point in points if first <= round(point[0] / step) <= last]
+                    if selected:
+                        merged.setdefault(key, (metric, []))[1].extend(selected)
+        return _matrix([{'metric': metric, 'values': points} for metric, points in merged.values()])
+
+    def instant(self, fetch: Callable[[Optional[float]], Dict[str, Any]], query_key: Hashable, now: float) -> Dict[str, Any]:
+        """
+        Return the result of an instant query evaluated at `now` aligned down to
+        `instant_align`, shared by every caller within the same window.
+
+        Args:
+            fetch: Callable(time) running the instant query at the given evaluation time.
+            query_key: Identifies the query (e.g. Prometheus URL and PromQL).
+            now: Current time.
+        """
+        if self.instant_align <= 0:
+            return fetch(None)
+        at = math.floor(now / self.instant_align) * self.instant_align
+        key = (query_key, 'instant', at)
+        with self._fetch_lock((query_key, 'instant')):
+            entry = self._get(key)
+            if entry is not None:
+                self._count(hits=1)
+                return entry
+            self._count(misses=1)
+            result = fetch(at)
+            series = result.get('data', {}).get('result', [])
+            self._store(key, result, _SERIES_BYTES * max(1, len(series)))
+        self._evict()
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'points_fetched': self.points_fetched,
+            }
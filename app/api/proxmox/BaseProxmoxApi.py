@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 
 class BaseProxmoxAPI(ABC):
 
@@ -11,10 +11,18 @@ class BaseProxmoxAPI(ABC):
     def list_vms(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
         pass
 
+    @abstractmethod
+    def list_cluster_vms(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        pass
+
     @abstractmethod
     def create_vm(self, url: str, vm_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
         pass
 
+    @abstractmethod
+    def clone_vm(self, url: str, clone_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        pass
+
     @abstractmethod
     def destroy_vm(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
         pass
@@ -38,3 +46,7 @@ class BaseProxmoxAPI(ABC):
     @abstractmethod
     def stop_vm(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
         pass
+
+    @abstractmethod
+    def bulk_vm_action(self, operations: List[Dict[str, Any]], per_node_limit: Optional[int] = None) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        pass
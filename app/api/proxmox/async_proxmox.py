@@ -0,0 +1,321 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Dict, List, Optional, Tuple, TypeVar
+import httpx
+from .BaseProxmoxApi import BaseProxmoxAPI
+from .cache import ResponseCache
+from .proxmox import BULK_ACTIONS, bulk_limit, bulk_result, merge_cluster_vms, online_nodes, plan_bulk_operations, summarize_bulk_results
+from .tasks import TaskTracker
+from app.metrics import track_outbound
+
+T = TypeVar('T')
+
+class AsyncProxmoxAPI(BaseProxmoxAPI):
+    """
+    Asynchronous counterpart of ProxmoxAPI built on httpx, with the same method set and
+    the same (success, data, status_code) contract.
+
+    All requests go through one httpx.AsyncClient, and therefore one keep-alive connection
+    pool, owned by a dedicated event loop thread. Coroutines awaited from another loop,
+    such as the per-request loop of an async Flask view, are forwarded to that thread.
+    """
+
+    def __init__(self, app: Any, cache: Optional[ResponseCache] = None, task_tracker: Optional[TaskTracker] = None,
+                 sync_api: Optional[Any] = None) -> None:
+        """
+        Initialize the AsyncProxmoxAPI instance with the application context.
+
+        Args:
+            app: The application context containing configuration such as Proxmox URL and credentials.
+            cache: Response cache of the synchronous client, serving GETs made here and
+                   invalidated by writes made here.
+            task_tracker: Task tracker recording the UPIDs of the tasks started here.
+            sync_api: Synchronous client whose ticket is reused, and renewed, instead of
+                      logging in separately.
+        """
+        self.app = app
+        self.base_url: str = app.config['PROXMOX_URL']
+        self.timeout: float = app.config['PROXMOX_TIMEOUT']
+        self.max_connections: int = app.config['PROXMOX_ASYNC_MAX_CONNECTIONS']
+        self.cache = cache
+        self.task_tracker = task_tracker
+        self.sync_api = sync_api
+
+        self.login_url: str = '/access/ticket'
+        self.token_id: Optional[str] = app.config['PROXMOX_TOKEN_ID']
+        self.token_auth: bool = bool(self.token_id and app.config['PROXMOX_TOKEN_SECRET'])
+        self.ticket_expires_at: Optional[float] = None
+        self._auth_generation = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        # Optional httpx transport override, e.g. a mock transport
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+        # Created on the owning loop by _get_client
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._auth_lock: Optional[asyncio.Lock] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='proxmox-async', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    async def _on_loop(self, coro: Awaitable[T]) -> T:
+        """
+        Await coro on the owning loop, forwarding it there when called from another loop.
+        """
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """
+        Run one of the coroutines from synchronous code and return its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result(timeout)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            headers = {}
+            if self.token_auth:
+                headers['Authorization'] = f"PVEAPIToken={self.token_id}={self.app.config['PROXMOX_TOKEN_SECRET']}"
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                verify=False,  # Disable SSL verification
+                headers=headers,
+                transport=self.transport,
+                # Callers queue on _slots rather than on the pool, so no pool timeout
+                timeout=httpx.Timeout(self.timeout, pool=None),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+            self._slots = asyncio.Semaphore(self.max_connections)
+            self._auth_lock = asyncio.Lock()
+        return self._client
+
+    async def make_request(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Centralized HTTP request handling method that includes error management.
+        GET requests are served through the response cache shared with the synchronous client.
+
+        Args:
+            method: HTTP method to use ('GET', 'POST', 'PUT', 'DELETE').
+            url: API endpoint URL.
+            **kwargs: Additional arguments to pass to the httpx request method.
+
+        Returns:
+            tuple: (success, data or None, status_code) where success is a boolean indicating the outcome,
+                   data is the JSON response or None, and status_code is the HTTP status code from the error.
+        """
+        if method == 'GET' and self.cache is not None:
+            key = self.cache.key_for(url, kwargs.get('params'))
+            return await self._on_loop(self.cache.get_or_load_async(key, lambda: self._send(method, url, **kwargs),
+                                                                    should_cache=lambda result: result[0]))
+        return await self._on_loop(self._send(method, url, **kwargs))
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Send the request on the owning loop, renewing the ticket shortly before it expires
+        and logging in again once when the request is rejected with 401.
+        """
+        self._get_client()
+        if self.sync_api is not None and not self.token_auth:
+            return await self._send_with_shared_ticket(method, url, **kwargs)
+        expires_at = self.ticket_expires_at
+        if expires_at is not None and time.time() >= expires_at - self.app.config['PROXMOX_TICKET_REFRESH_MARGIN']:
+            await self._relogin(self._auth_generation)
+        generation = self._auth_generation
+        success, data, status_code = await self._request(method, url, **kwargs)
+        if not success and status_code == 401 and self._can_login() and await self._relogin(generation):
+            return await self._request(method, url, **kwargs)
+        return success, data, status_code
+
+    async def _send_with_shared_ticket(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Send the request with the ticket of the synchronous client. Logins are blocking
+        calls of that client and run in a worker thread.
+        """
+        if self.sync_api.ticket_expiring():
+            await asyncio.to_thread(self.sync_api.renew_ticket, self.sync_api.ticket_headers()[0])
+        generation, headers = self.sync_api.ticket_headers()
+        success, data, status_code = await self._request(method, url, headers=headers, **kwargs)
+        if not success and status_code == 401 and await asyncio.to_thread(self.sync_api.renew_ticket, generation):
+            _, headers = self.sync_api.ticket_headers()
+            return await self._request(method, url, headers=headers, **kwargs)
+        return success, data, status_code
+
+    def _can_login(self) -> bool:
+        return not self.token_auth and bool(self.app.config['PROXMOX_USER'])
+
+    async def _relogin(self, generation: int) -> bool:
+        async with self._auth_lock:
+            if generation != self._auth_generation:
+                return True
+            success, _, _ = await self._login(self.login_url)
+            return success
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        async with self._slots:
+            with track_outbound('proxmox', method) as call:
+                try:
+                    response = await self._client.request(method, url, **kwargs)
+                    response.raise_for_status()
+                    return True, response.json().get('data', None), None
+                except httpx.HTTPStatusError as http_err:
+                    call.outcome = 'error'
+                    return False, None, http_err.response.status_code
+                except Exception:
+                    call.outcome = 'error'
+                    return False, None, 500
+
+    async def login(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Obtain a new authentication ticket. In API token mode no login round trip is needed.
+
+        Args:
+            url: Endpoint URL for login.
+
+        Returns:
+            tuple: (success, data or None, status_code)
+        """
+        if self.sync_api is not None:
+            return await asyncio.to_thread(self.sync_api.login, url)
+        return await self._on_loop(self._login(url))
+
+    async def _login(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        if self.token_auth:
+            return True, {'username': self.token_id.split('!', 1)[0], 'auth': 'token'}, None
+        client = self._get_client()
+        self.login_url = url
+        payload = {
+            'username': self.app.config['PROXMOX_USER'],
+            'password': self.app.config['PROXMOX_PASSWORD'],
+        }
+        success, data, status_code = await self._request('POST', url, data=payload)
+        if success and data:
+            client.cookies.set('PVEAuthCookie', data['ticket'])
+            client.headers['CSRFPreventionToken'] = data['CSRFPreventionToken']
+            self.ticket_expires_at = time.time() + self.app.config['PROXMOX_TICKET_LIFETIME']
+            self._auth_generation += 1
+        return success, data, status_code
+
+    async def list_vms(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self.make_request('GET', url)
+
+    async def list_cluster_vms(self, url: str = '/nodes') -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        List the VMs of every online node of the cluster, querying all nodes at once.
+
+        Args:
+            url: API endpoint URL used to discover the cluster nodes.
+
+        Returns:
+            tuple: (success, data or None, status_code) where data holds the merged VM list
+                   and, per node, its VM count, error status code and request duration.
+        """
+        success, nodes, status_code = await self.make_request('GET', url)
+        if not success:
+            return False, None, status_code
+
+        started = time.perf_counter()
+        names = online_nodes(nodes)
+        results = await asyncio.gather(*(self._timed(self.make_request('GET', f'/nodes/{name}/qemu')) for name in names))
+        return True, merge_cluster_vms(nodes, dict(zip(names, results)), time.perf_counter() - started), None
+
+    async def _write(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Send a state changing request, invalidate the cached entries it affects and
+        track the Proxmox task it started, if any.
+        """
+        result = await self.make_request(method, url, **kwargs)
+        if result[0]:
+            if self.cache is not None:
+                self.cache.invalidate_path(url)
+            if self.task_tracker is not None:
+                self.task_tracker.track(result[1])
+        return result
+
+    async def create_vm(self, url: str, vm_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self._write('POST', url, json=vm_config)
+
+    async def clone_vm(self, url: str, clone_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self._write('POST', url, data=clone_config)
+
+    async def destroy_vm(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self._write('DELETE', url)
+
+    async def update_vm(self, url: str, vm_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self._write('PUT', url, data=vm_config)
+
+    async def get_vm_status(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self.make_request('GET', url)
+
+    async def get_node_statistics(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self.make_request('GET', url)
+
+    async def start_vm(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self._write('POST', url)
+
+    async def stop_vm(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        return await self._write('POST', url)
+
+    async def bulk_vm_action(self, operations: List[Dict[str, Any]], per_node_limit: Optional[int] = None) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Run lifecycle actions on many VMs concurrently, with at most per_node_limit
+        operations in flight on any single node. A failing operation does not abort
+        the others.
+
+        Args:
+            operations: List of {'node': str, 'vmid': int, 'action': 'start' | 'stop' | 'destroy'}.
+            per_node_limit: Maximum parallel operations per node, defaults to PROXMOX_BULK_PER_NODE_LIMIT.
+
+        Returns:
+            tuple: (success, data or None, status_code) where data holds one result per
+                   operation, in request order, and the succeeded/failed counts.
+        """
+        if len(operations) > self.app.config['PROXMOX_BULK_MAX_OPERATIONS']:
+            return False, None, 413
+        limit = bulk_limit(per_node_limit, self.app.config['PROXMOX_BULK_PER_NODE_LIMIT'])
+        if limit is None:
+            return False, None, 400
+
+        started = time.perf_counter()
+        results, queues = plan_bulk_operations(operations)
+        node_slots = {node: asyncio.Semaphore(limit) for node in queues}
+
+        async def run(index: int, node: str, vmid: int, action: str) -> None:
+            method_name, url = BULK_ACTIONS[action]
+            async with node_slots[node]:
+                result, elapsed = await self._timed(getattr(self, method_name)(url.format(node=node, vmid=vmid)))
+            results[index] = bulk_result(node, vmid, action, result, elapsed)
+
+        await asyncio.gather(*(run(*entry) for queue in queues.values() for entry in queue))
+        return True, summarize_bulk_results(results, time.perf_counter() - started), None
+
+    @staticmethod
+    async def _timed(coro: Awaitable[T]) -> Tuple[T, float]:
+        started = time.perf_counter()
+        result = await coro
+        return result, time.perf_counter() - started
+
+
+def get_async_proxmox_api(app: Any, proxmox_api: Optional[Any] = None) -> AsyncProxmoxAPI:
+    """
+    Factory function to create a new instance of AsyncProxmoxAPI with the provided application context.
+
+    Args:
+        app: The application context to use.
+        proxmox_api: Optional synchronous client whose cache, task tracker and ticket are shared.
+
+    Returns:
+        AsyncProxmoxAPI: A new instance of AsyncProxmoxAPI.
+    """
+    if proxmox_api is None:
+        return AsyncProxmoxAPI(app)
+    return AsyncProxmoxAPI(app, cache=proxmox_api.cache, task_tracker=proxmox_api.task_tracker, sync_api=proxmox_api)
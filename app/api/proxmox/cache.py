@@ -0,0 +1,237 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Pattern, Tuple
+from urllib.parse import urlencode
+
+# Matches the node and, when present, the VM id of a Proxmox API path
+_VM_PATH = re.compile(r'^/nodes/(?P<node>[^/]+)(?:/qemu(?:/(?P<vmid>\d+))?)?')
+
+
+def parse_ttl_rules(spec: str) -> List[Tuple[str, float]]:
+    """
+    Parse a TTL rule specification such as "/status/current$=2,/qemu$=5".
+
+    Args:
+        spec: Comma separated list of "<path regex>=<ttl seconds>" rules.
+
+    Returns:
+        list: (pattern, ttl) pairs in declaration order.
+    """
+    rules = []
+    for rule in filter(None, (part.strip() for part in (spec or '').split(','))):
+        pattern, ttl = rule.rsplit('=', 1)
+        rules.append((pattern.strip(), float(ttl)))
+    return rules
+
+
+class _Flight:
+    """An upstream call in progress that concurrent identical requests wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.stale = False
+
+
+class ResponseCache:
+    """
+    Thread-safe read-through cache for Proxmox GET responses.
+
+    Entries expire after a per-path TTL and the least recently used entry is evicted
+    once the cache is full. Concurrent misses on the same key are coalesced so that
+    only one upstream call is made and every caller receives its result.
+    """
+
+    def __init__(self, max_entries: int, ttl_rules: List[Tuple[str, float]], default_ttl: float) -> None:
+        """
+        Args:
+            max_entries: Maximum number of responses kept in the cache.
+            ttl_rules: (path regex, ttl) pairs, the first matching rule wins.
+            default_ttl: TTL in seconds for paths matching no rule, 0 disables caching.
+        """
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.rules: List[Tuple[Pattern, float]] = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        if not params:
+            return url
+        return f"{url}?{urlencode(sorted(params.items()))}"
+
+    def ttl_for(self, key: str) -> float:
+        path = key.split('?', 1)[0]
+        for pattern, ttl in self.rules:
+            if pattern.search(path):
+                return ttl
+        return self.default_ttl
+
+    def get_or_load(self, key: str, loader: Callable[[], Any],
+                    should_cache: Callable[[Any], bool] = lambda result: True) -> Any:
+        """
+        Return the cached value for key, or load it once for all concurrent callers.
+
+        Args:
+            key: Cache key, usually built with key_for.
+            loader: Callable performing the upstream call.
+            should_cache: Predicate deciding whether a loaded value may be stored.
+
+        Returns:
+            The cached or freshly loaded value.
+        """
+        ttl = self.ttl_for(key)
+        if ttl <= 0:
+            return loader()
+
+        hit, value, flight, leader = self._lookup(key)
+        if hit:
+            return value
+        if not leader:
+            flight.done.wait()
+            return self._flight_result(flight)
+
+        try:
+            flight.result = loader()
+            return flight.result
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            self._land(key, flight, ttl, should_cache)
+
+    async def get_or_load_async(self, key: str, loader: Callable[[], Awaitable[Any]],
+                                should_cache: Callable[[Any], bool] = lambda result: True) -> Any:
+        """
+        Coroutine counterpart of get_or_load, for callers running on an event loop.
+
+        Entries and in-flight loads are shared with get_or_load; waiting on a load started
+        by another caller happens in a worker thread so the loop is never blocked.
+        """
+        ttl = self.ttl_for(key)
+        if ttl <= 0:
+            return await loader()
+
+        hit, value, flight, leader = self._lookup(key)
+        if hit:
+            return value
+        if not leader:
+            await asyncio.get_running_loop().run_in_executor(None, flight.done.wait)
+            return self._flight_result(flight)
+
+        try:
+            flight.result = await loader()
+            return flight.result
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            self._land(key, flight, ttl, should_cache)
+
+    def _lookup(self, key: str) -> Tuple[bool, Any, Optional[_Flight], bool]:
+        """Return (hit, value, flight, leader): the fresh entry for key, or the load to lead or wait on."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1], None, False
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+            return False, None, flight, leader
+
+    @staticmethod
+    def _flight_result(flight: _Flight) -> Any:
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _land(self, key: str, flight: _Flight, ttl: float, should_cache: Callable[[Any], bool]) -> None:
+        """Store the result of a finished load unless it failed or was invalidated, and wake its waiters."""
+        with self._lock:
+            self._inflight.pop(key, None)
+            if flight.error is None and not flight.stale and should_cache(flight.result):
+                self._entries[key] = (time.monotonic() + ttl, flight.result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        flight.done.set()
+
+    def invalidate(self, predicate: Callable[[str], bool]) -> int:
+        """
+        Drop every entry, and discard every in-flight load, whose key matches predicate.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            for key, flight in self._inflight.items():
+                if predicate(key):
+                    flight.stale = True
+        return len(keys)
+
+    def invalidate_path(self, url: str) -> int:
+        """
+        Invalidate the entries affected by a write to a node or VM path.
+
+        A write to /nodes/{node}/qemu/{vmid}/... drops that VM's entries, the node's VM
+        list and status, and the cluster-wide listings.
+
+        Args:
+            url: API endpoint URL of the write request.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        match = _VM_PATH.match(url)
+        if not match:
+            return self.invalidate(lambda key: True)
+        node, vmid = match.group('node'), match.group('vmid')
+        node_prefix = f"/nodes/{node}"
+        vm_prefix = f"{node_prefix}/qemu/{vmid}" if vmid else f"{node_prefix}/qemu"
+
+        def affected(key: str) -> bool:
+            path = key.split('?', 1)[0]
+            return (path == vm_prefix or path.startswith(vm_prefix + '/')
+                    or path in (f"{node_prefix}/qemu", f"{node_prefix}/status", '/nodes')
+                    or path.startswith('/cluster/'))
+
+        return self.invalidate(affected)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for flight in self._inflight.values():
+                flight.stale = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_ratio': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
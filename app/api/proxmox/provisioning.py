@@ -0,0 +1,210 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.jobs import Job, JobManager
+
+# Guards VMID allocation across concurrent provisioning jobs
+_allocation_lock = threading.Lock()
+_reserved_vmids: Set[int] = set()
+
+
+class VMProvisioning:
+    """Progress of one VM through the clone -> configure -> start pipeline."""
+
+    def __init__(self, index: int, vmid: int, name: str, config: Dict[str, Any]) -> None:
+        self.index = index
+        self.vmid = vmid
+        self.name = name
+        self.config = config
+        self.stage = 'pending'
+        self.error: Optional[str] = None
+        self.tasks: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'index': self.index,
+            'vmid': self.vmid,
+            'name': self.name,
+            'stage': self.stage,
+            'error': self.error,
+            'tasks': self.tasks,
+            'timings': self.timings,
+        }
+
+
+class ProvisioningJob(Job):
+    """
+    Clone a template into `count` VMs, apply their configuration and start them.
+
+    Every VM runs its own pipeline on a thread pool, so the stages of different VMs
+    overlap; within one VM each stage waits for the Proxmox task of the previous one.
+    Clones are additionally limited by a semaphore since they contend on the template
+    and its storage.
+    """
+
+    kind = 'provisioning'
+
+    def __init__(self, pipeline: 'ProvisioningPipeline', node: str, spec: Dict[str, Any]) -> None:
+        super().__init__(dict(spec, node=node))
+        self.pipeline = pipeline
+        self.node = node
+        self.template: int = int(spec['template'])
+        self.vms: List[VMProvisioning] = []
+
+    def run(self) -> bool:
+        config = self.pipeline.app.config
+        vmids = self.pipeline.allocate_vmids(int(self.params['count']), self.params.get('vmid_start'))
+        try:
+            per_vm = self.params.get('per_vm') or []
+            for index, vmid in enumerate(vmids):
+                name = self.params.get('name', 'vm-{vmid}').format(index=index, vmid=vmid, node=self.node)
+                vm_config = dict(self.params.get('config') or {})
+                vm_config.update(per_vm[index] if index < len(per_vm) else {})
+                self.vms.append(VMProvisioning(index, vmid, name, vm_config))
+
+            clone_slots = threading.Semaphore(config['PROXMOX_PROVISION_CLONE_CONCURRENCY'])
+            with ThreadPoolExecutor(max_workers=config['PROXMOX_PROVISION_PARALLELISM'],
+                                    thread_name_prefix=f'provision-{self.id[:8]}') as executor:
+                for future in [executor.submit(self._provision, vm, clone_slots) for vm in self.vms]:
+                    future.result()
+        finally:
+            self.pipeline.release_vmids(vmids)
+        return all(vm.stage == 'done' for vm in self.vms)
+
+    def _provision(self, vm: VMProvisioning, clone_slots: threading.Semaphore) -> None:
+        api = self.pipeline.proxmox_api
+        clone = {'newid': vm.vmid, 'name': vm.name, 'full': 1 if self.params.get('full') else 0}
+        for key in ('pool', 'storage', 'target'):
+            if self.params.get(key):
+                clone[key] = self.params[key]
+        with clone_slots:
+            if not self._stage(vm, 'cloning', api.clone_vm, f'/nodes/{self.node}/qemu/{self.template}/clone', clone):
+                return
+        if vm.config and not self._stage(vm, 'configuring', api.update_vm,
+                                         f'/nodes/{self.node}/qemu/{vm.vmid}/config', vm.config):
+            return
+        if self.params.get('start', True) and not self._stage(vm, 'starting', api.start_vm,
+                                                              f'/nodes/{self.node}/qemu/{vm.vmid}/status/start'):
+            return
+        vm.stage = 'done'
+
+    def _stage(self, vm: VMProvisioning, stage: str, call: Any, *args: Any) -> bool:
+        """
+        Run one pipeline stage and wait for the Proxmox task it started, if any.
+
+        Returns:
+            bool: True when the stage completed successfully.
+        """
+        if self.cancel_requested.is_set():
+            vm.stage, vm.error = 'cancelled', 'Provisioning cancelled'
+            return False
+        vm.stage = stage
+        started = time.perf_counter()
+        success, data, status_code = call(*args)
+        if not success:
+            vm.stage, vm.error = 'failed', f'{stage} failed with status {status_code}'
+            return False
+        if isinstance(data, str) and data.startswith('UPID:'):
+            vm.tasks[stage] = data
+            task = self.pipeline.proxmox_api.task_tracker.wait(
+                data, self.pipeline.app.config['PROXMOX_PROVISION_TASK_TIMEOUT'])
+            if task is None or task['status'] != 'stopped':
+                vm.stage, vm.error = 'failed', f'{stage} timed out'
+                return False
+            if not task['succeeded']:
+                vm.stage, vm.error = 'failed', f"{stage} failed: {task['exitstatus']}"
+                return False
+        vm.timings[stage] = round(time.perf_counter() - started, 3)
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = super().to_dict()
+        vms = [vm.to_dict() for vm in self.vms]
+        data['vms'] = vms
+        data['summary'] = {stage: sum(1 for vm in vms if vm['stage'] == stage)
+                           for stage in {vm['stage'] for vm in vms}}
+        return data
+
+
+class ProvisioningPipeline:
+    """
+    Provisions fleets of VMs from templates as background jobs on top of ProxmoxAPI.
+    """
+
+    def __init__(self, app: Any, proxmox_api: Any) -> None:
+        self.app = app
+        self.proxmox_api = proxmox_api
+        self.jobs = JobManager(max_concurrent=app.config['PROXMOX_PROVISION_MAX_JOBS'],
+                               retention=app.config['PROXMOX_TASK_RETENTION'], name='provisioning')
+
+    def submit(self, node: str, spec: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Validate a provisioning request and queue it.
+
+        Args:
+            node: Node holding the template and receiving the clones.
+            spec: {'template': int, 'count': int, 'name': str format using {index}/{vmid}/{node},
+                   'vmid_start': int, 'config': dict, 'per_vm': [dict], 'start': bool, 'full': bool,
+                   'pool': str, 'storage': str, 'target': str}
+
+        Returns:
+            tuple: (success, job data or error message, status_code)
+        """
+        if not str(spec.get('template', '')).isdigit():
+            return False, 'A template VMID is required', 400
+        count = spec.get('count')
+        if not isinstance(count, int) or not 0 < count <= self.app.config['PROXMOX_PROVISION_MAX_COUNT']:
+            return False, f"count must be between 1 and {self.app.config['PROXMOX_PROVISION_MAX_COUNT']}", 400
+        try:
+            spec.get('name', 'vm-{vmid}').format(index=0, vmid=0, node=node)
+        except (KeyError, IndexError, ValueError) as e:
+            return False, f'Invalid name pattern: {e}', 400
+        job = self.jobs.submit(ProvisioningJob(self, node, spec))
+        return True, job.to_dict(), None
+
+    def allocate_vmids(self, count: int, start: Optional[int] = None) -> List[int]:
+        """
+        Reserve `count` free VMIDs with two API calls: the next free id from /cluster/nextid,
+        unless `start` is given, and the ids in use from /cluster/resources.
+        """
+        with _allocation_lock:
+            if start is None:
+                success, nextid, status_code = self.proxmox_api.make_request('GET', '/cluster/nextid')
+                if not success:
+                    raise RuntimeError(f'Could not allocate VMIDs, /cluster/nextid failed with status {status_code}')
+                start = int(nextid)
+            success, resources, status_code = self.proxmox_api.make_request('GET', '/cluster/resources',
+                                                                            params={'type': 'vm'})
+            if not success:
+                raise RuntimeError(f'Could not allocate VMIDs, /cluster/resources failed with status {status_code}')
+            used = {int(resource['vmid']) for resource in resources or [] if 'vmid' in resource} | _reserved_vmids
+
+            vmids: List[int] = []
+            candidate = int(start)
+            while len(vmids) < count:
+                if candidate not in used:
+                    vmids.append(candidate)
+                candidate += 1
+            _reserved_vmids.update(vmids)
+            return vmids
+
+    @staticmethod
+    def release_vmids(vmids: List[int]) -> None:
+        with _allocation_lock:
+            _reserved_vmids.difference_update(vmids)
+
+
+def get_provisioning_pipeline(app: Any, proxmox_api: Any) -> ProvisioningPipeline:
+    """
+    Factory function to create a ProvisioningPipeline on top of a ProxmoxAPI instance.
+
+    Args:
+        app: The application context to use.
+        proxmox_api: The ProxmoxAPI used to clone, configure and start the VMs.
+
+    Returns:
+        ProvisioningPipeline: A new instance of ProvisioningPipeline.
+    """
+    return ProvisioningPipeline(app, proxmox_api)
@@ -1,13 +1,111 @@
+import threading
+import time
+from collections import defaultdict, deque
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import HTTPError
 from .BaseProxmoxApi import BaseProxmoxAPI
+from .cache import ResponseCache, parse_ttl_rules
+from .tasks import TaskTracker
+from app.metrics import track_outbound
 from contextlib import contextmanager
-from typing import Any, Dict, Tuple, Optional, Generator
+from typing import Any, Dict, List, Tuple, Optional, Generator
 
 # Disable SSL verification warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Lifecycle actions accepted by bulk_vm_action: action -> (method name, endpoint URL template)
+BULK_ACTIONS: Dict[str, Tuple[str, str]] = {
+    'start': ('start_vm', '/nodes/{node}/qemu/{vmid}/status/start'),
+    'stop': ('stop_vm', '/nodes/{node}/qemu/{vmid}/status/stop'),
+    'destroy': ('destroy_vm', '/nodes/{node}/qemu/{vmid}'),
+}
+
+def online_nodes(nodes: Optional[List[Dict[str, Any]]]) -> List[str]:
+    return [node['node'] for node in nodes or [] if node.get('status', 'online') == 'online']
+
+
+def merge_cluster_vms(nodes: Optional[List[Dict[str, Any]]],
+                      node_results: Dict[str, Tuple[Tuple[bool, Optional[Any], Optional[int]], float]],
+                      elapsed: float) -> Dict[str, Any]:
+    """
+    Merge the per-node VM listings of a cluster inventory into one response.
+
+    Args:
+        nodes: The node list returned by /nodes.
+        node_results: Node name -> ((success, vms, status_code), elapsed seconds) of its /qemu listing.
+        elapsed: Wall-clock duration of the whole fan-out.
+
+    Returns:
+        dict: The merged VM list, each VM tagged with its node, and per-node details.
+    """
+    vms: List[Dict[str, Any]] = []
+    per_node: Dict[str, Dict[str, Any]] = {}
+    for node in nodes or []:
+        if node['node'] not in node_results:
+            per_node[node['node']] = {'status': node.get('status'), 'vms': 0, 'error': None, 'elapsed': 0.0}
+    for name, ((success, node_vms, status_code), node_elapsed) in node_results.items():
+        per_node[name] = {
+            'status': 'online',
+            'vms': len(node_vms or []) if success else 0,
+            'error': None if success else status_code,
+            'elapsed': round(node_elapsed, 4),
+        }
+        if success:
+            vms.extend(dict(vm, node=name) for vm in node_vms or [])
+    return {'vms': vms, 'nodes': per_node, 'elapsed': round(elapsed, 4)}
+
+
+def bulk_result(node: Any, vmid: Any, action: Any, result: Tuple[bool, Optional[Any], Optional[int]],
+                elapsed: float) -> Dict[str, Any]:
+    success, data, status_code = result
+    return {'node': node, 'vmid': vmid, 'action': action, 'success': success,
+            'data': data, 'status_code': status_code, 'elapsed': round(elapsed, 4)}
+
+
+def plan_bulk_operations(operations: List[Dict[str, Any]]) -> Tuple[List[Optional[Dict[str, Any]]], Dict[str, deque]]:
+    """
+    Validate bulk operations and queue the valid ones per node.
+
+    Returns:
+        tuple: (results, queues) where results already holds a 400 result for every invalid
+               operation and queues maps each node to its (index, node, vmid, action) entries.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+    queues: Dict[str, deque] = defaultdict(deque)
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            results[index] = bulk_result(None, None, None, (False, None, 400), 0.0)
+            continue
+        node, vmid, action = operation.get('node'), operation.get('vmid'), operation.get('action')
+        if not isinstance(node, str) or not str(vmid).isdigit() or action not in BULK_ACTIONS:
+            results[index] = bulk_result(node, vmid, action, (False, None, 400), 0.0)
+            continue
+        queues[node].append((index, node, int(vmid), action))
+    return results, queues
+
+
+def bulk_limit(per_node_limit: Any, default: int) -> Optional[int]:
+    """Return the per node limit of a bulk run, `default` when None, or None when it is not a positive integer."""
+    if per_node_limit is None:
+        return max(1, default)
+    if isinstance(per_node_limit, bool) or not isinstance(per_node_limit, int) or per_node_limit < 1:
+        return None
+    return per_node_limit
+
+
+def summarize_bulk_results(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    succeeded = sum(1 for result in results if result['success'])
+    return {
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'elapsed': round(elapsed, 4),
+    }
+
+
 class ProxmoxAPI(BaseProxmoxAPI):
 
     def __init__(self, app: Any) -> None:
@@ -21,10 +119,47 @@ class ProxmoxAPI(BaseProxmoxAPI):
         self.base_url: str = app.config['PROXMOX_URL']
         self.session: requests.Session = requests.Session()
         self.session.verify = False  # Disable SSL verification
+        # One pool per scheme, sized so concurrent request threads do not queue for a connection
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config['PROXMOX_POOL_SIZE'])
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.timeout: float = app.config['PROXMOX_TIMEOUT']
+
+        # Authentication state: API token header auth, or a renewable ticket
+        self.login_url: str = '/access/ticket'
+        self.token_id: Optional[str] = app.config['PROXMOX_TOKEN_ID']
+        self.token_auth: bool = bool(self.token_id and app.config['PROXMOX_TOKEN_SECRET'])
+        if self.token_auth:
+            self.session.headers.update({
+                'Authorization': f"PVEAPIToken={self.token_id}={app.config['PROXMOX_TOKEN_SECRET']}"
+            })
+        self.ticket_expires_at: Optional[float] = None
+        self._auth_lock = threading.Lock()
+        self._auth_generation = 0
+
+        # Shared pool used to fan requests out across the cluster nodes
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=app.config['PROXMOX_MAX_WORKERS'], thread_name_prefix='proxmox'
+        )
+        self.cache: ResponseCache = ResponseCache(
+            max_entries=app.config['PROXMOX_CACHE_MAX_ENTRIES'],
+            ttl_rules=parse_ttl_rules(app.config['PROXMOX_CACHE_TTLS']),
+            default_ttl=app.config['PROXMOX_CACHE_DEFAULT_TTL'],
+        )
+        self.task_tracker: TaskTracker = TaskTracker(
+            self,
+            poll_min=app.config['PROXMOX_TASK_POLL_MIN'],
+            poll_max=app.config['PROXMOX_TASK_POLL_MAX'],
+            backoff=app.config['PROXMOX_TASK_POLL_BACKOFF'],
+            retention=app.config['PROXMOX_TASK_RETENTION'],
+            max_failures=app.config['PROXMOX_TASK_MAX_FAILURES'],
+            max_age=app.config['PROXMOX_TASK_MAX_AGE'],
+        )
 
     def make_request(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
         """
         Centralized HTTP request handling method that includes error management.
+        GET requests are served through the response cache.
 
         Args:
             method: HTTP method to use ('GET', 'POST', 'PUT', 'DELETE').
@@ -35,20 +170,89 @@ class ProxmoxAPI(BaseProxmoxAPI):
             tuple: (success, data or None, status_code) where success is a boolean indicating the outcome,
                    data is the JSON response or None, and status_code is the HTTP status code from the error.
         """
+        if method == 'GET':
+            key = self.cache.key_for(url, kwargs.get('params'))
+            return self.cache.get_or_load(key, lambda: self._send(method, url, **kwargs),
+                                          should_cache=lambda result: result[0])
+        return self._send(method, url, **kwargs)
+
+    def _send(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Send the request to the Proxmox API without going through the cache.
+
+        The ticket is renewed shortly before it expires, and a request rejected with 401
+        triggers one re-login followed by a single retry.
+        """
+        self._refresh_ticket_if_expiring()
+        generation = self._auth_generation
+        success, data, status_code = self._request(method, url, **kwargs)
+        if not success and status_code == 401 and self._can_login() and self._relogin(generation):
+            return self._request(method, url, **kwargs)
+        return success, data, status_code
+
+    def _can_login(self) -> bool:
+        return not self.token_auth and bool(self.app.config['PROXMOX_USER'])
+
+    def _refresh_ticket_if_expiring(self) -> None:
+        if self.ticket_expiring():
+            self._relogin(self._auth_generation)
+
+    def ticket_expiring(self) -> bool:
+        expires_at = self.ticket_expires_at
+        return expires_at is not None and time.time() >= expires_at - self.app.config['PROXMOX_TICKET_REFRESH_MARGIN']
+
+    def ticket_headers(self) -> Tuple[int, Dict[str, str]]:
+        """
+        Return the auth generation and the headers carrying the current ticket, for
+        another client sharing this login.
+        """
+        with self._auth_lock:
+            ticket = self.session.cookies.get('PVEAuthCookie')
+            if not ticket:
+                return self._auth_generation, {}
+            return self._auth_generation, {'Cookie': f'PVEAuthCookie={ticket}',
+                                           'CSRFPreventionToken': self.session.headers['CSRFPreventionToken']}
+
+    def renew_ticket(self, generation: int) -> bool:
+        """
+        Log in again for a client whose request was rejected with the ticket of
+        `generation`, unless that ticket was already replaced.
+        """
+        return self._can_login() and self._relogin(generation)
+
+    def _relogin(self, generation: int) -> bool:
+        """
+        Log in again unless another thread already did since `generation` was read.
+
+        Returns:
+            bool: True when a valid ticket is available afterwards.
+        """
+        with self._auth_lock:
+            if generation != self._auth_generation:
+                return True
+            success, _, _ = self._login(self.login_url)
+            return success
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
         full_url = f"{self.base_url}{url}"
-        try:
-            response = self.session.request(method, full_url, **kwargs)
-            response.raise_for_status()
-            return True, response.json().get('data', None), None
-        except HTTPError as http_err:
-            return False, None, http_err.response.status_code
-        except Exception:
-            return False, None, 500 
+        kwargs.setdefault('timeout', self.timeout)
+        with track_outbound('proxmox', method) as call:
+            try:
+                response = self.session.request(method, full_url, **kwargs)
+                response.raise_for_status()
+                return True, response.json().get('data', None), None
+            except HTTPError as http_err:
+                call.outcome = 'error'
+                return False, None, http_err.response.status_code
+            except Exception:
+                call.outcome = 'error'
+                return False, None, 500
         
     @contextmanager
     def login_context(self, url: str) -> Generator['ProxmoxAPI', None, None]:
         """
-        A context manager to handle API login and ensure the session is closed on exit.
+        A context manager to handle API login. The shared session is kept open on exit
+        so its connections and ticket keep being reused by later requests.
 
         Args:
             url: Endpoint URL for login.
@@ -56,34 +260,95 @@ class ProxmoxAPI(BaseProxmoxAPI):
         Yields:
             The ProxmoxAPI instance itself.
         """
-        try:
-            self.login(url)
-            yield self
-        finally:
-            self.session.close()
+        self.login(url)
+        yield self
 
     def login(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Obtain a new authentication ticket. In API token mode no login round trip is needed.
+
+        Args:
+            url: Endpoint URL for login.
+
+        Returns:
+            tuple: (success, data or None, status_code)
+        """
+        if self.token_auth:
+            return True, {'username': self.token_id.split('!', 1)[0], 'auth': 'token'}, None
+        with self._auth_lock:
+            return self._login(url)
+
+    def _login(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """Log in and install the new ticket. The caller holds `_auth_lock`."""
+        self.login_url = url
         payload = {
             'username': self.app.config['PROXMOX_USER'],
             'password': self.app.config['PROXMOX_PASSWORD'],
         }
-        success, data, status_code = self.make_request('POST', url, data=payload)
+        success, data, status_code = self._request('POST', url, data=payload)
         if success and data:
             self.session.cookies.set('PVEAuthCookie', data['ticket'])
             self.session.headers.update({'CSRFPreventionToken': data['CSRFPreventionToken']})
+            self.ticket_expires_at = time.time() + self.app.config['PROXMOX_TICKET_LIFETIME']
+            self._auth_generation += 1
         return success, data, status_code
     
     def list_vms(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
         return self.make_request('GET', url)
 
+    def list_cluster_vms(self, url: str = '/nodes') -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        List the VMs of every online node of the cluster, querying the nodes concurrently.
+
+        Args:
+            url: API endpoint URL used to discover the cluster nodes.
+
+        Returns:
+            tuple: (success, data or None, status_code) where data holds the merged VM list
+                   and, per node, its VM count, error status code and request duration.
+        """
+        success, nodes, status_code = self.make_request('GET', url)
+        if not success:
+            return False, None, status_code
+
+        started = time.perf_counter()
+        futures = {name: self.executor.submit(self._timed_call, self.make_request, 'GET', f'/nodes/{name}/qemu')
+                   for name in online_nodes(nodes)}
+        node_results = {name: future.result() for name, future in futures.items()}
+        return True, merge_cluster_vms(nodes, node_results, time.perf_counter() - started), None
+
+    def _write(self, method: str, url: str, **kwargs: Any) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Send a state changing request, invalidate the cached entries it affects and
+        track the Proxmox task it started, if any.
+        """
+        result = self.make_request(method, url, **kwargs)
+        if result[0]:
+            self.cache.invalidate_path(url)
+            self.task_tracker.track(result[1])
+        return result
+
     def create_vm(self, url: str, vm_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
-        return self.make_request('POST', url, json=vm_config)
+        return self._write('POST', url, json=vm_config)
+
+    def clone_vm(self, url: str, clone_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Clone a VM or template.
+
+        Args:
+            url: API endpoint URL of the clone action of the source VM.
+            clone_config: Clone parameters such as newid, name and full.
+
+        Returns:
+            tuple: (success, data or None, status_code)
+        """
+        return self._write('POST', url, data=clone_config)
 
     def destroy_vm(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
-        return self.make_request('DELETE', url)
+        return self._write('DELETE', url)
 
     def update_vm(self, url: str, vm_config: Dict[str, Any]) -> Tuple[bool, Optional[Dict], Optional[int]]:
-        return self.make_request('PUT', url, data=vm_config)
+        return self._write('PUT', url, data=vm_config)
 
     def get_vm_status(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
         return self.make_request('GET', url)
@@ -102,7 +367,7 @@ class ProxmoxAPI(BaseProxmoxAPI):
         Returns:
             tuple: (success, data or None, status_code)
         """
-        return self.make_request('POST', url)
+        return self._write('POST', url)
 
     def stop_vm(self, url: str) -> Tuple[bool, Optional[Dict], Optional[int]]:
         """
@@ -114,10 +379,65 @@ class ProxmoxAPI(BaseProxmoxAPI):
         Returns:
             tuple: (success, data or None, status_code)
         """
-        return self.make_request('POST', url)
+        return self._write('POST', url)
+
+    def bulk_vm_action(self, operations: List[Dict[str, Any]], per_node_limit: Optional[int] = None) -> Tuple[bool, Optional[Dict], Optional[int]]:
+        """
+        Run lifecycle actions on many VMs concurrently, with at most per_node_limit
+        operations in flight on any single node. A failing operation does not abort
+        the others.
 
+        Args:
+            operations: List of {'node': str, 'vmid': int, 'action': 'start' | 'stop' | 'destroy'}.
+            per_node_limit: Maximum parallel operations per node, defaults to PROXMOX_BULK_PER_NODE_LIMIT.
 
+        Returns:
+            tuple: (success, data or None, status_code) where data holds one result per
+                   operation, in request order, and the succeeded/failed counts.
+        """
+        if len(operations) > self.app.config['PROXMOX_BULK_MAX_OPERATIONS']:
+            return False, None, 413
+        limit = bulk_limit(per_node_limit, self.app.config['PROXMOX_BULK_PER_NODE_LIMIT'])
+        if limit is None:
+            return False, None, 400
+
+        started = time.perf_counter()
+        results, queues = plan_bulk_operations(operations)
+        # Start the node workers round-robin so every node gets served early
+        futures = []
+        for slot in range(limit):
+            for queue in queues.values():
+                if slot < len(queue):
+                    futures.append(self.executor.submit(self._drain_bulk_queue, queue, results))
+        for future in futures:
+            future.result()
+        return True, summarize_bulk_results(results, time.perf_counter() - started), None
+
+    def _drain_bulk_queue(self, queue: deque, results: List[Optional[Dict[str, Any]]]) -> None:
+        """
+        Worker of bulk_vm_action: run the operations queued for one node until none is left.
+        """
+        while True:
+            try:
+                index, node, vmid, action = queue.popleft()
+            except IndexError:
+                return
+            method_name, url = BULK_ACTIONS[action]
+            (success, data, status_code), elapsed = self._timed_call(getattr(self, method_name),
+                                                                     url.format(node=node, vmid=vmid))
+            results[index] = bulk_result(node, vmid, action, (success, data, status_code), elapsed)
+
+    @staticmethod
+    def _timed_call(function: Any, *args: Any) -> Tuple[Tuple[bool, Optional[Dict], Optional[int]], float]:
+        """
+        Call one of the request methods and measure how long the round trip took.
 
+        Returns:
+            tuple: (request result, elapsed seconds)
+        """
+        started = time.perf_counter()
+        result = function(*args)
+        return result, time.perf_counter() - started
 
 
 def get_proxmox_api(app: Any) -> ProxmoxAPI:
@@ -131,10 +451,3 @@ def get_proxmox_api(app: Any) -> ProxmoxAPI:
         ProxmoxAPI: A new instance of ProxmoxAPI.
     """
     return ProxmoxAPI(app)
-
-
-
-
-
-
-
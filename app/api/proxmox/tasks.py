@@ -0,0 +1,266 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Generator, List, Optional
+
+
+def parse_upid(upid: str) -> Optional[Dict[str, Any]]:
+    """
+    Split a Proxmox task id (UPID:node:pid:pstart:starttime:type:id:user:) into its fields.
+
+    Returns:
+        dict or None: The UPID fields, or None if the string is not a UPID.
+    """
+    if not isinstance(upid, str) or not upid.startswith('UPID:'):
+        return None
+    parts = upid.split(':')
+    if len(parts) < 8:
+        return None
+    try:
+        starttime = int(parts[4], 16)
+    except ValueError:
+        return None
+    return {'node': parts[1], 'starttime': starttime, 'type': parts[5], 'id': parts[6], 'user': parts[7]}
+
+
+class TrackedTask:
+    """State of a Proxmox task started by the application."""
+
+    def __init__(self, upid: str, fields: Dict[str, Any]) -> None:
+        self.upid = upid
+        self.node: str = fields['node']
+        self.type: str = fields['type']
+        self.vmid: str = fields['id']
+        self.user: str = fields['user']
+        self.starttime: int = fields['starttime']
+        self.status = 'running'
+        self.exitstatus: Optional[str] = None
+        self.endtime: Optional[int] = None
+        self.tracked_at = self.updated_at = time.time()
+        self.version = 0
+        self.failures = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('stopped', 'unknown')
+
+    @property
+    def succeeded(self) -> bool:
+        return self.finished and self.exitstatus == 'OK'
+
+    def update(self, status: str, exitstatus: Optional[str], endtime: Optional[int]) -> bool:
+        if (status, exitstatus, endtime) == (self.status, self.exitstatus, self.endtime):
+            return False
+        self.status, self.exitstatus, self.endtime = status, exitstatus, endtime
+        self.updated_at = time.time()
+        self.version += 1
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'upid': self.upid,
+            'node': self.node,
+            'type': self.type,
+            'vmid': self.vmid,
+            'user': self.user,
+            'starttime': self.starttime,
+            'status': self.status,
+            'exitstatus': self.exitstatus,
+            'endtime': self.endtime,
+            'succeeded': self.succeeded,
+        }
+
+
+class TaskTracker:
+    """
+    Follows the Proxmox tasks started through ProxmoxAPI until they finish.
+
+    A single background thread polls the pending tasks, one request per node: a node
+    with one pending task is polled through its task status, a node with several
+    through one task listing. Each node's poll interval grows exponentially while its
+    tasks keep running and is reset whenever a new task is tracked on it.
+
+    A task whose node fails `max_failures` polls in a row, or that is still pending
+    `max_age` seconds after it was tracked, is given up on: its status becomes
+    'unknown', which ends its waiters and streams like a finished task.
+    """
+
+    def __init__(self, proxmox_api: Any, poll_min: float, poll_max: float, backoff: float, retention: float,
+                 max_failures: int = 10, max_age: float = 86400) -> None:
+        """
+        Args:
+            proxmox_api: The ProxmoxAPI used to poll task state.
+            poll_min: Initial poll interval per node, in seconds.
+            poll_max: Upper bound of the poll interval, in seconds.
+            backoff: Factor applied to a node's poll interval after each poll.
+            retention: Seconds a finished task is kept before being forgotten.
+            max_failures: Consecutive failed polls after which a task is marked unknown.
+            max_age: Seconds after which a task still pending is marked unknown.
+        """
+        self.proxmox_api = proxmox_api
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.backoff = backoff
+        self.retention = retention
+        self.max_failures = max_failures
+        self.max_age = max_age
+        self._tasks: Dict[str, TrackedTask] = {}
+        self._intervals: Dict[str, float] = {}
+        self._next_poll: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, upid: str) -> Optional[TrackedTask]:
+        """
+        Start following a task.
+
+        Args:
+            upid: The task id returned by Proxmox.
+
+        Returns:
+            TrackedTask or None: The tracked task, or None if upid is not a task id.
+        """
+        fields = parse_upid(upid)
+        if fields is None:
+            return None
+        with self._cond:
+            task = self._tasks.get(upid)
+            if task is None:
+                task = self._tasks[upid] = TrackedTask(upid, fields)
+            node = task.node
+            self._intervals[node] = self.poll_min
+            self._next_poll[node] = min(self._next_poll.get(node, float('inf')), time.monotonic() + self.poll_min)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='proxmox-tasks', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return task
+
+    def get(self, upid: str) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            task = self._tasks.get(upid)
+            return task.to_dict() if task else None
+
+    def list(self, active_only: bool = False) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [task.to_dict() for task in self._tasks.values() if not (active_only and task.finished)]
+
+    def wait(self, upid: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Block until a task finishes or timeout seconds elapse.
+
+        Returns:
+            dict or None: The task state on return, or None if the task is unknown.
+        """
+        with self._cond:
+            task = self._tasks.get(upid)
+            if task is None:
+                return None
+            self._cond.wait_for(lambda: task.finished, timeout)
+            return task.to_dict()
+
+    def watch(self, upid: str, timeout: float, heartbeat: float = 15.0) -> Generator[Optional[Dict[str, Any]], None, None]:
+        """
+        Yield the task state whenever it changes, and None as a heartbeat when nothing
+        changed for `heartbeat` seconds. Stops once the task finished or after timeout.
+        """
+        deadline = time.monotonic() + timeout
+        version = -1
+        while True:
+            with self._cond:
+                task = self._tasks.get(upid)
+                if task is None:
+                    return
+                remaining = deadline - time.monotonic()
+                self._cond.wait_for(lambda: task.version != version, max(0.0, min(heartbeat, remaining)))
+                changed = task.version != version
+                version = task.version
+                state = task.to_dict()
+            yield state if changed else None
+            if task.finished or time.monotonic() >= deadline:
+                return
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._prune()
+                self._expire()
+                pending = self._pending_by_node()
+                if not pending:
+                    self._cond.wait(self.poll_max)
+                    continue
+                now = time.monotonic()
+                due = [node for node in pending if self._next_poll.get(node, now) <= now]
+                if not due:
+                    self._cond.wait(min(self._next_poll.get(node, now) for node in pending) - now)
+                    continue
+                for node in due:
+                    self._intervals[node] = min(self._intervals.get(node, self.poll_min) * self.backoff, self.poll_max)
+                    self._next_poll[node] = now + self._intervals[node]
+
+            for node in due:
+                try:
+                    polled = self._poll_node(node, pending[node])
+                except Exception:
+                    # Keep polling the other nodes, this one is retried on its next interval
+                    polled = False
+                with self._cond:
+                    for task in pending[node]:
+                        task.failures = 0 if polled else task.failures + 1
+
+    def _pending_by_node(self) -> Dict[str, List[TrackedTask]]:
+        pending: Dict[str, List[TrackedTask]] = defaultdict(list)
+        for task in self._tasks.values():
+            if not task.finished:
+                pending[task.node].append(task)
+        return pending
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for upid in [upid for upid, task in self._tasks.items() if task.finished and task.updated_at < cutoff]:
+            del self._tasks[upid]
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.max_age
+        expired = [task for task in self._tasks.values() if not task.finished
+                   and (task.failures >= self.max_failures or task.tracked_at < cutoff)]
+        for task in expired:
+            task.update('unknown', None, None)
+        if expired:
+            self._cond.notify_all()
+
+    def _poll_node(self, node: str, tasks: List[TrackedTask]) -> bool:
+        """
+        Refresh the state of the pending tasks of one node with a single request.
+
+        Returns:
+            bool: Whether the node answered the poll.
+        """
+        if len(tasks) == 1:
+            task = tasks[0]
+            success, data, _ = self.proxmox_api.make_request('GET', f'/nodes/{node}/tasks/{task.upid}/status')
+            if not (success and data):
+                return False
+            self._apply(task, data.get('status', 'running'), data.get('exitstatus'), data.get('endtime'))
+            return True
+
+        params = {'source': 'all', 'since': min(task.starttime for task in tasks), 'limit': 1000}
+        success, data, _ = self.proxmox_api.make_request('GET', f'/nodes/{node}/tasks', params=params)
+        if not success:
+            return False
+        listed = {entry['upid']: entry for entry in data or [] if 'upid' in entry}
+        for task in tasks:
+            entry = listed.get(task.upid)
+            if entry is not None and entry.get('endtime'):
+                self._apply(task, 'stopped', entry.get('status'), entry.get('endtime'))
+        return True
+
+    def _apply(self, task: TrackedTask, status: str, exitstatus: Optional[str], endtime: Optional[int]) -> None:
+        with self._cond:
+            changed = task.update(status, exitstatus, endtime)
+            if changed:
+                self._cond.notify_all()
+        if changed and task.finished:
+            # The VM state moved once the task completed, drop what was cached meanwhile
+            self.proxmox_api.cache.invalidate_path(f'/nodes/{task.node}/qemu/{task.vmid}' if task.vmid.isdigit()
+                                                   else f'/nodes/{task.node}')
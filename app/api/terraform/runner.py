@@ -0,0 +1,139 @@
+import codecs
+import os
+import signal
+import subprocess
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from app.jobs import JobManager, ProcessJob, pipe_reader, pump_output
+from app.metrics import track_outbound
+
+# Seconds between two checks for cancellation while waiting for output or the lock
+_POLL_INTERVAL = 0.5
+
+ACTIONS: Dict[str, List[str]] = {
+    'init': ['init', '-input=false', '-no-color'],
+    'plan': ['plan', '-input=false', '-no-color'],
+    'apply': ['apply', '-auto-approve', '-input=false', '-no-color'],
+    'destroy': ['destroy', '-auto-approve', '-input=false', '-no-color'],
+}
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+def working_dir_lock(working_dir: str) -> threading.Lock:
+    """
+    Return the lock serializing the Terraform commands run in `working_dir`, so two runs
+    never race on the same state.
+    """
+    key = os.path.realpath(working_dir)
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+class TerraformJob(ProcessJob):
+    """
+    One Terraform command run in the background.
+
+    The job holds the lock of its working directory for the whole run, queueing behind
+    any other command on the same state. Output, stdout and stderr merged, is streamed
+    line by line into a bounded log buffer. Cancelling forwards SIGINT to terraform,
+    which stops gracefully and releases its state lock, then SIGKILL if it is still
+    running after TERRAFORM_CANCEL_GRACE seconds.
+    """
+
+    kind = 'terraform'
+
+    def __init__(self, runner: 'TerraformRunner', action: str, working_dir: str) -> None:
+        super().__init__({'action': action}, runner.log_max_bytes)
+        self.runner = runner
+        self.action = action
+        self.working_dir = working_dir
+
+    def run(self) -> bool:
+        lock = working_dir_lock(self.working_dir)
+        try:
+            if not lock.acquire(blocking=False):
+                self.log.write('Waiting for another Terraform command on this working directory...\n')
+                while not lock.acquire(timeout=_POLL_INTERVAL):
+                    if self.cancel_requested.is_set():
+                        return False
+            try:
+                with track_outbound('terraform', self.action) as call:
+                    self.exit_code = self._execute()
+                    if self.exit_code != 0:
+                        call.outcome = 'error'
+            finally:
+                lock.release()
+        finally:
+            self.log.close()
+        if self.exit_code != 0 and not self.cancel_requested.is_set():
+            self.error = f'terraform {self.action} exited with status {self.exit_code}'
+        return self.exit_code == 0
+
+    def _execute(self) -> int:
+        process = subprocess.Popen(['terraform'] + ACTIONS[self.action], cwd=self.working_dir,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        def send_signal(name: str) -> None:
+            # Like Ctrl-C in a terminal, the signal reaches terraform and its provider plugins
+            os.killpg(process.pid, getattr(signal, f'SIG{name}'))
+
+        try:
+            if pump_output(pipe_reader(process.stdout, _POLL_INTERVAL), lambda data: self.log.write(decoder.decode(data)),
+                           self.cancel_requested, send_signal, self.runner.cancel_grace):
+                self.log.write(decoder.decode(b'', final=True))
+            else:
+                self.log.write('\n[cancel] terraform did not stop after SIGINT and was killed\n')
+            return process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+
+class TerraformRunner:
+    """
+    Runs Terraform commands as background jobs, at most TERRAFORM_MAX_CONCURRENT_JOBS at
+    a time; commands on the same working directory run one after the other.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.working_dir: str = app.config['TERRAFORM_WORKING_DIR']
+        self.log_max_bytes: int = app.config['TERRAFORM_LOG_MAX_BYTES']
+        self.cancel_grace: float = app.config['TERRAFORM_CANCEL_GRACE']
+        self.jobs = JobManager(max_concurrent=app.config['TERRAFORM_MAX_CONCURRENT_JOBS'],
+                               retention=app.config['TERRAFORM_JOB_RETENTION'], name='terraform')
+
+    def submit(self, action: str) -> Tuple[bool, Optional[Any], Optional[int]]:
+        """
+        Queue a Terraform command.
+
+        Args:
+            action: 'init', 'plan', 'apply' or 'destroy'.
+
+        Returns:
+            tuple: (success, job data or error message, status_code)
+        """
+        if action not in ACTIONS:
+            return False, f'Unknown action {action}, expected one of {", ".join(ACTIONS)}', 400
+        job = self.jobs.submit(TerraformJob(self, action, self.working_dir))
+        return True, job.to_dict(), None
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in self.jobs.list()]
+
+
+def get_terraform_runner(app: Any) -> TerraformRunner:
+    """
+    Factory function to create a TerraformRunner.
+
+    Args:
+        app: The application holding the TERRAFORM_* configuration.
+
+    Returns:
+        TerraformRunner: A new instance of TerraformRunner.
+    """
+    return TerraformRunner(app)
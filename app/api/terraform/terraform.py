@@ -1,6 +1,8 @@
 import subprocess
 from typing import Dict, List, Any
 from .base_terraform_api import BaseTerraformAPI
+from app.metrics import track_outbound
+from .runner import working_dir_lock
 
 class TerraformAPI(BaseTerraformAPI):
     """
@@ -20,6 +22,7 @@ class TerraformAPI(BaseTerraformAPI):
     def _run_terraform_command(self, command: List[str]) -> tuple[bool, str]:
         """
         Executes a Terraform command in the configured working directory and handles the output.
+        Waits for any other command running in the same working directory, background jobs included.
 
         Args:
             command (List[str]): The command to execute as a list of strings.
@@ -27,17 +30,19 @@ class TerraformAPI(BaseTerraformAPI):
         Returns:
             Dict[str, str]: A dictionary containing the status ('success' or 'error') and the command output.
         """
-        try:
-            result = subprocess.run(
-                command,
-                cwd=self.working_dir,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            return (True, result.stdout.decode())
-        except subprocess.CalledProcessError as e:
-            return (False, e.stderr.decode())
+        with working_dir_lock(self.working_dir), track_outbound('terraform', command[1]) as call:
+            try:
+                result = subprocess.run(
+                    command,
+                    cwd=self.working_dir,
+                    check=True,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE
+                )
+                return (True, result.stdout.decode())
+            except subprocess.CalledProcessError as e:
+                call.outcome = 'error'
+                return (False, e.stderr.decode())
 
     def init(self) -> Dict[str, str]:
         """
@@ -6,6 +6,7 @@ from app.api.userManagement.user import User
 from flask_jwt_extended import create_access_token, unset_jwt_cookies
 import datetime
 import uuid
+from app.metrics import track_outbound
 
 class Auth:
     @staticmethod
@@ -27,11 +28,12 @@ class Auth:
         message.attach(part2)
 
         try:
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.sendmail(sender_email, receiver_email, message.as_string())
-            server.quit()
+            with track_outbound('smtp', 'send_email'):
+                server = smtplib.SMTP(smtp_server, smtp_port)
+                server.starttls()
+                server.login(smtp_username, smtp_password)
+                server.sendmail(sender_email, receiver_email, message.as_string())
+                server.quit()
         except Exception as e:
             print(f"Error sending email: {e}")
 
@@ -0,0 +1,61 @@
+# app/conditional.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Tuple
+from flask import Response, current_app, request
+
+# Serialised bodies of recently returned payloads, keyed by object identity. Responses
+# served from the Proxmox cache return the very same objects until the entry expires,
+# so repeated polls skip both the JSON encoding and the hashing.
+_MEMO_SIZE = 256
+_memo: 'OrderedDict[Tuple[int, ...], Tuple[Any, bytes, str]]' = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _identity(payload: Any) -> Tuple[int, ...]:
+    if isinstance(payload, tuple):
+        return tuple(id(part) for part in payload)
+    return (id(payload),)
+
+
+def _serialize(payload: Any) -> Tuple[bytes, str]:
+    key = _identity(payload)
+    with _memo_lock:
+        entry = _memo.get(key)
+        if entry is not None:
+            _memo.move_to_end(key)
+            return entry[1], entry[2]
+    # Sorted keys make the body, and therefore the ETag, independent of upstream key order
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str).encode()
+    etag = hashlib.sha1(body).hexdigest()
+    with _memo_lock:
+        # The payload is kept referenced so its id cannot be reused by another object
+        _memo[key] = (payload, body, etag)
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return body, etag
+
+
+def conditional_jsonify(payload: Any, status: int = 200) -> Response:
+    """
+    Build a JSON response carrying a content hash ETag, answering a matching
+    If-None-Match with 304 Not Modified.
+
+    Args:
+        payload: JSON serialisable data.
+        status: HTTP status code, only 200 responses are made conditional.
+
+    Returns:
+        Response: The JSON response, or an empty 304 response.
+    """
+    if status != 200:
+        response = current_app.json.response(payload)
+        response.status_code = status
+        return response
+    body, etag = _serialize(payload)
+    response = Response(body, status=status, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Revalidate on every poll
+    return response.make_conditional(request)
@@ -53,3 +53,70 @@ class Config(object):
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     MAIL_USE_SSL = os.environ.get('MAIL_USE_SSL')
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS')
+    PROXMOX_MAX_WORKERS = int(os.environ.get('PROXMOX_MAX_WORKERS', 16))
+    PROXMOX_TIMEOUT = float(os.environ.get('PROXMOX_TIMEOUT', 30))
+    PROXMOX_CACHE_MAX_ENTRIES = int(os.environ.get('PROXMOX_CACHE_MAX_ENTRIES', 1024))
+    PROXMOX_CACHE_DEFAULT_TTL = float(os.environ.get('PROXMOX_CACHE_DEFAULT_TTL', 5))
+    PROXMOX_CACHE_TTLS = os.environ.get('PROXMOX_CACHE_TTLS', '/tasks(/|$)=0,^/cluster/nextid$=0,/status/current$=2,/qemu$=5,/nodes/[^/]+/status$=5,^/nodes$=30')
+    PROXMOX_POOL_SIZE = int(os.environ.get('PROXMOX_POOL_SIZE', PROXMOX_MAX_WORKERS))
+    PROXMOX_TOKEN_ID = os.environ.get('PROXMOX_TOKEN_ID')
+    PROXMOX_TOKEN_SECRET = os.environ.get('PROXMOX_TOKEN_SECRET')
+    PROXMOX_TICKET_LIFETIME = float(os.environ.get('PROXMOX_TICKET_LIFETIME', 7200))
+    PROXMOX_TICKET_REFRESH_MARGIN = float(os.environ.get('PROXMOX_TICKET_REFRESH_MARGIN', 600))
+    PROXMOX_TASK_POLL_MIN = float(os.environ.get('PROXMOX_TASK_POLL_MIN', 0.5))
+    PROXMOX_TASK_POLL_MAX = float(os.environ.get('PROXMOX_TASK_POLL_MAX', 10))
+    PROXMOX_TASK_POLL_BACKOFF = float(os.environ.get('PROXMOX_TASK_POLL_BACKOFF', 2))
+    PROXMOX_TASK_RETENTION = float(os.environ.get('PROXMOX_TASK_RETENTION', 900))
+    PROXMOX_TASK_WAIT_MAX = float(os.environ.get('PROXMOX_TASK_WAIT_MAX', 300))
+    PROXMOX_BULK_PER_NODE_LIMIT = int(os.environ.get('PROXMOX_BULK_PER_NODE_LIMIT', 4))
+    PROXMOX_BULK_MAX_OPERATIONS = int(os.environ.get('PROXMOX_BULK_MAX_OPERATIONS', 500))
+    PROXMOX_ASYNC_MAX_CONNECTIONS = int(os.environ.get('PROXMOX_ASYNC_MAX_CONNECTIONS', 100))
+    PROXMOX_PROVISION_MAX_JOBS = int(os.environ.get('PROXMOX_PROVISION_MAX_JOBS', 4))
+    PROXMOX_PROVISION_MAX_COUNT = int(os.environ.get('PROXMOX_PROVISION_MAX_COUNT', 200))
+    PROXMOX_PROVISION_PARALLELISM = int(os.environ.get('PROXMOX_PROVISION_PARALLELISM', 16))
+    PROXMOX_PROVISION_CLONE_CONCURRENCY = int(os.environ.get('PROXMOX_PROVISION_CLONE_CONCURRENCY', 4))
+    PROXMOX_PROVISION_TASK_TIMEOUT = float(os.environ.get('PROXMOX_PROVISION_TASK_TIMEOUT', 900))
+    PROMETHEUS_MAX_WORKERS = int(os.environ.get('PROMETHEUS_MAX_WORKERS', 8))
+    PROMETHEUS_TIMEOUT = float(os.environ.get('PROMETHEUS_TIMEOUT', 15))
+    PROMETHEUS_RANGE_DEFAULT_STEP = float(os.environ.get('PROMETHEUS_RANGE_DEFAULT_STEP', 15))
+    PROMETHEUS_RANGE_MAX_POINTS = int(os.environ.get('PROMETHEUS_RANGE_MAX_POINTS', 500))
+    PROMETHEUS_RANGE_MAX_POINTS_LIMIT = int(os.environ.get('PROMETHEUS_RANGE_MAX_POINTS_LIMIT', 5000))
+    PROMETHEUS_CACHE_MAX_BYTES = int(os.environ.get('PROMETHEUS_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    PROMETHEUS_CACHE_CHUNK_STEPS = int(os.environ.get('PROMETHEUS_CACHE_CHUNK_STEPS', 240))
+    PROMETHEUS_CACHE_SETTLE_DELAY = float(os.environ.get('PROMETHEUS_CACHE_SETTLE_DELAY', 60))
+    PROMETHEUS_INSTANT_ALIGN = float(os.environ.get('PROMETHEUS_INSTANT_ALIGN', 10))
+    PROMETHEUS_LIVE_INTERVAL = float(os.environ.get('PROMETHEUS_LIVE_INTERVAL', 10))
+    PROMETHEUS_LIVE_HEARTBEAT = float(os.environ.get('PROMETHEUS_LIVE_HEARTBEAT', 15))
+    PROMETHEUS_NODE_LABEL = os.environ.get('PROMETHEUS_NODE_LABEL', 'node')
+    INTERNAL_METRICS_TOKEN = os.environ.get('INTERNAL_METRICS_TOKEN')
+    SSH_POOL_MAX_SIZE = int(os.environ.get('SSH_POOL_MAX_SIZE', 4))
+    SSH_POOL_MAX_CHANNELS = int(os.environ.get('SSH_POOL_MAX_CHANNELS', 8))
+    SSH_POOL_MAX_IDLE = float(os.environ.get('SSH_POOL_MAX_IDLE', 300))
+    SSH_POOL_KEEPALIVE = int(os.environ.get('SSH_POOL_KEEPALIVE', 30))
+    SSH_POOL_CHECKOUT_TIMEOUT = float(os.environ.get('SSH_POOL_CHECKOUT_TIMEOUT', 30))
+    SSH_CONNECT_TIMEOUT = float(os.environ.get('SSH_CONNECT_TIMEOUT', 10))
+    ANSIBLE_MAX_CONCURRENT_RUNS = int(os.environ.get('ANSIBLE_MAX_CONCURRENT_RUNS', 4))
+    ANSIBLE_RUN_RETENTION = float(os.environ.get('ANSIBLE_RUN_RETENTION', 3600))
+    ANSIBLE_RUN_LOG_MAX_BYTES = int(os.environ.get('ANSIBLE_RUN_LOG_MAX_BYTES', 2 * 1024 * 1024))
+    ANSIBLE_RUN_CANCEL_GRACE = float(os.environ.get('ANSIBLE_RUN_CANCEL_GRACE', 10))
+    ANSIBLE_CATALOG_MAX_BYTES = int(os.environ.get('ANSIBLE_CATALOG_MAX_BYTES', 32 * 1024 * 1024))
+    ANSIBLE_CONTROL_HOSTS = os.environ.get('ANSIBLE_CONTROL_HOSTS')
+    ANSIBLE_LOAD_PROBE_TTL = float(os.environ.get('ANSIBLE_LOAD_PROBE_TTL', 15))
+    ANSIBLE_SCHEDULE_TIMEOUT = float(os.environ.get('ANSIBLE_SCHEDULE_TIMEOUT', 30))
+    ANSIBLE_RESULTS_BATCH_SIZE = int(os.environ.get('ANSIBLE_RESULTS_BATCH_SIZE', 200))
+    ANSIBLE_RESULTS_FLUSH_INTERVAL = float(os.environ.get('ANSIBLE_RESULTS_FLUSH_INTERVAL', 2))
+    ANSIBLE_EXECUTION_BACKEND = os.environ.get('ANSIBLE_EXECUTION_BACKEND', 'ssh')
+    ANSIBLE_LOCAL_INVENTORY_PATH = os.environ.get('ANSIBLE_LOCAL_INVENTORY_PATH')
+    ANSIBLE_LOCAL_MAX_PROCESSES = int(os.environ.get('ANSIBLE_LOCAL_MAX_PROCESSES', os.cpu_count() or 1))
+    ANSIBLE_FACT_CACHE_DIR = os.environ.get('ANSIBLE_FACT_CACHE_DIR', '~/.ansible/fact_cache')
+    ANSIBLE_FACT_CACHE_TTL = int(os.environ.get('ANSIBLE_FACT_CACHE_TTL', 3600))
+    ANSIBLE_DEFAULT_PROFILE = os.environ.get('ANSIBLE_DEFAULT_PROFILE', 'safe')
+    ANSIBLE_FAST_FORKS = int(os.environ.get('ANSIBLE_FAST_FORKS', 50))
+    ANSIBLE_SAFE_FORKS = int(os.environ.get('ANSIBLE_SAFE_FORKS', 5))
+    ANSIBLE_MAX_FORKS = int(os.environ.get('ANSIBLE_MAX_FORKS', 200))
+    TERRAFORM_MAX_CONCURRENT_JOBS = int(os.environ.get('TERRAFORM_MAX_CONCURRENT_JOBS', 2))
+    TERRAFORM_JOB_RETENTION = int(os.environ.get('TERRAFORM_JOB_RETENTION', 3600))
+    TERRAFORM_LOG_MAX_BYTES = int(os.environ.get('TERRAFORM_LOG_MAX_BYTES', 2 * 1024 * 1024))
+    TERRAFORM_CANCEL_GRACE = float(os.environ.get('TERRAFORM_CANCEL_GRACE', 30))
+    PROXMOX_TASK_MAX_FAILURES = int(os.environ.get('PROXMOX_TASK_MAX_FAILURES', 10))
+    PROXMOX_TASK_MAX_AGE = float(os.environ.get('PROXMOX_TASK_MAX_AGE', 86400))
@@ -0,0 +1,309 @@
+# app/jobs.py
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import IO, Any, Callable, Deque, Dict, Generator, List, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class Job(ABC):
+    """
+    A unit of background work run by a JobManager.
+
+    Subclasses implement run(), returning True on success. Raising marks the job as
+    failed with the exception message as its error.
+    """
+
+    kind = 'job'
+
+    def __init__(self, params: Optional[Dict[str, Any]] = None) -> None:
+        self.id: str = uuid.uuid4().hex
+        self.params: Dict[str, Any] = params or {}
+        self.status: str = QUEUED
+        self.error: Optional[str] = None
+        self.created_at: float = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return round((self.finished_at or time.time()) - self.started_at, 3)
+
+    @abstractmethod
+    def run(self) -> bool:
+        pass
+
+    def cancel(self) -> None:
+        """Request cancellation, run() is expected to check cancel_requested."""
+        self.cancel_requested.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finished, returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': self.duration,
+        }
+
+
+class LogBuffer:
+    """
+    Output of a job, split into lines and bounded to about `max_bytes`.
+
+    Lines are addressed by their offset since the start of the output, so readers can
+    resume where they stopped; once the buffer is full the oldest lines are dropped.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._lines: Deque[str] = deque()
+        self._bytes = 0
+        self._first = 0
+        self._partial = ''
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def next_offset(self) -> int:
+        with self._cond:
+            return self._first + len(self._lines)
+
+    def write(self, text: str) -> None:
+        """Append output, a trailing incomplete line is held back until it is terminated."""
+        if not text:
+            return
+        with self._cond:
+            *complete, self._partial = (self._partial + text).split('\n')
+            self._append(complete)
+
+    def close(self) -> None:
+        with self._cond:
+            if self._partial:
+                self._append([self._partial])
+                self._partial = ''
+            self._closed = True
+            self._cond.notify_all()
+
+    def _append(self, lines: List[str]) -> None:
+        for line in lines:
+            line = line.rstrip('\r')
+            self._lines.append(line)
+            self._bytes += len(line) + 1
+        while self._bytes > self.max_bytes and len(self._lines) > 1:
+            self._bytes -= len(self._lines.popleft()) + 1
+            self._first += 1
+        if lines:
+            self._cond.notify_all()
+
+    def read(self, since: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Lines from offset `since`, `dropped` counting the requested lines no longer buffered.
+        Negative offsets and limits count as 0.
+        """
+        since = max(0, since)
+        if limit is not None:
+            limit = max(0, limit)
+        with self._cond:
+            start = max(since, self._first)
+            stop = None if limit is None else start - self._first + limit
+            lines = list(islice(self._lines, start - self._first, stop))
+            return {'offset': start, 'lines': lines, 'next_offset': start + len(lines),
+                    'dropped': start - since, 'complete': self._closed}
+
+    def tail(self, count: int) -> str:
+        with self._cond:
+            return '\n'.join(list(self._lines)[-count:])
+
+    def follow(self, since: int = 0, heartbeat: float = 15.0) -> Generator[Optional[Dict[str, Any]], None, None]:
+        """
+        Yield the lines from offset `since` as they are written, as read() batches, and
+        None as a heartbeat when nothing was written for `heartbeat` seconds. Returns once
+        the buffer is closed and drained.
+        """
+        offset = since
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self._first + len(self._lines) > offset, heartbeat)
+                batch = self.read(offset)
+            if batch['lines']:
+                offset = batch['next_offset']
+                yield batch
+            elif batch['complete']:
+                return
+            else:
+                yield None
+
+
+class ProcessJob(Job):
+    """
+    A job running one process, whose merged output is kept in a LogBuffer and whose exit
+    status is reported once it ended.
+    """
+
+    def __init__(self, params: Optional[Dict[str, Any]], log_max_bytes: int) -> None:
+        super().__init__(params)
+        self.log = LogBuffer(log_max_bytes)
+        self.exit_code: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = super().to_dict()
+        data['exit_code'] = self.exit_code
+        data['log'] = {'lines': self.log.next_offset, 'complete': self.log.closed}
+        return data
+
+
+def pipe_reader(pipe: IO[bytes], poll_interval: float) -> Callable[[int], bytes]:
+    """
+    Return a recv(size) reading from the pipe of a subprocess like a socket with a
+    timeout: socket.timeout when nothing arrived within `poll_interval`, b'' on EOF.
+    """
+    def recv(size: int) -> bytes:
+        readable, _, _ = select.select([pipe], [], [], poll_interval)
+        if not readable:
+            raise socket.timeout()
+        return os.read(pipe.fileno(), size)
+    return recv
+
+
+def pump_output(recv: Callable[[int], bytes], on_data: Callable[[bytes], None], cancel_requested: threading.Event,
+                send_signal: Callable[[str], None], grace: float,
+                can_signal: Callable[[], bool] = lambda: True) -> bool:
+    """
+    Pass what `recv` reads to `on_data` until EOF, handling cancellation meanwhile.
+
+    A cancel request sends SIGINT through send_signal('INT'), then SIGKILL when the
+    output did not end within `grace` seconds. While can_signal() is False the signal is
+    held back, for a process whose ID is not known yet; the output is abandoned if that
+    lasts longer than `grace`.
+
+    Args:
+        recv: Reads up to n bytes, raising socket.timeout when idle and returning b'' on EOF.
+
+    Returns:
+        bool: True on EOF, False when the output was abandoned after SIGKILL or for lack
+              of something to signal.
+    """
+    cancelled_at: Optional[float] = None
+    interrupted_at: Optional[float] = None
+    while True:
+        if cancel_requested.is_set():
+            if cancelled_at is None:
+                cancelled_at = time.monotonic()
+            if not can_signal():
+                if time.monotonic() - cancelled_at > grace:
+                    return False
+            elif interrupted_at is None:
+                send_signal('INT')
+                interrupted_at = time.monotonic()
+            elif time.monotonic() - interrupted_at > grace:
+                send_signal('KILL')
+                return False
+        try:
+            data = recv(65536)
+        except socket.timeout:
+            continue
+        if not data:
+            return True
+        on_data(data)
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool and keeps them queryable by id until
+    `retention` seconds after they finished.
+    """
+
+    def __init__(self, max_concurrent: int, retention: float, name: str = 'jobs') -> None:
+        self.max_concurrent = max_concurrent
+        self.retention = retention
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=name)
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: Job) -> Job:
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self.executor.submit(self._execute, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            self._prune()
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel()
+        return job
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def _execute(self, job: Job) -> None:
+        if job.cancel_requested.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            succeeded = job.run()
+        except Exception as e:
+            job.error = str(e)
+            succeeded = False
+        if job.cancel_requested.is_set():
+            self._finish(job, CANCELLED)
+        else:
+            self._finish(job, SUCCEEDED if succeeded else FAILED)
+
+    @staticmethod
+    def _finish(job: Job, status: str) -> None:
+        job.finished_at = time.time()
+        job.status = status
+        job._done.set()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
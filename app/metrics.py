@@ -0,0 +1,296 @@
+# app/metrics.py
+import bisect
+from abc import ABC, abstractmethod
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Sequence, Tuple
+from flask import Flask, g, request
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        pass
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples are read from `collect` at scrape time, as (labels, value) pairs."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 collect: Callable[[], Iterable[Tuple[Dict[str, Any], float]]]) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        try:
+            collected = list(self.collect())
+        except Exception:
+            return []
+        return [f'{self.name}{_format_labels(self.labelnames, self._key(labels))} {_format_value(value)}'
+                for labels, value in collected if value is not None]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> [count per bucket (non cumulative, last is +Inf), sum]
+        self._values: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Holds the metrics of the process and renders them in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> Any:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def exposition(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'http_request_duration_seconds', 'Duration of the HTTP requests served, by route.', ['method', 'route', 'status']))
+REQUESTS_IN_FLIGHT = registry.register(Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being served, by route.', ['method', 'route']))
+OUTBOUND_DURATION = registry.register(Histogram(
+    'outbound_request_duration_seconds', 'Duration of the calls made to dependencies.',
+    ['dependency', 'operation', 'outcome']))
+OUTBOUND_IN_FLIGHT = registry.register(Gauge(
+    'outbound_requests_in_flight', 'Calls to dependencies currently in progress.', ['dependency']))
+
+
+class _OutboundCall:
+    __slots__ = ('outcome',)
+
+    def __init__(self) -> None:
+        self.outcome = 'success'
+
+
+@contextmanager
+def track_outbound(dependency: str, operation: str) -> Generator[_OutboundCall, None, None]:
+    """
+    Time a call to a dependency. The outcome is 'error' when the block raises; callers
+    reporting failures through return values set `call.outcome` themselves.
+    """
+    call = _OutboundCall()
+    OUTBOUND_IN_FLIGHT.inc(dependency=dependency)
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.outcome = 'error'
+        raise
+    finally:
+        OUTBOUND_IN_FLIGHT.dec(dependency=dependency)
+        OUTBOUND_DURATION.observe(time.perf_counter() - started, dependency=dependency, operation=operation,
+                                  outcome=call.outcome)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records the duration of every MongoDB command, as reported by the driver."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        OUTBOUND_DURATION.observe(event.duration_micros / 1e6, dependency='mongo', operation=event.command_name,
+                                  outcome='success')
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        OUTBOUND_DURATION.observe(event.duration_micros / 1e6, dependency='mongo', operation=event.command_name,
+                                  outcome='error')
+
+
+def _route() -> Tuple[str, str]:
+    # The URL rule rather than the path keeps the label set bounded
+    rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    return request.method, rule
+
+
+def init_app(app: Flask) -> None:
+    """
+    Time every request served by `app` and count those in flight, labelled by route.
+    """
+    @app.before_request
+    def _start_timer() -> None:
+        g._metrics_started = time.perf_counter()
+        method, route = _route()
+        REQUESTS_IN_FLIGHT.inc(method=method, route=route)
+
+    @app.after_request
+    def _record_status(response: Any) -> Any:
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _stop_timer(exception: Optional[BaseException]) -> None:
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return
+        method, route = _route()
+        REQUESTS_IN_FLIGHT.dec(method=method, route=route)
+        REQUEST_DURATION.observe(time.perf_counter() - started, method=method, route=route,
+                                 status=g.pop('_metrics_status', 500))
+
+
+def register_collectors(app: Flask, proxmox_api: Any, provisioning_pipeline: Any, playbook_runner: Any,
+                        terraform_runner: Any) -> None:
+    """
+    Expose the utilisation of the caches, pools and background workers as gauges.
+    """
+    from app.api.prometheus import dashboardProxmox
+    from app.ssh_pool import pool_stats
+    from app.api.ansible import catalog
+
+    def cache_stats() -> Iterable[Tuple[str, Dict[str, Any]]]:
+        yield 'proxmox', proxmox_api.cache.stats()
+        if dashboardProxmox._cache is not None:
+            yield 'prometheus', dashboardProxmox._cache.stats()
+        if catalog._catalog is not None:
+            yield 'playbooks', catalog._catalog.stats()
+        yield 'ansible_facts', playbook_runner.facts.stats()
+
+    registry.register(CallbackGauge(
+        'app_cache_entries', 'Entries held by the response caches.', ['cache'],
+        lambda: [({'cache': name}, stats['entries']) for name, stats in cache_stats()]))
+    registry.register(CallbackGauge(
+        'app_cache_hit_ratio', 'Hit ratio of the response caches since start.', ['cache'],
+        lambda: [({'cache': name}, stats['hit_ratio']) for name, stats in cache_stats()]))
+    registry.register(CallbackGauge(
+        'app_cache_bytes', 'Estimated memory held by the caches.', ['cache'],
+        lambda: [({'cache': name}, stats.get('bytes')) for name, stats in cache_stats()]))
+    registry.register(CallbackGauge(
+        'app_proxmox_tasks_active', 'Proxmox tasks being tracked until they finish.', [],
+        lambda: [({}, len(proxmox_api.task_tracker.list(active_only=True)))]))
+    registry.register(CallbackGauge(
+        'app_jobs_active', 'Background jobs queued or running, by job manager.', ['manager'],
+        lambda: [({'manager': 'provisioning'}, provisioning_pipeline.jobs.active_count()),
+                 ({'manager': 'playbook'}, playbook_runner.jobs.active_count()),
+                 ({'manager': 'terraform'}, terraform_runner.jobs.active_count())]))
+    registry.register(CallbackGauge(
+        'app_pool_size', 'Configured size of the outbound connection and worker pools.', ['pool'],
+        lambda: [({'pool': 'proxmox_http'}, app.config['PROXMOX_POOL_SIZE']),
+                 ({'pool': 'proxmox_async_http'}, app.config['PROXMOX_ASYNC_MAX_CONNECTIONS']),
+                 ({'pool': 'proxmox_workers'}, app.config['PROXMOX_MAX_WORKERS']),
+                 ({'pool': 'prometheus_workers'}, app.config['PROMETHEUS_MAX_WORKERS'])]))
+    registry.register(CallbackGauge(
+        'app_ssh_connections', 'Pooled SSH connections, by host and state.', ['host', 'state'],
+        lambda: [({'host': stats['host'], 'state': state}, stats[key]) for stats in pool_stats()
+                 for state, key in (('open', 'connections'), ('idle', 'idle'))]))
+    registry.register(CallbackGauge(
+        'app_ssh_leases', 'SSH connection leases in use, by host.', ['host'],
+        lambda: [({'host': stats['host']}, stats['leases']) for stats in pool_stats()]))
+    registry.register(CallbackGauge(
+        'app_live_metrics_samplers', 'Live dashboard samplers running, one per subscribed query set.', [],
+        lambda: [({}, dashboardProxmox._live.stats()['samplers'] if dashboardProxmox._live is not None else 0)]))
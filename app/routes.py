@@ -1,17 +1,28 @@
 # app/routes.py
-from flask import jsonify, redirect, request
-from app import app, proxmox_api, terraform_api, mongo
+from flask import Response, jsonify, redirect, request
+from app import (app, proxmox_api, async_proxmox_api, provisioning_pipeline, playbook_runner, playbook_results,
+                 terraform_api, terraform_runner, mongo)
+from app.streaming import sse_event, sse_comment, sse_response, stream_job_log
+from app.conditional import conditional_jsonify
+from app.metrics import registry
+from app.ssh_pool import pool_stats
 from app.api.ansible.ansible import Ansible
+from app.api.ansible.profiles import list_profiles
+from app.api.ansible.results import parse_time_arg
+from app.api.terraform.runner import working_dir_lock
 from flask_cors import CORS
 CORS(app)
 from dotenv import load_dotenv, set_key
+import datetime
+import hmac
 import os
 from app.api.userManagement.auth import Auth
 from app.api.userManagement.auth import User
 
 from app.api.prometheus.dashboardProxmox import (
     get_cpu_usage, get_memory_usage, get_disk_usage, get_network_usage,
-    get_system_load, get_uptime
+    get_system_load, get_uptime, get_snapshot, get_panel_range, get_cache_stats,
+    PANELS, stream_panels, panel_options
 )
 from app.api.userManagement.decorators import role_required
 from flask_jwt_extended import jwt_required ,  get_jwt_identity
@@ -130,34 +141,74 @@ def get_hosts_content():
         app.logger.info("User does not have admin privileges")
         return jsonify({"msg": "Forbidden"}), 403
 
-    hosts_path = app.config['INVENTORY_PATH']
-    ansible_instance = Ansible()
-    ansible_instance.ssh_connection.connect()
-    try:
-        stdin, stdout, stderr = ansible_instance.ssh_connection.client.exec_command(f"cat {hosts_path}")
-        content = stdout.read().decode()
-        return jsonify({'content': content}), 200
-    except Exception as e:
-        return jsonify({'error': f"Error retrieving hosts.ini content: {str(e)}"}), 500
-    finally:
-        ansible_instance.ssh_connection.disconnect()
+    success, content, status_code = Ansible().inventory_content()
+    if not success:
+        return jsonify({'error': f"Error retrieving hosts.ini content: {content}"}), status_code
+    return jsonify({'content': content}), 200
 
 @app.route('/modify-hosts', methods=['POST'])
 @jwt_required()
 @role_required('admin')
 def modify_hosts():
     new_content = request.json.get('new_content')
-    hosts_path = app.config['INVENTORY_PATH']
-    ansible_instance = Ansible()
-    ansible_instance.ssh_connection.connect()
-    try:
-        stdin, stdout, stderr = ansible_instance.ssh_connection.client.exec_command(f"echo '{new_content}' > {hosts_path}")
-        stdout.read()
-        return jsonify({'status': 'success'}), 200
-    except Exception as e:
-        return jsonify({'error': f"Error modifying hosts.ini content: {str(e)}"}), 500
-    finally:
-        ansible_instance.ssh_connection.disconnect()
+    success, message, status_code = Ansible().write_inventory(new_content)
+    if not success:
+        return jsonify({'error': f"Error modifying hosts.ini content: {message}"}), status_code
+    return jsonify({'status': 'success'}), 200
+
+def _inventory_response(result, success_code=200):
+    success, data, status_code = result
+    if not success:
+        return jsonify({'error': data}), status_code
+    return jsonify(data), success_code
+
+@app.route('/inventory/groups', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def inventory_groups_route():
+    return _inventory_response(Ansible().inventory_groups())
+
+@app.route('/inventory/groups/<group>', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def inventory_group_route(group):
+    return _inventory_response(Ansible().inventory_group(group))
+
+@app.route('/inventory/hosts', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def inventory_hosts_route():
+    return _inventory_response(Ansible().inventory_hosts(request.args.get('group')))
+
+@app.route('/inventory/hosts', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def add_inventory_host_route():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict) or not data.get('name'):
+        return jsonify({'error': 'name is required'}), 400
+    return _inventory_response(Ansible().add_inventory_host(data['name'], data.get('groups') or [], data.get('vars') or {}), 201)
+
+@app.route('/inventory/hosts/<host>', methods=['GET'])
+@jwt_required()
+@role_required('admin')
+def inventory_host_route(host):
+    return _inventory_response(Ansible().inventory_host(host))
+
+@app.route('/inventory/hosts/<host>', methods=['PATCH'])
+@jwt_required()
+@role_required('admin')
+def update_inventory_host_route(host):
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    return _inventory_response(Ansible().update_inventory_host(host, data.get('vars') or {}, data.get('remove_vars') or []))
+
+@app.route('/inventory/hosts/<host>', methods=['DELETE'])
+@jwt_required()
+@role_required('admin')
+def remove_inventory_host_route(host):
+    return _inventory_response(Ansible().remove_inventory_host(host, request.args.get('group')))
 
 @app.route('/delete-playbook/<playbook_name>', methods=['DELETE'])
 @jwt_required()
@@ -171,6 +222,14 @@ def list_playbooks():
     ansible_instance = Ansible()
     return jsonify(ansible_instance.list_playbooks())
 
+@app.route('/playbooks', methods=['GET'])
+@jwt_required()
+def playbook_catalog():
+    success, playbooks, status_code = Ansible().playbook_catalog()
+    if not success:
+        return jsonify({'error': 'Could not list playbooks'}), status_code
+    return jsonify(playbooks), 200
+
 @app.route('/modify-playbook/<playbook_name>', methods=['PUT'])
 @jwt_required()
 def modify_playbook(playbook_name):
@@ -184,20 +243,174 @@ def modify_playbook(playbook_name):
 @jwt_required()
 
 def execute_playbook(playbook_name):
-    ansible = Ansible()
-    return jsonify(ansible.execute_playbook(playbook_name))
+    ansible = Ansible(playbook_results)
+    result = ansible.execute_playbook(playbook_name, request.args.get('profile'))
+    return jsonify(result), result[2] or 200
+
+@app.route('/ssh/pool/stats', methods=['GET'])
+@jwt_required()
+def ssh_pool_stats():
+    return jsonify(pool_stats()), 200
+
+@app.route('/playbooks/sync', methods=['POST'])
+@jwt_required()
+@role_required('admin')
+def sync_playbooks_route():
+    prune = bool((request.get_json(silent=True) or {}).get('prune', False))
+    success, data, status_code = Ansible().sync_playbooks(prune=prune)
+    if not success:
+        return jsonify({'error': data}), status_code
+    return jsonify(data), 200
+
+@app.route('/ansible/profiles', methods=['GET'])
+@jwt_required()
+def ansible_profiles_route():
+    return jsonify(list_profiles(app.config)), 200
+
+@app.route('/ansible/facts/stats', methods=['GET'])
+@jwt_required()
+def fact_cache_stats_route():
+    return jsonify(playbook_runner.facts.stats()), 200
+
+@app.route('/ansible/facts', methods=['DELETE'])
+@jwt_required()
+@role_required('admin')
+def invalidate_all_facts_route():
+    success, data, status_code = Ansible().invalidate_facts()
+    if not success:
+        return jsonify({'error': data}), status_code
+    return jsonify({'cleared': data}), 200
+
+@app.route('/ansible/facts/<host>', methods=['DELETE'])
+@jwt_required()
+@role_required('admin')
+def invalidate_host_facts_route(host):
+    success, data, status_code = Ansible().invalidate_facts(host)
+    if not success:
+        return jsonify({'error': data}), status_code
+    return jsonify({'cleared': data}), 200
+
+@app.route('/ansible/control-hosts', methods=['GET'])
+@jwt_required()
+def ansible_control_hosts():
+    return jsonify(playbook_runner.scheduler.status()), 200
+
+@app.route('/playbooks/<playbook_name>/runs', methods=['POST'])
+@jwt_required()
+def run_playbook_route(playbook_name):
+    success, data, status_code = playbook_runner.submit(playbook_name, request.get_json(silent=True) or {})
+    if not success:
+        return jsonify({'error': data}), status_code
+    return jsonify(data), 202
+
+def _job_route(jobs, job_id, unknown):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': unknown}), 404
+    return jsonify(job.to_dict()), 200
+
+def _job_log_route(jobs, job_id, unknown):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': unknown}), 404
+    return jsonify(job.log.read(request.args.get('since', 0, type=int), request.args.get('limit', type=int))), 200
+
+def _job_stream_route(jobs, job_id, unknown):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': unknown}), 404
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+    return stream_job_log(job, since)
+
+def _job_cancel_route(jobs, job_id, unknown):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': unknown}), 404
+    return jsonify(job.to_dict()), 202
+
+@app.route('/playbook-runs', methods=['GET'])
+@jwt_required()
+def list_playbook_runs_route():
+    return jsonify(playbook_runner.list()), 200
+
+@app.route('/playbook-runs/<string:job_id>', methods=['GET'])
+@jwt_required()
+def playbook_run_route(job_id):
+    return _job_route(playbook_runner.jobs, job_id, 'Unknown run')
+
+@app.route('/playbook-runs/<string:job_id>/log', methods=['GET'])
+@jwt_required()
+def playbook_run_log_route(job_id):
+    return _job_log_route(playbook_runner.jobs, job_id, 'Unknown run')
+
+@app.route('/playbook-runs/<string:job_id>/stream', methods=['GET'])
+@jwt_required()
+def stream_playbook_run_route(job_id):
+    return _job_stream_route(playbook_runner.jobs, job_id, 'Unknown run')
+
+@app.route('/playbook-runs/<string:job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_playbook_run_route(job_id):
+    return _job_cancel_route(playbook_runner.jobs, job_id, 'Unknown run')
+
+def _results_window():
+    default = datetime.datetime.utcnow() - datetime.timedelta(days=7)
+    return parse_time_arg(request.args.get('since'), default), request.args.get('playbook')
+
+@app.route('/playbook-results', methods=['GET'])
+@jwt_required()
+def playbook_results_route():
+    filters = {key: request.args.get(key) for key in ('run_id', 'host', 'playbook', 'status', 'task')}
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(500, max(1, request.args.get('per_page', 50, type=int)))
+    try:
+        since = parse_time_arg(request.args.get('since'))
+        until = parse_time_arg(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(playbook_results.query(filters, since, until, page, per_page)), 200
+
+@app.route('/playbook-results/failures', methods=['GET'])
+@jwt_required()
+def playbook_failures_route():
+    try:
+        since, playbook = _results_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(500, max(1, request.args.get('limit', 50, type=int)))
+    return jsonify(playbook_results.failures_by_host(since, playbook, limit)), 200
+
+@app.route('/playbook-results/slowest-tasks', methods=['GET'])
+@jwt_required()
+def playbook_slowest_tasks_route():
+    try:
+        since, playbook = _results_window()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(500, max(1, request.args.get('limit', 20, type=int)))
+    return jsonify(playbook_results.slowest_tasks(since, playbook, limit)), 200
 
 # Proxmox routes
 @app.route('/login-proxmox')
 @jwt_required()
 def login_proxmox():
-    with proxmox_api.login_context('/access/ticket'):
-        return jsonify(proxmox_api.login('/access/ticket'))
+    return jsonify(proxmox_api.login('/access/ticket'))
 
 @app.route('/list-vms/<string:node>')
 @jwt_required()
 def list_vms(node):
-    return jsonify(proxmox_api.list_vms(f'/nodes/{node}/qemu'))
+    return conditional_jsonify(proxmox_api.list_vms(f'/nodes/{node}/qemu'))
+
+@app.route('/cluster/vms', methods=['GET'])
+@jwt_required()
+async def list_cluster_vms_route():
+    success, data, status_code = await async_proxmox_api.list_cluster_vms('/nodes')
+    if success:
+        return jsonify(data), 200
+    else:
+        return jsonify({'error': 'Failed to list cluster nodes', 'status_code': status_code}), status_code
 
 @app.route('/create-vm/<string:node>', methods=['POST'])
 @jwt_required()
@@ -224,14 +437,14 @@ def update_vm_route(node, vmid):
 @app.route('/vm-status/<string:node>/<int:vmid>', methods=['GET'])
 @jwt_required()
 def vm_status_route(node, vmid):
-    return jsonify(proxmox_api.get_vm_status(f'/nodes/{node}/qemu/{vmid}/status/current'))
+    return conditional_jsonify(proxmox_api.get_vm_status(f'/nodes/{node}/qemu/{vmid}/status/current'))
 
 @app.route('/proxmox/nodes/<string:node_name>/statistics', methods=['GET'])
 @jwt_required()
 def get_proxmox_node_statistics(node_name):
     success, data, status_code = proxmox_api.get_node_statistics(f'/nodes/{node_name}/status')
     if success:
-        return jsonify(data), 200
+        return conditional_jsonify(data)
     else:
         return jsonify({'error': 'Failed to retrieve node statistics', 'status': status_code}), status_code
 
@@ -253,24 +466,148 @@ def stop_vm_route(node, vmid):
     else:
         return jsonify({'error': 'Failed to stop VM', 'status_code': status_code}), status_code
 
-# Terraform routes
-@app.route('/terraform/init', methods=['GET'])
+@app.route('/vms/bulk', methods=['POST'])
+@jwt_required()
+async def bulk_vm_action_route():
+    data = request.json or {}
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'A non-empty list of operations is required'}), 400
+    if any(isinstance(operation, dict) and operation.get('action') == 'destroy' for operation in operations) \
+            and get_jwt_identity().get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    success, data, status_code = await async_proxmox_api.bulk_vm_action(operations, data.get('per_node_limit'))
+    if success:
+        return jsonify(data), 200
+    else:
+        return jsonify({'error': 'Failed to run bulk operation', 'status_code': status_code}), status_code
+
+@app.route('/provision/<string:node>', methods=['POST'])
+@jwt_required()
+def provision_vms_route(node):
+    spec = request.json
+    if not spec:
+        return jsonify({"error": "No data provided"}), 400
+    success, data, status_code = provisioning_pipeline.submit(node, spec)
+    if success:
+        return jsonify(data), 202
+    else:
+        return jsonify({'error': data}), status_code
+
+@app.route('/provision/jobs', methods=['GET'])
+@jwt_required()
+def list_provisioning_jobs_route():
+    return jsonify([job.to_dict() for job in provisioning_pipeline.jobs.list()]), 200
+
+@app.route('/provision/jobs/<string:job_id>', methods=['GET'])
+@jwt_required()
+def provisioning_job_route(job_id):
+    job = provisioning_pipeline.jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/provision/jobs/<string:job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_provisioning_job_route(job_id):
+    job = provisioning_pipeline.jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/proxmox/cache/stats', methods=['GET'])
+@jwt_required()
+def proxmox_cache_stats():
+    return jsonify(proxmox_api.cache.stats()), 200
+
+@app.route('/tasks', methods=['GET'])
+@jwt_required()
+def list_tasks_route():
+    active_only = request.args.get('active', 'false').lower() in ('1', 'true', 'yes')
+    return jsonify(proxmox_api.task_tracker.list(active_only=active_only)), 200
+
+@app.route('/tasks/<string:upid>', methods=['GET'])
+@jwt_required()
+def task_status_route(upid):
+    task = proxmox_api.task_tracker.get(upid)
+    if task is None:
+        return jsonify({'error': 'Unknown task'}), 404
+    return jsonify(task), 200
+
+@app.route('/tasks/<string:upid>/wait', methods=['GET'])
+@jwt_required()
+def wait_task_route(upid):
+    timeout = min(request.args.get('timeout', 30, type=float), app.config['PROXMOX_TASK_WAIT_MAX'])
+    task = proxmox_api.task_tracker.wait(upid, timeout)
+    if task is None:
+        return jsonify({'error': 'Unknown task'}), 404
+    return jsonify(task), 202 if task['status'] == 'running' else 200
+
+@app.route('/tasks/<string:upid>/stream', methods=['GET'])
+@jwt_required()
+def stream_task_route(upid):
+    if proxmox_api.task_tracker.get(upid) is None:
+        return jsonify({'error': 'Unknown task'}), 404
+    timeout = min(request.args.get('timeout', app.config['PROXMOX_TASK_WAIT_MAX'], type=float),
+                  app.config['PROXMOX_TASK_WAIT_MAX'])
+
+    def events():
+        for state in proxmox_api.task_tracker.watch(upid, timeout):
+            yield sse_event(state, event='status') if state is not None else sse_comment()
+
+    return sse_response(events())
+
+# Terraform routes, each command is queued as a background job
+def _submit_terraform(action):
+    success, data, status_code = terraform_runner.submit(action)
+    if not success:
+        return jsonify({'error': data}), status_code
+    return jsonify(data), 202
+
+@app.route('/terraform/init', methods=['GET', 'POST'])
 @jwt_required()
 def terraform_init():
-    result = terraform_api.init()
-    return jsonify(result)
+    return _submit_terraform('init')
+
+@app.route('/terraform/plan', methods=['POST'])
+@jwt_required()
+def terraform_plan():
+    return _submit_terraform('plan')
 
 @app.route('/terraform/apply', methods=['POST'])
 @jwt_required()
 def terraform_apply():
-    result = terraform_api.apply()
-    return jsonify(result)
+    return _submit_terraform('apply')
 
 @app.route('/terraform/destroy', methods=['POST'])
 @jwt_required()
 def terraform_destroy():
-    result = terraform_api.destroy()
-    return jsonify(result)
+    return _submit_terraform('destroy')
+
+@app.route('/terraform/jobs', methods=['GET'])
+@jwt_required()
+def terraform_jobs_route():
+    return jsonify(terraform_runner.list()), 200
+
+@app.route('/terraform/jobs/<string:job_id>', methods=['GET'])
+@jwt_required()
+def terraform_job_route(job_id):
+    return _job_route(terraform_runner.jobs, job_id, 'Unknown job')
+
+@app.route('/terraform/jobs/<string:job_id>/log', methods=['GET'])
+@jwt_required()
+def terraform_job_log_route(job_id):
+    return _job_log_route(terraform_runner.jobs, job_id, 'Unknown job')
+
+@app.route('/terraform/jobs/<string:job_id>/stream', methods=['GET'])
+@jwt_required()
+def stream_terraform_job_route(job_id):
+    return _job_stream_route(terraform_runner.jobs, job_id, 'Unknown job')
+
+@app.route('/terraform/jobs/<string:job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_terraform_job_route(job_id):
+    return _job_cancel_route(terraform_runner.jobs, job_id, 'Unknown job')
 
 @app.route('/terraform/config', methods=['GET'])
 @jwt_required()
@@ -289,43 +626,92 @@ def get_terraform_config():
 def update_terraform_config():
     data = request.json
     new_content = data.get('content')
+    # Never change the configuration under a running Terraform command
+    lock = working_dir_lock(terraform_api.working_dir)
+    if not lock.acquire(blocking=False):
+        return jsonify({'success': False, 'error': 'A Terraform command is running on this working directory'}), 409
     try:
         with open(os.path.join(terraform_api.working_dir, 'main.tf'), 'w') as file:
             file.write(new_content)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
+    finally:
+        lock.release()
+
+# Metrics of this service, in the Prometheus exposition format, served only once
+# INTERNAL_METRICS_TOKEN is set and then only to scrapers presenting it
+@app.route('/internal/metrics', methods=['GET'])
+def internal_metrics():
+    token = app.config['INTERNAL_METRICS_TOKEN']
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(registry.exposition(), mimetype='text/plain; version=0.0.4')
 
 # Prometheus metrics routes
 @app.route('/metrics/cpu', methods=['GET'])
 @jwt_required()
 def cpu_usage():
-    return get_cpu_usage()
+    return get_cpu_usage(request.args)
 
 @app.route('/metrics/memory', methods=['GET'])
 @jwt_required()
 def memory_usage():
-    return get_memory_usage()
+    return get_memory_usage(request.args)
 
 @app.route('/metrics/disk', methods=['GET'])
 @jwt_required()
 def disk_usage():
-    return get_disk_usage()
+    return get_disk_usage(request.args)
 
 @app.route('/metrics/network', methods=['GET'])
 @jwt_required()
 def network_usage():
-    return get_network_usage()
+    return get_network_usage(request.args)
 
 @app.route('/metrics/system_load', methods=['GET'])
 @jwt_required()
 def system_load():
-    return get_system_load()
+    return get_system_load(request.args)
 
 @app.route('/metrics/uptime', methods=['GET'])
 @jwt_required()
 def uptime():
-    return get_uptime()
+    return get_uptime(request.args)
+
+@app.route('/metrics/snapshot', methods=['GET'])
+@jwt_required()
+def metrics_snapshot():
+    panels = request.args.get('panels')
+    return get_snapshot(panels.split(',') if panels else None, request.args)
+
+@app.route('/metrics/stream', methods=['GET'])
+@jwt_required()
+def metrics_stream():
+    panels = request.args.get('panels')
+    panels = panels.split(',') if panels else list(PANELS)
+    filters, group, error = panel_options(panels, request.args)
+    if error:
+        return error
+    updates = stream_panels(panels, app.config['PROMETHEUS_LIVE_HEARTBEAT'], filters, group)
+
+    def events():
+        for update in updates:
+            yield sse_event(update[1], event=update[0]) if update is not None else sse_comment()
+
+    return sse_response(events())
+
+@app.route('/metrics/cache/stats', methods=['GET'])
+@jwt_required()
+def metrics_cache_stats():
+    return get_cache_stats()
+
+@app.route('/metrics/<string:panel>/range', methods=['GET'])
+@jwt_required()
+def metrics_range(panel):
+    return get_panel_range(panel, request.args)
 
 # User management
 @app.route('/users', methods=['GET'])
@@ -1,29 +1,102 @@
+import codecs
+import socket
 import paramiko
 from flask import current_app
+from app.metrics import track_outbound
+from app.ssh_pool import get_ssh_pool
 
 class SSHConnection:
-    def __init__(self):
-        self.hostname = current_app.config['SSH_HOSTNAME']
+    def __init__(self, hostname=None, port=None):
+        self.hostname = hostname or current_app.config['SSH_HOSTNAME']
         self.username = current_app.config['SSH_USERNAME']
         self.password = current_app.config['SSH_PASSWORD']
-        self.port = int(current_app.config['SSH_PORT'])
+        self.port = int(port or current_app.config['SSH_PORT'])
+        self.pool = get_ssh_pool(current_app.config, self.hostname, self.port, self.username, self.password)
         self.client = None
-        self.sftp = None
+        self._lease = None
+        self._sftp = None
+        self._broken = False
 
     def connect(self):
-        self.client = paramiko.SSHClient()
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self.client.connect(self.hostname, username=self.username, password=self.password, port=self.port)
-        self.sftp = self.client.open_sftp()
+        """Borrow a connection from the shared pool instead of opening a new one."""
+        if self._lease is None:
+            self._lease = self.pool.acquire()
+            self.client = self._lease.client
+            self._broken = False
 
     def disconnect(self):
-        if self.sftp:
-            self.sftp.close()
-        if self.client:
-            self.client.close()
+        """Give the connection back to the pool, keeping it and its SFTP session open."""
+        if self._lease is None:
+            return
+        if self._sftp is not None and not self._broken:
+            self._lease.checkin_sftp(self._sftp)
+        self.pool.release(self._lease, broken=self._broken)
+        self._lease = None
+        self._sftp = None
+        self.client = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.disconnect()
+
+    @property
+    def sftp(self):
+        if self._sftp is None and self._lease is not None:
+            self._sftp = self._guard(self._lease.checkout_sftp)
+        return self._sftp
+
+    def _guard(self, call, *args):
+        # Transport level failures mark the connection broken so the pool drops it
+        try:
+            return call(*args)
+        except (paramiko.SSHException, EOFError, socket.error):
+            self._broken = True
+            raise
 
     def upload_file(self, local_path, remote_path):
-        self.sftp.put(local_path, remote_path)
+        with track_outbound('ssh', 'upload'):
+            self._guard(self.sftp.put, local_path, remote_path)
 
+    def open_channel(self):
+        """Open a session channel on the leased transport, for commands streaming their output."""
+        return self._guard(self.client.get_transport().open_session)
 
+    def run(self, command):
+        """Run a command on the remote host and return (exit_status, stdout, stderr) once it completed."""
+        with track_outbound('ssh', 'exec') as call:
+            stdin, stdout, stderr = self._guard(self.client.exec_command, command)
+            output = stdout.read().decode()
+            error = stderr.read().decode()
+            exit_status = stdout.channel.recv_exit_status()
+            if exit_status != 0:
+                call.outcome = 'error'
+            return exit_status, output, error
 
+    def run_lines(self, command, on_line):
+        """
+        Run a command on the remote host, passing each line of stdout to on_line as soon as
+        it is read. Return (exit_status, stderr) once it completed.
+        """
+        with track_outbound('ssh', 'exec') as call:
+            stdin, stdout, stderr = self._guard(self.client.exec_command, command)
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            partial = ''
+            while True:
+                data = self._guard(stdout.channel.recv, 65536)
+                if not data:
+                    break
+                lines = (partial + decoder.decode(data)).split('\n')
+                partial = lines.pop()
+                for line in lines:
+                    on_line(line)
+            partial += decoder.decode(b'', final=True)
+            if partial:
+                on_line(partial)
+            error = stderr.read().decode(errors='replace')
+            exit_status = stdout.channel.recv_exit_status()
+            if exit_status != 0:
+                call.outcome = 'error'
+            return exit_status, error
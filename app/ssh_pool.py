@@ -0,0 +1,227 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import paramiko
+from app.metrics import track_outbound
+
+
+class PooledTransport:
+    """One authenticated SSH connection, shared by up to `max_channels` concurrent leases."""
+
+    def __init__(self, client: paramiko.SSHClient) -> None:
+        self.client = client
+        self.leases = 0
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._idle_sftp: List[paramiko.SFTPClient] = []
+        self._lock = threading.Lock()
+
+    @property
+    def transport(self) -> Optional[paramiko.Transport]:
+        return self.client.get_transport()
+
+    def healthy(self) -> bool:
+        transport = self.transport
+        if transport is None or not transport.is_active() or not transport.is_authenticated():
+            return False
+        try:
+            transport.send_ignore()  # Fails fast on a connection the server or a middlebox dropped
+        except Exception:
+            return False
+        return True
+
+    def checkout_sftp(self) -> paramiko.SFTPClient:
+        """Reuse an SFTP session opened by a previous lease, or open one on a new channel."""
+        with self._lock:
+            if self._idle_sftp:
+                return self._idle_sftp.pop()
+        return self.client.open_sftp()
+
+    def checkin_sftp(self, sftp: paramiko.SFTPClient) -> None:
+        with self._lock:
+            self._idle_sftp.append(sftp)
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._idle_sftp = self._idle_sftp, []
+        for sftp in sessions:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+        self.client.close()
+
+
+class SSHPool:
+    """
+    Bounded pool of keep-alive SSH connections to one host.
+
+    Leases are spread over the open connections, each lease opening its own channels on
+    a shared transport, and a new connection is only opened when every connection already
+    carries `max_channels` leases. Connections are health checked on checkout, and the
+    ones left idle longer than `max_idle` seconds are closed.
+    """
+
+    def __init__(self, hostname: str, port: int, username: str, password: Optional[str], max_size: int,
+                 max_channels: int, max_idle: float, keepalive: int, connect_timeout: float,
+                 checkout_timeout: float) -> None:
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.max_channels = max_channels
+        self.max_idle = max_idle
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.checkout_timeout = checkout_timeout
+        self._transports: List[PooledTransport] = []
+        self._connecting = 0
+        self._cond = threading.Condition()
+        self._reaper = threading.Thread(target=self._reap, name=f'ssh-pool-{hostname}', daemon=True)
+        self._reaper.start()
+
+    def acquire(self) -> PooledTransport:
+        """
+        Lease a healthy connection, opening one if the pool is not full yet.
+
+        Raises:
+            TimeoutError: When no connection frees up within `checkout_timeout` seconds.
+        """
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            pooled = None
+            with self._cond:
+                while True:
+                    available = [pooled for pooled in self._transports if pooled.leases < self.max_channels]
+                    if available:
+                        # The busiest connection that still has room keeps the others free to go idle
+                        pooled = max(available, key=lambda candidate: candidate.leases)
+                        pooled.leases += 1
+                        break
+                    if len(self._transports) + self._connecting < self.max_size:
+                        self._connecting += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f'No SSH connection to {self.hostname} available after {self.checkout_timeout}s')
+                    self._cond.wait(remaining)
+            if pooled is None:
+                break
+            # The health check is a network round trip: run it with the lease reserved
+            # but without holding the pool lock, so a stalled connection only stalls us
+            if pooled.healthy():
+                return pooled
+            with self._cond:
+                pooled.leases -= 1
+                if pooled in self._transports:
+                    self._discard(pooled)
+                self._cond.notify()
+
+        try:
+            pooled = PooledTransport(self._connect())
+        except BaseException:
+            with self._cond:
+                self._connecting -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._connecting -= 1
+            pooled.leases = 1
+            self._transports.append(pooled)
+            return pooled
+
+    def _connect(self) -> paramiko.SSHClient:
+        with track_outbound('ssh', 'connect'):
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(self.hostname, username=self.username, password=self.password, port=self.port,
+                           timeout=self.connect_timeout)
+            client.get_transport().set_keepalive(self.keepalive)
+            return client
+
+    def release(self, pooled: PooledTransport, broken: bool = False) -> None:
+        """Return a lease. A connection reported broken is closed instead of being reused."""
+        with self._cond:
+            pooled.leases -= 1
+            pooled.last_used = time.monotonic()
+            if broken and pooled in self._transports:
+                self._discard(pooled)
+            self._cond.notify()
+
+    def _discard(self, pooled: PooledTransport) -> None:
+        # Leases still running on a broken connection fail on their own and release it
+        self._transports.remove(pooled)
+        threading.Thread(target=pooled.close, daemon=True).start()
+
+    def _reap(self) -> None:
+        while True:
+            time.sleep(max(1.0, self.max_idle / 2))
+            self.evict_idle()
+
+    def evict_idle(self) -> int:
+        """Close the connections without lease for longer than `max_idle` seconds."""
+        now = time.monotonic()
+        with self._cond:
+            idle = [pooled for pooled in self._transports
+                    if pooled.leases == 0 and now - pooled.last_used > self.max_idle]
+            for pooled in idle:
+                self._discard(pooled)
+            return len(idle)
+
+    def close(self) -> None:
+        with self._cond:
+            for pooled in [pooled for pooled in self._transports if pooled.leases == 0]:
+                self._discard(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'host': self.hostname,
+                'connections': len(self._transports),
+                'leases': sum(pooled.leases for pooled in self._transports),
+                'idle': sum(1 for pooled in self._transports if pooled.leases == 0),
+                'max_size': self.max_size,
+                'max_channels': self.max_channels,
+            }
+
+
+_pools: Dict[Tuple[str, int, str], SSHPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_ssh_pool(config: Any, hostname: str, port: int, username: str, password: Optional[str]) -> SSHPool:
+    """
+    Return the process-wide pool of connections to hostname:port as username, creating it
+    on first use.
+
+    Args:
+        config: The application configuration holding the SSH_POOL_* settings.
+        hostname: Host to connect to.
+        port: SSH port.
+        username: Login user.
+        password: Login password.
+
+    Returns:
+        SSHPool: The shared pool for these credentials.
+    """
+    key = (hostname, port, username)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SSHPool(
+                hostname, port, username, password,
+                max_size=config['SSH_POOL_MAX_SIZE'],
+                max_channels=config['SSH_POOL_MAX_CHANNELS'],
+                max_idle=config['SSH_POOL_MAX_IDLE'],
+                keepalive=config['SSH_POOL_KEEPALIVE'],
+                connect_timeout=config['SSH_CONNECT_TIMEOUT'],
+                checkout_timeout=config['SSH_POOL_CHECKOUT_TIMEOUT'],
+            )
+        return pool
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
@@ -0,0 +1,55 @@
+# app/streaming.py
+import json
+from typing import Any, Iterable, Optional
+from flask import Response, stream_with_context
+
+
+def sse_event(data: Any, event: Optional[str] = None, event_id: Optional[Any] = None) -> str:
+    """
+    Format one Server-Sent Event.
+
+    Args:
+        data: JSON serialisable payload of the event.
+        event: Optional event name.
+        event_id: Optional event id, sent back by browsers as Last-Event-ID on reconnect.
+
+    Returns:
+        str: The encoded event, terminated by a blank line.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in json.dumps(data, default=str).splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_comment(text: str = 'keepalive') -> str:
+    """Format an SSE comment line, used as a heartbeat to keep idle connections open."""
+    return f": {text}\n\n"
+
+
+def sse_response(events: Iterable[str]) -> Response:
+    """
+    Wrap a generator of encoded events into a streaming text/event-stream response.
+    """
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+
+def stream_job_log(job: Any, since: int = 0) -> Response:
+    """
+    Stream the log of a job with a LogBuffer from offset `since`, one 'log' event per
+    batch of lines with the next offset as event id, then a final 'status' event once the
+    job finished.
+    """
+    def events():
+        for batch in job.log.follow(since):
+            yield sse_event(batch, event='log', event_id=batch['next_offset']) if batch is not None else sse_comment()
+        job.wait()
+        yield sse_event(job.to_dict(), event='status')
+
+    return sse_response(events())
@@ -2,11 +2,34 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import json
 import unittest
 from unittest.mock import MagicMock, patch
 from flask import Flask
 from app.api.ansible.ansible import Ansible
 from app import app
+from app.api.ansible.catalog import PlaybookCatalog
+from app.api.ansible.results import ResultRecorder
+
+def sftp_attr(filename, mtime, size, mode=0o100644):
+    return MagicMock(filename=filename, st_mtime=mtime, st_size=size, st_mode=mode)
+
+def sftp_with_files(files):
+    sftp = MagicMock()
+    sftp.listdir_attr.return_value = [sftp_attr(name, mtime, len(content)) for name, (mtime, content) in files.items()]
+
+    def stat(path):
+        mtime, content = files[os.path.basename(path)]
+        return sftp_attr(path, mtime, len(content))
+
+    def open_file(path, mode):
+        remote_file = MagicMock()
+        remote_file.__enter__.return_value.read.return_value = files[os.path.basename(path)][1].encode()
+        return remote_file
+
+    sftp.stat.side_effect = stat
+    sftp.open.side_effect = open_file
+    return sftp
 
 class TestAnsible(unittest.TestCase):
 
@@ -29,10 +52,54 @@ class TestAnsible(unittest.TestCase):
         self.assertEqual(message, "Playbook test.yml deployed successfully.")
 
     def test_execute_playbook(self):
-        self.ansible.ssh_connection.client.exec_command.return_value = (None, MagicMock(read=lambda: b'output'), MagicMock(read=lambda: b''))
+        def run_lines(command, on_line):
+            on_line('output')
+            return 0, ''
+
+        self.ansible.ssh_connection.run_lines.side_effect = run_lines
         success, output, status_code = self.ansible.execute_playbook('test.yml')
         self.assertTrue(success)
         self.assertEqual(output, 'output')
 
+    def test_execute_playbook_stores_results_while_running(self):
+        store = MagicMock()
+        store.recorder.side_effect = lambda run_id, playbook, host: ResultRecorder(store, run_id, playbook, host, batch_size=1)
+        self.ansible.results = store
+        event = json.dumps({'_event': 'v2_runner_on_ok', 'task': {'name': 'ping'}, 'hosts': {'web1': {}}})
+
+        def run_lines(command, on_line):
+            on_line(event)
+            # Stored before the run is over
+            self.assertEqual(store.insert.call_count, 1)
+            return 0, ''
+
+        self.ansible.ssh_connection.run_lines.side_effect = run_lines
+        success, output, status_code = self.ansible.execute_playbook('test.yml')
+        self.assertTrue(success)
+        self.assertEqual(output, 'ok: [web1]')
+        self.assertEqual(store.insert.call_args[0][0][0]['host'], 'web1')
+
+    def test_catalog_reads_only_changed_playbooks(self):
+        files = {'site.yml': (100, '- hosts: all\n- hosts: db\n'), 'notes.txt': (100, 'x'), 'web.yaml': (100, '- hosts: web\n')}
+        sftp = sftp_with_files(files)
+        catalog = PlaybookCatalog(max_bytes=10 ** 6)
+        listing = catalog.list(sftp, '/tmp/playbooks')
+        self.assertEqual([(playbook['name'], playbook['plays']) for playbook in listing], [('site.yml', 2), ('web.yaml', 1)])
+        self.assertEqual(sftp.open.call_count, 2)
+
+        files['web.yaml'] = (200, '- hosts: web\n- hosts: lb\n')
+        sftp.listdir_attr.return_value = [sftp_attr(name, mtime, len(content)) for name, (mtime, content) in files.items()]
+        catalog.list(sftp, '/tmp/playbooks')
+        self.assertEqual(sftp.open.call_count, 3)
+        content, parsed, error = catalog.get(sftp, '/tmp/playbooks/site.yml')
+        self.assertEqual((parsed, sftp.open.call_count), ([{'hosts': 'all'}, {'hosts': 'db'}], 3))
+
+    def test_playbook_detail_uses_catalog(self):
+        self.ansible.catalog = PlaybookCatalog(max_bytes=10 ** 6)
+        self.ansible.ssh_connection.sftp = sftp_with_files({'test.yml': (1, '- hosts: all\n')})
+        self.assertEqual(self.ansible.playbook_detail('test.yml'), (True, [{'hosts': 'all'}], None))
+        self.ansible.ssh_connection.sftp.stat.side_effect = FileNotFoundError
+        self.assertEqual(self.ansible.playbook_detail('missing.yml')[2], 404)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+import httpx
+from flask_jwt_extended import create_access_token
+from app import app
+from app.api.proxmox.async_proxmox import AsyncProxmoxAPI
+from app.api.proxmox.proxmox import ProxmoxAPI
+
+class TestAsyncProxmoxAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.requests = []
+        self.api = AsyncProxmoxAPI(self.app)
+        self.api.transport = httpx.MockTransport(self.handler)
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def handler(self, request):
+        path = request.url.path[len(httpx.URL(self.app.config['PROXMOX_URL']).path):]
+        self.requests.append((request.method, path))
+        if path == '/access/ticket':
+            return httpx.Response(200, json={'data': {'ticket': 't', 'CSRFPreventionToken': 'c'}})
+        if 'PVEAuthCookie' not in request.headers.get('cookie', ''):
+            return httpx.Response(401)
+        if path == '/nodes':
+            return httpx.Response(200, json={'data': [{'node': 'pve1', 'status': 'online'}, {'node': 'pve2', 'status': 'online'}]})
+        if path.endswith('/qemu'):
+            return httpx.Response(200, json={'data': [{'vmid': 100}]})
+        if path.endswith('/status/start'):
+            return httpx.Response(200, json={'data': 'UPID:pve1:0:0:0:qmstart:100:root@pam:'})
+        return httpx.Response(500)
+
+    def test_list_cluster_vms_logs_in_on_401(self):
+        success, data, status_code = asyncio.run(self.api.list_cluster_vms('/nodes'))
+        self.assertTrue(success)
+        self.assertEqual(len(data['vms']), 2)
+        self.assertEqual(self.requests[:3], [('GET', '/nodes'), ('POST', '/access/ticket'), ('GET', '/nodes')])
+
+    def test_bulk_vm_action_runs_on_the_shared_loop(self):
+        operations = [{'node': 'pve1', 'vmid': vmid, 'action': 'start'} for vmid in range(100, 120)]
+        self.api.run(self.api.login('/access/ticket'))
+        success, data, status_code = self.api.run(self.api.bulk_vm_action(operations, per_node_limit=3))
+        self.assertTrue(success)
+        self.assertEqual(data['succeeded'], 20)
+
+    def test_shares_the_cache_and_ticket_of_the_sync_client(self):
+        sync_api = ProxmoxAPI(self.app)
+        sync_api.session.request = MagicMock()
+        sync_api.session.request.return_value.json.return_value = {'data': {'ticket': 't', 'CSRFPreventionToken': 'c'}}
+        api = AsyncProxmoxAPI(self.app, cache=sync_api.cache, sync_api=sync_api)
+        api.transport = httpx.MockTransport(self.handler)
+
+        success, data, status_code = api.run(api.list_cluster_vms('/nodes'))
+        self.assertTrue(success)
+        self.assertEqual(len(data['vms']), 2)
+        # The 401 was answered by one login of the sync client, never by the async client itself
+        self.assertEqual(sync_api.session.request.call_count, 1)
+        self.assertNotIn(('POST', '/access/ticket'), self.requests)
+
+        served = len(self.requests)
+        api.run(api.list_cluster_vms('/nodes'))
+        self.assertEqual(len(self.requests), served)
+        self.assertGreaterEqual(sync_api.cache.stats()['hits'], 3)
+
+    def test_async_cluster_route(self):
+        import app as app_module
+        original = app_module.routes.async_proxmox_api
+        app_module.routes.async_proxmox_api = self.api
+        try:
+            token = create_access_token(identity={'user_id': '1', 'role': 'user'})
+            response = self.app.test_client().get('/cluster/vms', headers={'Authorization': f'Bearer {token}'})
+        finally:
+            app_module.routes.async_proxmox_api = original
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['nodes']['pve2']['vms'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock
+from flask_jwt_extended import create_access_token
+from app import app, proxmox_api
+
+class TestConditionalRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        token = create_access_token(identity={'user_id': '1', 'role': 'user'})
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.original_session = proxmox_api.session
+        proxmox_api.session = MagicMock()
+        proxmox_api.session.request.return_value.json.return_value = {'data': {'cpu': 0.25, 'uptime': 42}}
+        proxmox_api.cache.clear()
+
+    def tearDown(self):
+        proxmox_api.session = self.original_session
+        proxmox_api.cache.clear()
+        self.app_context.pop()
+
+    def test_matching_etag_returns_304(self):
+        first = self.client.get('/proxmox/nodes/pve1/statistics', headers=self.headers)
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        second = self.client.get('/proxmox/nodes/pve1/statistics', headers=dict(self.headers, **{'If-None-Match': etag}))
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+
+    def test_changed_content_gets_a_new_etag(self):
+        first = self.client.get('/vm-status/pve1/100', headers=self.headers)
+        proxmox_api.cache.clear()
+        proxmox_api.session.request.return_value.json.return_value = {'data': {'status': 'stopped'}}
+        second = self.client.get('/vm-status/pve1/100', headers=dict(self.headers, **{'If-None-Match': first.headers['ETag']}))
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first.headers['ETag'], second.headers['ETag'])
+
+if __name__ == '__main__':
+    unittest.main()
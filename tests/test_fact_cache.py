@@ -0,0 +1,77 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from flask_jwt_extended import create_access_token
+from app import app
+from app.api.ansible.facts import FactCache
+from app.api.ansible.results import ResultRecorder
+from app.api.ansible.runner import playbook_command
+
+class TestFactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FactCache('/var/cache/facts', ttl=600)
+
+    def test_runs_are_configured_for_smart_gathering(self):
+        command = playbook_command('/srv/playbooks', '/srv/hosts', 'site.yml', {}, self.cache.environment())
+        self.assertIn('ANSIBLE_GATHERING=smart ANSIBLE_CACHE_PLUGIN=jsonfile '
+                      'ANSIBLE_CACHE_PLUGIN_CONNECTION=/var/cache/facts ANSIBLE_CACHE_PLUGIN_TIMEOUT=600 '
+                      'ansible-playbook -i /srv/hosts site.yml', command)
+
+    def test_recorder_reports_the_hosts_facts_were_gathered_for(self):
+        recorder = ResultRecorder(None, 'run1', 'site.yml', 'ctl1')
+        recorder.feed(json.dumps({'_event': 'v2_runner_on_ok', 'task': {'name': 'Gathering Facts'}, 'hosts': {'web1': {}}}))
+        recorder.feed(json.dumps({'_event': 'v2_runner_on_ok', 'task': {'name': 'ping'}, 'hosts': {'web2': {}}}))
+        self.assertEqual(recorder.gathered, {'web1'})
+
+    def test_hits_are_hosts_gathered_within_the_ttl(self):
+        with patch('app.api.ansible.facts.time.time', return_value=1000):
+            self.cache.record('ctl1', ['web1', 'web2'], ['web1', 'web2'])
+        with patch('app.api.ansible.facts.time.time', return_value=1300):
+            self.cache.record('ctl1', ['web1', 'web2', 'web3'], ['web3'])
+            # Facts gathered on another control host are not in this one's cache
+            self.cache.record('ctl2', ['web1'], [])
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 3))
+        self.cache.forget('web1')
+        with patch('app.api.ansible.facts.time.time', return_value=1400):
+            self.cache.record('ctl1', ['web1', 'web2'], [])
+            self.assertEqual(self.cache.stats()['hit_ratio'], round(3 / 6, 4))
+        with patch('app.api.ansible.facts.time.time', return_value=2000):
+            self.cache.record('ctl1', ['web2'], [])
+        self.assertEqual(self.cache.hits, 3)
+
+    def test_invalidation_removes_cached_entries(self):
+        self.assertEqual(FactCache('~/.ansible/fact_cache', 600).remove_command('web1'),
+                         'rm -f -- "$HOME"/.ansible/fact_cache/web1')
+        self.assertEqual(self.cache.remove_command(), 'rm -rf -- /var/cache/facts/*')
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, 'nested'))
+            for name in ('web1', 'web2', os.path.join('nested', 'db1')):
+                open(os.path.join(directory, name), 'w').close()
+            cache = FactCache(directory, 600)
+            cache.remove_local('web1')
+            self.assertEqual(sorted(os.listdir(directory)), ['nested', 'web2'])
+            cache.remove_local()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_invalidation_routes_require_the_admin_role(self):
+        client = app.test_client()
+        with app.test_request_context():
+            tokens = {role: create_access_token(identity={'user_id': '1', 'role': role}) for role in ('user', 'admin')}
+        with patch('app.routes.Ansible') as ansible:
+            ansible.return_value.invalidate_facts.return_value = (True, 1, None)
+            for url in ('/ansible/facts', '/ansible/facts/web1'):
+                response = client.delete(url, headers={'Authorization': f'Bearer {tokens["user"]}'})
+                self.assertEqual(response.status_code, 403, url)
+            ansible.return_value.invalidate_facts.assert_not_called()
+            response = client.delete('/ansible/facts/web1', headers={'Authorization': f'Bearer {tokens["admin"]}'})
+        self.assertEqual(response.status_code, 200)
+        ansible.return_value.invalidate_facts.assert_called_once_with('web1')
+
+if __name__ == '__main__':
+    unittest.main()
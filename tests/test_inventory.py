@@ -0,0 +1,205 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import io
+import stat
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from flask_jwt_extended import create_access_token
+from app import app
+from app.api.ansible.inventory import Inventory, InventoryCache, check_host_entry
+
+HOSTS = """# lab inventory
+bastion ansible_host=10.0.0.1
+
+[web]
+web1 ansible_host=10.0.0.11   ansible_user=ubuntu
+web2 ansible_host=10.0.0.12
+; spare capacity
+
+[db]
+db1
+
+[web:vars]
+http_port=8080
+
+[linux:children]
+web
+db
+"""
+
+def remote_file(files, path):
+    handle = MagicMock()
+    handle.__enter__.return_value.read.side_effect = lambda: files[path].encode()
+    handle.__enter__.return_value.write.side_effect = lambda data: files.__setitem__(path, data.decode())
+    return handle
+
+def fake_sftp(files):
+    sftp = MagicMock()
+    sftp.stat.side_effect = lambda path: MagicMock(st_mtime=len(files[path]), st_size=len(files[path]), st_mode=0o100640)
+    sftp.open.side_effect = lambda path, mode: remote_file(files, path)
+    sftp.posix_rename.side_effect = lambda source, target: files.__setitem__(target, files.pop(source))
+    return sftp
+
+class LocalSFTP:
+    """The SFTP calls the inventory cache makes, served from the local filesystem."""
+
+    def stat(self, path):
+        attr = os.stat(path)
+        return MagicMock(st_mtime=int(attr.st_mtime), st_size=attr.st_size, st_mode=attr.st_mode)
+
+    def open(self, path, mode):
+        handle = open(path, mode)
+        handle.prefetch = lambda size=None: None
+        return handle
+
+class LocalSSH:
+    """Runs remote commands with the local shell."""
+
+    def __init__(self):
+        self.sftp = LocalSFTP()
+        self.commands = []
+
+    def run(self, command):
+        self.commands.append(command)
+        process = subprocess.run(['sh', '-c', command], capture_output=True, text=True)
+        return process.returncode, process.stdout, process.stderr
+
+class TestInventory(unittest.TestCase):
+
+    def test_parse_groups_hosts_and_vars(self):
+        inventory = Inventory.parse(HOSTS)
+        self.assertEqual(inventory.render(), HOSTS)
+        self.assertEqual(inventory.hosts('web'), ['web1', 'web2'])
+        self.assertEqual(inventory.group('web')['vars'], {'http_port': '8080'})
+        self.assertEqual(inventory.group('linux')['children'], ['web', 'db'])
+        self.assertEqual(inventory.host('web1'), {'name': 'web1', 'groups': ['web'],
+                                                  'vars': {'ansible_host': '10.0.0.11', 'ansible_user': 'ubuntu'}})
+        self.assertEqual(inventory.host('bastion')['groups'], ['ungrouped'])
+
+    def test_edits_only_touch_the_edited_lines(self):
+        inventory = Inventory.parse(HOSTS)
+        inventory.add_host('web3', ['web', 'cache'], {'ansible_host': '10.0.0.13'})
+        inventory.update_host('web1', {'ansible_port': '2222'}, ['ansible_user'])
+        inventory.remove_host('db1')
+        lines = inventory.render().splitlines()
+        self.assertEqual(lines[4:8], ['web1 ansible_host=10.0.0.11 ansible_port=2222', 'web2 ansible_host=10.0.0.12',
+                                      'web3 ansible_host=10.0.0.13', '; spare capacity'])
+        self.assertNotIn('db1', lines)
+        self.assertEqual(lines[-2:], ['[cache]', 'web3 ansible_host=10.0.0.13'])
+        self.assertEqual(inventory.host('web3')['groups'], ['cache', 'web'])
+        with self.assertRaises(ValueError):
+            inventory.add_host('web3', ['web'], {})
+
+    def test_cache_revalidates_and_writes_back_atomically(self):
+        files = {'/etc/ansible/hosts': HOSTS}
+        sftp = fake_sftp(files)
+        cache = InventoryCache()
+        cache.get(sftp, '/etc/ansible/hosts')
+        cache.get(sftp, '/etc/ansible/hosts')
+        self.assertEqual((cache.hits, cache.misses, sftp.open.call_count), (1, 1, 1))
+
+        cache.write(sftp, '/etc/ansible/hosts', HOSTS.replace('web2 ansible_host=10.0.0.12\n', ''))
+        self.assertNotIn('web2', files['/etc/ansible/hosts'])
+        self.assertEqual(list(files), ['/etc/ansible/hosts'])
+        temporary = sftp.posix_rename.call_args[0][0]
+        self.assertTrue(temporary.startswith('/etc/ansible/.hosts.'))
+        sftp.chmod.assert_called_once_with(temporary, 0o640)
+        # The written inventory is cached, no download follows the write
+        self.assertEqual(cache.get(sftp, '/etc/ansible/hosts').hosts('web'), ['web1'])
+        self.assertEqual(sftp.open.call_count, 2)
+
+    def test_edit_splices_only_the_changed_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hosts')
+            with open(path, 'w', newline='') as inventory_file:
+                inventory_file.write(HOSTS.replace('web2', '  web2').replace('\n', '\r\n'))
+            os.chmod(path, 0o640)
+            ssh = LocalSSH()
+            cache = InventoryCache()
+
+            result = cache.edit(ssh, path, lambda inventory: inventory.update_host('web2', {'ansible_port': '2222'}, []))
+            self.assertTrue(result)
+            command = ssh.commands[-1]
+            self.assertIn('ansible_port=2222', command)
+            self.assertNotIn('bastion', command)
+            with open(path, newline='') as inventory_file:
+                self.assertEqual(inventory_file.read(), HOSTS.replace(
+                    'web2 ansible_host=10.0.0.12', '  web2 ansible_host=10.0.0.12 ansible_port=2222').replace('\n', '\r\n'))
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+            self.assertEqual(os.listdir(directory), ['hosts'])
+            # The edited inventory is cached, no download follows the edit
+            cache.get(ssh.sftp, path)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_edit_retries_once_when_the_file_changed_remotely(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hosts')
+            with open(path, 'w') as inventory_file:
+                inventory_file.write(HOSTS)
+            ssh = LocalSSH()
+            cache = InventoryCache()
+            calls = []
+
+            def change(inventory):
+                if not calls:
+                    with open(path, 'a') as inventory_file:
+                        inventory_file.write('[extra]\nextra1\n')
+                calls.append(inventory)
+                return inventory.remove_host('db1')
+
+            cache.edit(ssh, path, change)
+            self.assertEqual(len(calls), 2)
+            with open(path) as inventory_file:
+                content = inventory_file.read()
+            self.assertIn('extra1', content)
+            self.assertNotIn('db1\n', content)
+            self.assertEqual(cache.misses, 2)
+
+    def test_inventory_routes_require_the_admin_role(self):
+        client = app.test_client()
+        with app.test_request_context():
+            tokens = {role: create_access_token(identity={'user_id': '1', 'role': role}) for role in ('user', 'admin')}
+        with patch('app.routes.Ansible') as ansible:
+            ansible.return_value.inventory_groups.return_value = (True, [], None)
+            ansible.return_value.inventory_group.return_value = (True, {}, None)
+            ansible.return_value.inventory_hosts.return_value = (True, [], None)
+            ansible.return_value.inventory_host.return_value = (True, {}, None)
+            for url in ('/inventory/groups', '/inventory/groups/web', '/inventory/hosts', '/inventory/hosts/web1'):
+                response = client.get(url, headers={'Authorization': f'Bearer {tokens["user"]}'})
+                self.assertEqual(response.status_code, 403, url)
+                response = client.get(url, headers={'Authorization': f'Bearer {tokens["admin"]}'})
+                self.assertEqual(response.status_code, 200, url)
+
+    def test_host_entries_that_would_break_out_of_their_line_are_rejected(self):
+        self.assertIsNone(check_host_entry('web3.lab', ['web', 'cache_1'], {'ansible_port': 2222}))
+        self.assertIsNone(check_host_entry(variables={'http_port': '80'}, remove=['ansible_user']))
+        self.assertIn('groups', check_host_entry('web3', 'db'))
+        self.assertIn('host name', check_host_entry('web3\n[all:vars]\nansible_ssh_common_args=-oProxyCommand=x'))
+        self.assertIn('host name', check_host_entry('web3 ansible_host=evil'))
+        self.assertIn('group name', check_host_entry('web3', ['web]\n[all:vars']))
+        self.assertIn('vars', check_host_entry('web3', [], ['ansible_port']))
+        self.assertIn('variable name', check_host_entry('web3', [], {'a=b': '1'}))
+        self.assertIn('single-line', check_host_entry('web3', [], {'note': 'a\n[all:vars]'}))
+        self.assertIn('variable name', check_host_entry(remove=['x y']))
+
+    def test_invalid_host_entries_get_a_400(self):
+        client = app.test_client()
+        with app.test_request_context():
+            token = create_access_token(identity={'user_id': '1', 'role': 'admin'})
+        headers = {'Authorization': f'Bearer {token}'}
+        with patch('app.routes.Ansible.__init__', return_value=None), \
+                patch('app.api.ansible.ansible.Ansible._edit_inventory') as edit:
+            response = client.post('/inventory/hosts', json={'name': 'web3', 'groups': 'db'}, headers=headers)
+            self.assertEqual(response.status_code, 400)
+            response = client.patch('/inventory/hosts/web1', json={'vars': {'x': 'a\nb'}}, headers=headers)
+            self.assertEqual(response.status_code, 400)
+            response = client.patch('/inventory/hosts/web1', json=['x'], headers=headers)
+            self.assertEqual(response.status_code, 400)
+        edit.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
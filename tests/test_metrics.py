@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import patch
+from app import app
+from app.metrics import Histogram, track_outbound
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.client = self.app.test_client()
+        self.addCleanup(self.app.config.__setitem__, 'INTERNAL_METRICS_TOKEN', self.app.config['INTERNAL_METRICS_TOKEN'])
+        self.app.config['INTERNAL_METRICS_TOKEN'] = 'secret'
+        self.auth = {'Authorization': 'Bearer secret'}
+
+    def test_histogram_exposition_is_cumulative(self):
+        histogram = Histogram('test_duration_seconds', 'Test.', ['route'], buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, route='/a')
+        self.assertEqual(histogram.samples(), [
+            'test_duration_seconds_bucket{route="/a",le="0.1"} 1',
+            'test_duration_seconds_bucket{route="/a",le="1.0"} 2',
+            'test_duration_seconds_bucket{route="/a",le="+Inf"} 3',
+            'test_duration_seconds_sum{route="/a"} 5.55',
+            'test_duration_seconds_count{route="/a"} 3',
+        ])
+
+    def test_requests_and_outbound_calls_are_exposed(self):
+        self.client.get('/internal/metrics', headers=self.auth)
+        with self.assertRaises(RuntimeError):
+            with track_outbound('ssh', 'connect'):
+                raise RuntimeError('unreachable')
+        body = self.client.get('/internal/metrics', headers=self.auth).get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/internal/metrics",status="200"}', body)
+        self.assertIn('outbound_request_duration_seconds_count{dependency="ssh",operation="connect",outcome="error"} 1', body)
+        self.assertIn('app_cache_entries{cache="proxmox"}', body)
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get('/internal/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/internal/metrics', headers=self.auth).status_code, 200)
+        self.app.config['INTERNAL_METRICS_TOKEN'] = None
+        self.assertEqual(self.client.get('/internal/metrics', headers=self.auth).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import datetime
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+from flask_jwt_extended import create_access_token
+from app import app
+from app.api.ansible.results import PlaybookResultStore, ResultRecorder
+
+def event(name, **fields):
+    return json.dumps(dict(fields, _event=name))
+
+TASK = {'name': 'install nginx', 'id': 't1',
+        'duration': {'start': '2024-05-01T10:00:00.000000Z', 'end': '2024-05-01T10:00:02.500000Z'}}
+
+class TestPlaybookResults(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = MagicMock()
+        self.store = PlaybookResultStore(self.collection, batch_size=2, flush_interval=3600)
+
+    def test_events_become_per_host_documents_in_batches(self):
+        recorder = self.store.recorder('run1', 'site.yml', 'ctl1')
+        display = [recorder.feed(line) for line in [
+            '[WARNING]: no inventory',
+            event('v2_playbook_on_play_start', play={'name': 'web'}),
+            event('v2_playbook_on_task_start', task={'name': 'install nginx'}),
+            event('v2_runner_on_ok', task=TASK, hosts={'web1': {'changed': True, 'action': 'apt'}}),
+            event('v2_runner_on_failed', task=TASK, hosts={'web2': {'msg': 'no package'}}),
+            event('v2_runner_on_unreachable', task=TASK, hosts={'web3': {'msg': 'timeout'}}),
+        ]]
+        self.assertEqual(display, ['[WARNING]: no inventory', 'PLAY [web] ***', 'TASK [install nginx] ***',
+                                   'changed: [web1]', 'failed: [web2] => no package', 'unreachable: [web3] => timeout'])
+        # The first two results were flushed together once the batch was full
+        self.collection.insert_many.assert_called_once()
+        first = self.collection.insert_many.call_args[0][0]
+        self.assertEqual([doc['status'] for doc in first], ['changed', 'failed'])
+        self.assertEqual((first[0]['play'], first[0]['duration']), ('web', 2.5))
+        self.assertEqual(first[0]['timestamp'], datetime.datetime(2024, 5, 1, 10, 0, 2, 500000))
+        self.collection.create_indexes.assert_called_once()
+        recorder.flush()
+        self.assertEqual(recorder.recorded, 3)
+        self.assertEqual(self.collection.insert_many.call_count, 2)
+
+    def test_store_errors_do_not_escape(self):
+        self.collection.insert_many.side_effect = Exception('down')
+        recorder = ResultRecorder(self.store, 'run1', 'site.yml', 'ctl1', batch_size=1)
+        recorder.feed(event('v2_runner_on_ok', task=TASK, hosts={'web1': {}}))
+        self.assertEqual(recorder.recorded, 0)
+        self.assertIn('down', recorder.error)
+
+    def test_failures_by_host_counts_failed_and_unreachable(self):
+        since = datetime.datetime(2024, 5, 1)
+        self.store.failures_by_host(since, 'site.yml')
+        pipeline = self.collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0]['$match'], {'playbook': 'site.yml', 'timestamp': {'$gte': since},
+                                                 'status': {'$in': ['failed', 'unreachable']}})
+        self.assertEqual(pipeline[1]['$group']['_id'], '$host')
+
+    def test_query_limits_are_clamped(self):
+        client = app.test_client()
+        with app.test_request_context():
+            token = create_access_token(identity={'user_id': '1', 'role': 'user'})
+        headers = {'Authorization': f'Bearer {token}'}
+        with patch('app.routes.playbook_results') as store:
+            store.failures_by_host.return_value = []
+            store.slowest_tasks.return_value = []
+            self.assertEqual(client.get('/playbook-results/failures?limit=-1', headers=headers).status_code, 200)
+            self.assertEqual(client.get('/playbook-results/slowest-tasks?limit=100000', headers=headers).status_code, 200)
+        self.assertEqual(store.failures_by_host.call_args[0][2], 1)
+        self.assertEqual(store.slowest_tasks.call_args[0][2], 500)
+
+if __name__ == '__main__':
+    unittest.main()
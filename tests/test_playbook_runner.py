@@ -0,0 +1,265 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import shlex
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from app import app
+from app.api.ansible.local import LocalExecutor, _private_dir, execution_backend, get_local_executor
+from app.api.ansible.runner import PlaybookRunner, playbook_command
+from app.api.ansible.scheduler import ControlHostScheduler, parse_control_hosts
+from app.jobs import CANCELLED, SUCCEEDED
+
+def fake_channel(chunks, exit_status=0):
+    channel = MagicMock()
+    def recv(size):
+        if not chunks:
+            raise socket.timeout()
+        return chunks.pop(0)
+    channel.recv.side_effect = recv
+    channel.recv_exit_status.return_value = exit_status
+    return channel
+
+class TestPlaybookRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.app.config['REMOTE_PLAYBOOKS_DIR'] = '/tmp/playbooks'
+        self.app.config['INVENTORY_PATH'] = '/tmp/inventory'
+        self.runner = PlaybookRunner(self.app)
+        patcher = patch('app.api.ansible.scheduler.SSHConnection')
+        self.mock_ssh = patcher.start().return_value.__enter__.return_value
+        self.addCleanup(patcher.stop)
+
+    def test_command_quotes_user_options(self):
+        command = playbook_command('/srv/playbooks', '/srv/hosts', 'site.yml', {'limit': 'web; rm -rf /', 'check': True})
+        self.assertEqual(command, "cd /srv/playbooks && exec setsid -w sh -c 'echo $$ && exec env PYTHONUNBUFFERED=1 "
+                                  "ANSIBLE_STDOUT_CALLBACK=ansible.posix.jsonl ansible-playbook -i /srv/hosts site.yml "
+                                  "--limit '\"'\"'web; rm -rf /'\"'\"' --check'")
+
+    def test_run_streams_output_into_the_log(self):
+        self.mock_ssh.open_channel.return_value = fake_channel([b'4242\nPLAY [all]', b' ***\nok: [h\xc3', b'\xa91]\n', b''])
+        success, data, status_code = self.runner.submit('site.yml', {'limit': 'web'})
+        self.assertTrue(success)
+        job = self.runner.jobs.get(data['id'])
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, SUCCEEDED)
+        self.assertEqual((job.pid, job.exit_code), (4242, 0))
+        self.assertEqual(job.log.read()['lines'], ['PLAY [all] ***', 'ok: [hé1]'])
+        self.assertEqual(job.log.read(1)['lines'], ['ok: [hé1]'])
+        self.assertEqual(job.log.read(-5, -1), {'offset': 0, 'lines': [], 'next_offset': 0, 'dropped': 0, 'complete': True})
+
+    def test_cancel_interrupts_the_remote_process(self):
+        self.app.config['ANSIBLE_RUN_CANCEL_GRACE'] = 0
+        self.addCleanup(self.app.config.__setitem__, 'ANSIBLE_RUN_CANCEL_GRACE', 10)
+        self.mock_ssh.open_channel.return_value = fake_channel([b'77\nTASK [long]\n'])
+        success, data, status_code = self.runner.submit('site.yml', {})
+        job = self.runner.jobs.get(data['id'])
+        while job.log.next_offset < 1:
+            job.wait(0.01)
+        self.runner.jobs.cancel(job.id)
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, CANCELLED)
+        self.assertEqual([call[0][0] for call in self.mock_ssh.run.call_args_list], ['kill -INT -- -77', 'kill -KILL -- -77'])
+
+    def test_cancel_before_the_pid_is_read_signals_once_it_arrives(self):
+        chunks = []
+        channel = self.mock_ssh.open_channel.return_value = fake_channel(chunks)
+        success, data, status_code = self.runner.submit('site.yml', {})
+        job = self.runner.jobs.get(data['id'])
+        while not channel.exec_command.called:
+            job.wait(0.01)
+        self.runner.jobs.cancel(job.id)
+        job.wait(0.2)
+        self.mock_ssh.run.assert_not_called()
+        chunks.extend([b'88\n', b''])
+        self.assertTrue(job.wait(5))
+        self.assertEqual(self.mock_ssh.run.call_args_list[0][0][0], 'kill -INT -- -88')
+
+    def test_invalid_playbook_name_is_rejected(self):
+        self.assertEqual(self.runner.submit('../etc/passwd', {})[2], 400)
+
+    def test_profile_settings_reach_the_command(self):
+        channel = self.mock_ssh.open_channel.return_value = fake_channel([b'1\n', b''])
+        success, data, status_code = self.runner.submit('site.yml', {'profile': 'fast', 'forks': 80})
+        self.assertTrue(self.runner.jobs.get(data['id']).wait(5))
+        command = shlex.split(channel.exec_command.call_args[0][0])[-1]
+        self.assertIn('ANSIBLE_PIPELINING=True ANSIBLE_STRATEGY=free', command)
+        self.assertIn("ANSIBLE_SSH_ARGS='-o ControlMaster=auto -o ControlPersist=300s'", command)
+        self.assertIn('ANSIBLE_FORKS=80', command)
+        self.assertNotIn('ANSIBLE_HOST_KEY_CHECKING', command)
+        self.assertEqual(self.runner.submit('site.yml', {'profile': 'reckless'})[2], 400)
+        self.assertEqual(self.runner.submit('site.yml', {'forks': 0})[2], 400)
+
+
+class TestControlHostScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.app.config['REMOTE_PLAYBOOKS_DIR'] = '/tmp/playbooks'
+        self.app.config['INVENTORY_PATH'] = '/tmp/inventory'
+        self.scheduler = ControlHostScheduler(self.app, [('ctl1', 22), ('ctl2', 22), ('ctl3', 2222)], 2, 60)
+        patcher = patch('app.api.ansible.scheduler.SSHConnection')
+        self.connection = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loads = {'ctl1': '1.50 1.0 1.0 1/100 1\n2\n', 'ctl2': '0.40 1.0 1.0 1/100 1\n4\n'}
+        def connect(hostname, port):
+            ssh = MagicMock()
+            if hostname in self.loads:
+                ssh.run.return_value = (0, self.loads[hostname], '')
+            else:
+                ssh.run.side_effect = socket.timeout()
+            ssh.__enter__.return_value = ssh
+            return ssh
+        self.connection.side_effect = connect
+
+    def test_parse_control_hosts(self):
+        self.assertEqual(parse_control_hosts('a, b:2222,', 'default', 22), [('a', 22), ('b', 2222)])
+        self.assertEqual(parse_control_hosts(None, 'default', 22), [('default', 22)])
+
+    def test_acquire_prefers_the_least_loaded_healthy_host(self):
+        with self.app.app_context():
+            first = self.scheduler.acquire()
+            second = self.scheduler.acquire()
+            third = self.scheduler.acquire()
+        self.assertEqual([first.hostname, second.hostname, third.hostname], ['ctl2', 'ctl2', 'ctl1'])
+        self.assertFalse(self.scheduler.hosts[2].healthy)
+        self.scheduler.release(first)
+        self.assertEqual(self.scheduler.hosts[1].active_runs, 1)
+        # Probes are reused within their TTL
+        self.assertEqual(self.connection.call_count, 3)
+
+    def test_acquire_waits_when_every_healthy_host_is_full(self):
+        with self.app.app_context():
+            held = [self.scheduler.acquire() for _ in range(4)]
+            with self.assertRaises(TimeoutError):
+                self.scheduler.acquire(timeout=0.05)
+            releaser = threading.Timer(0.1, self.scheduler.release, [held[0]])
+            releaser.start()
+            self.assertIs(self.scheduler.acquire(timeout=2), held[0])
+        self.assertEqual(max(host.active_runs for host in self.scheduler.hosts), 2)
+
+    def test_concurrent_acquires_share_one_probe_round(self):
+        probing = threading.Event()
+
+        def connect(hostname, port):
+            ssh = MagicMock()
+            ssh.run.side_effect = lambda command: probing.wait(0.2) and (0, '0.10 1.0 1.0 1/100 1\n1\n', '')
+            ssh.__enter__.return_value = ssh
+            return ssh
+
+        self.connection.side_effect = connect
+        with self.app.app_context():
+            threads = [threading.Thread(target=self.scheduler.acquire) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            probing.set()
+            for thread in threads:
+                thread.join(2)
+        self.assertEqual(self.connection.call_count, 3)
+
+    def test_sync_copies_only_when_the_primary_changed(self):
+        with self.app.app_context():
+            self.assertFalse(self.scheduler.sync(self.scheduler.primary))
+            source, target = MagicMock(), MagicMock()
+            self.connection.side_effect = None
+            self.connection.return_value.__enter__.side_effect = [source, source, target, source]
+            source.run.return_value = (0, 'abc  -\n', '')
+            reader = source.open_channel.return_value
+            reader.recv.side_effect = [b'tar data', b'']
+            reader.recv_exit_status.return_value = 0
+            writer = target.open_channel.return_value
+            writer.recv_exit_status.return_value = 0
+            host = self.scheduler.hosts[1]
+            self.assertTrue(self.scheduler.sync(host))
+            self.assertFalse(self.scheduler.sync(host))
+        reader.exec_command.assert_called_once_with('tar -C / -cf - tmp/playbooks tmp/inventory')
+        writer.sendall.assert_called_once_with(b'tar data')
+        writer.shutdown_write.assert_called_once()
+
+FAKE_PLAYBOOK = """#!/bin/sh
+echo '{"_event": "v2_playbook_on_task_start", "task": {"name": "ping"}}'
+echo "tmp=$ANSIBLE_LOCAL_TEMP args=$*"
+echo "cp=$ANSIBLE_SSH_CONTROL_PATH_DIR"
+if [ "$3" = "slow.yml" ]; then sleep 30; fi
+"""
+
+class TestLocalExecution(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.bin_dir = tempfile.mkdtemp()
+        script = os.path.join(self.bin_dir, 'ansible-playbook')
+        with open(script, 'w') as fake:
+            fake.write(FAKE_PLAYBOOK)
+        os.chmod(script, 0o755)
+        path = patch.dict(os.environ, {'PATH': self.bin_dir + os.pathsep + os.environ['PATH']})
+        path.start()
+        self.addCleanup(path.stop)
+        self.runner = PlaybookRunner(self.app)
+        self.runner.local = LocalExecutor(self.bin_dir, '/srv/hosts', 2)
+
+    def test_run_uses_an_isolated_temp_dir(self):
+        success, data, status_code = self.runner.submit('site.yml', {'check': True})
+        job = self.runner.jobs.get(data['id'])
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.status, SUCCEEDED)
+        lines = job.log.read()['lines']
+        self.assertEqual(lines[0], 'TASK [ping] ***')
+        self.assertRegex(lines[1], r'^tmp=/\S+/ansible-run-\w+/tmp args=-i /srv/hosts site.yml --check$')
+        self.assertFalse(os.path.exists(lines[1].split()[0][4:-4]))
+        # Control sockets outlive the run so persisted SSH masters stay reachable
+        self.assertEqual(lines[2], f'cp={self.runner.local.control_path_dir}')
+        self.assertTrue(os.path.isdir(self.runner.local.control_path_dir))
+        self.assertEqual((job.to_dict()['host'], self.runner.local.running), ('local', 0))
+
+    def test_control_socket_directory_must_be_private(self):
+        directory = os.path.join(self.bin_dir, 'cp')
+        os.mkdir(directory, 0o777)
+        os.chmod(directory, 0o777)
+        _private_dir(directory)
+        self.assertEqual(stat.S_IMODE(os.stat(directory).st_mode), 0o700)
+        os.symlink(directory, os.path.join(self.bin_dir, 'planted'))
+        with self.assertRaises(PermissionError):
+            _private_dir(os.path.join(self.bin_dir, 'planted'))
+        with patch('app.api.ansible.local.os.getuid', return_value=os.getuid() + 1):
+            with self.assertRaises(PermissionError):
+                _private_dir(directory)
+
+    def test_waiting_for_a_process_slot_is_bounded(self):
+        executor = LocalExecutor(self.bin_dir, '/srv/hosts', 1)
+        with executor.process(['slow.yml']):
+            with self.assertRaises(TimeoutError):
+                executor.run(['site.yml'], None, lambda line: None, timeout=0.05)
+        self.assertEqual(executor.run(['site.yml'], None, lambda line: None, timeout=0.05), 0)
+
+    def test_local_backend_configuration_is_validated(self):
+        with self.assertRaisesRegex(ValueError, 'ANSIBLE_EXECUTION_BACKEND'):
+            execution_backend({'ANSIBLE_EXECUTION_BACKEND': 'locall'})
+        config = {'LOCAL_PLAYBOOKS_DIR': self.bin_dir, 'ANSIBLE_LOCAL_INVENTORY_PATH': None,
+                  'ANSIBLE_LOCAL_MAX_PROCESSES': 2}
+        with patch('app.api.ansible.local._executor', None):
+            with self.assertRaisesRegex(ValueError, 'ANSIBLE_LOCAL_INVENTORY_PATH'):
+                get_local_executor(config)
+            config['ANSIBLE_LOCAL_INVENTORY_PATH'] = os.path.join(self.bin_dir, 'ansible-playbook')
+            self.assertEqual(get_local_executor(config).inventory_path, config['ANSIBLE_LOCAL_INVENTORY_PATH'])
+
+    def test_cancel_interrupts_the_local_process(self):
+        self.app.config['ANSIBLE_RUN_CANCEL_GRACE'] = 0
+        self.addCleanup(self.app.config.__setitem__, 'ANSIBLE_RUN_CANCEL_GRACE', 10)
+        success, data, status_code = self.runner.submit('slow.yml', {})
+        job = self.runner.jobs.get(data['id'])
+        while job.log.next_offset < 2:
+            job.wait(0.01)
+        self.runner.jobs.cancel(job.id)
+        self.assertTrue(job.wait(10))
+        self.assertEqual(job.status, CANCELLED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import hashlib
+import io
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from flask_jwt_extended import create_access_token
+from app import app
+from app.api.ansible.sync import PlaybookSync
+
+def sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+class TestPlaybookSync(unittest.TestCase):
+
+    def setUp(self):
+        self.local_dir = tempfile.mkdtemp()
+        self.files = {'site.yml': b'- hosts: all\n', 'roles/web/tasks/main.yml': b'- name: nginx\n',
+                      'group_vars/all.yml': b'port: 80\n'}
+        for path, content in self.files.items():
+            os.makedirs(os.path.join(self.local_dir, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(self.local_dir, path), 'wb') as local_file:
+                local_file.write(content)
+        self.ssh = MagicMock()
+        self.channel = self.ssh.open_channel.return_value
+        self.sent = io.BytesIO()
+        self.channel.sendall.side_effect = self.sent.write
+        self.channel.makefile_stderr.return_value.read.return_value = b''
+        self.channel.recv_exit_status.return_value = 0
+
+    def remote(self, files):
+        self.ssh.run.return_value = (0, ''.join(f'{digest}  ./{path}\n' for path, digest in files.items()), '')
+
+    def test_only_changed_files_are_streamed(self):
+        self.remote({'site.yml': sha256(self.files['site.yml']), 'group_vars/all.yml': 'stale', 'old.yml': 'x'})
+        result = PlaybookSync().sync(self.ssh, self.local_dir, '/srv/playbooks', prune=True)
+        self.assertEqual(result['uploaded'], ['group_vars/all.yml', 'roles/web/tasks/main.yml'])
+        self.assertEqual((result['deleted'], result['unchanged']), (['old.yml'], 1))
+        with tarfile.open(fileobj=io.BytesIO(self.sent.getvalue()), mode='r:gz') as archive:
+            self.assertEqual(sorted(archive.getnames()), result['uploaded'])
+            self.assertEqual(archive.extractfile('group_vars/all.yml').read(), b'port: 80\n')
+        script = self.channel.exec_command.call_args[0][0]
+        self.assertIn('mktemp -d /srv/playbooks/.sync.XXXXXX', script)
+        self.assertIn('rm -f -- old.yml', script)
+        self.channel.shutdown_write.assert_called_once()
+
+    def test_nothing_is_sent_when_up_to_date(self):
+        self.remote({path: sha256(content) for path, content in self.files.items()})
+        result = PlaybookSync().sync(self.ssh, self.local_dir, '/srv/playbooks')
+        self.assertEqual((result['uploaded'], result['unchanged']), ([], 3))
+        self.ssh.open_channel.assert_not_called()
+
+    def test_failed_apply_raises(self):
+        self.remote({})
+        self.channel.recv_exit_status.return_value = 2
+        self.channel.makefile_stderr.return_value.read.return_value = b'tar: disk full'
+        with self.assertRaisesRegex(RuntimeError, 'disk full'):
+            PlaybookSync().sync(self.ssh, self.local_dir, '/srv/playbooks')
+
+    def test_sync_route_requires_the_admin_role(self):
+        client = app.test_client()
+        with app.test_request_context():
+            tokens = {role: create_access_token(identity={'user_id': '1', 'role': role}) for role in ('user', 'admin')}
+        with patch('app.routes.Ansible') as ansible:
+            ansible.return_value.sync_playbooks.return_value = (True, {'uploaded': []}, None)
+            response = client.post('/playbooks/sync', json={'prune': True},
+                                   headers={'Authorization': f'Bearer {tokens["user"]}'})
+            self.assertEqual(response.status_code, 403)
+            ansible.return_value.sync_playbooks.assert_not_called()
+            response = client.post('/playbooks/sync', json={'prune': True},
+                                   headers={'Authorization': f'Bearer {tokens["admin"]}'})
+        self.assertEqual(response.status_code, 200)
+        ansible.return_value.sync_playbooks.assert_called_once_with(prune=True)
+
+if __name__ == '__main__':
+    unittest.main()
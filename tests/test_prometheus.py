@@ -0,0 +1,183 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from app import app
+from flask_jwt_extended import create_access_token
+from app.api.prometheus import dashboardProxmox
+from app.api.prometheus.dashboardProxmox import (
+    PANEL_KEY_LABEL, PANELS, panel_queries, query_panel, query_panel_range, query_snapshot
+)
+from app.api.prometheus.downsample import downsample_values
+from app.api.prometheus.range_cache import PrometheusCache
+from app.api.prometheus.live import LiveMetrics
+
+def range_fetcher(calls, step):
+    def fetch(start, end):
+        calls.append((start, end))
+        values = [[t, str(t)] for t in range(int(start), int(end) + 1, step)]
+        return {'status': 'success', 'data': {'resultType': 'matrix', 'result': [{'metric': {'instance': 'a'}, 'values': values}]}}
+    return fetch
+
+def prometheus_response(series):
+    response = MagicMock()
+    response.json.return_value = {'status': 'success', 'data': {'resultType': 'vector', 'result': series}}
+    return response
+
+class TestPrometheusDashboard(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        dashboardProxmox.get_cache().clear()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    @patch.object(dashboardProxmox._session, 'get')
+    def test_memory_panel_is_one_merged_query(self, mock_get):
+        mock_get.return_value = prometheus_response([
+            {'metric': {'__name__': 'node_memory_MemTotal_bytes', 'instance': 'a', PANEL_KEY_LABEL: 'total'}, 'value': [1, '8']},
+            {'metric': {'__name__': 'node_memory_MemFree_bytes', 'instance': 'a', PANEL_KEY_LABEL: 'free'}, 'value': [1, '2']},
+        ])
+        result = query_panel('memory')
+        self.assertEqual(mock_get.call_count, 1)
+        query = mock_get.call_args[1]['params']['query']
+        self.assertEqual(query.count(' or '), len(PANELS['memory']) - 1)
+        self.assertEqual(result['total']['data']['result'][0]['metric'], {'__name__': 'node_memory_MemTotal_bytes', 'instance': 'a'})
+        self.assertEqual(result['cached']['data']['result'], [])
+
+    @patch.object(dashboardProxmox._session, 'get')
+    def test_snapshot_queries_each_panel_once(self, mock_get):
+        mock_get.return_value = prometheus_response([])
+        snapshot = query_snapshot()
+        self.assertEqual(set(snapshot), set(PANELS))
+        self.assertEqual(mock_get.call_count, len(PANELS))
+
+    def test_downsampling_bounds_points_and_keeps_spikes(self):
+        values = [[1700000000 + 15 * i, '1'] for i in range(5760)]
+        values[1234][1] = '250'
+        downsampled = downsample_values(values, 200)
+        self.assertEqual(len(downsampled), 200)
+        self.assertEqual(downsampled[0], values[0])
+        self.assertEqual(downsampled[-1], values[-1])
+        self.assertIn(values[1234], downsampled)
+
+    @patch.object(dashboardProxmox._session, 'get')
+    def test_panel_range_is_downsampled_per_series(self, mock_get):
+        mock_get.return_value.json.return_value = {'status': 'success', 'data': {'resultType': 'matrix', 'result': [
+            {'metric': {'instance': host}, 'values': [[i, str(i % 7)] for i in range(1000)]} for host in ('a', 'b')
+        ]}}
+        result = query_panel_range('system_load', 0, 1000, 1, max_points=50)
+        self.assertTrue(mock_get.call_args[0][0].endswith('/api/v1/query_range'))
+        self.assertEqual([len(series['values']) for series in result['data']['result']], [50, 50])
+
+    @patch('app.api.prometheus.range_cache.time.time')
+    def test_range_refresh_only_fetches_the_tail(self, mock_time):
+        cache = PrometheusCache(max_bytes=10 ** 7, chunk_steps=240, settle_delay=60, instant_align=10)
+        calls = []
+        fetch = range_fetcher(calls, 15)
+        mock_time.return_value = 21600
+        first = cache.query_range(fetch, 'load', 0, 21600, 15)
+        self.assertEqual(calls, [(0, 21600)])
+        self.assertEqual(len(first['data']['result'][0]['values']), 1441)
+
+        mock_time.return_value = 21630
+        refreshed = cache.query_range(fetch, 'load', 30, 21630, 15)
+        # Only the points newer than the settle delay of the previous fetch are requested again
+        self.assertEqual(calls[1], (21555, 21630))
+        values = refreshed['data']['result'][0]['values']
+        self.assertEqual([values[0][0], values[-1][0], len(values)], [30, 21630, 1441])
+
+        cache.query_range(fetch, 'load', 30, 21630, 15)
+        self.assertEqual(len(calls), 2)
+
+    def test_instant_queries_share_the_aligned_window(self):
+        cache = PrometheusCache(max_bytes=10 ** 7, chunk_steps=240, settle_delay=60, instant_align=10)
+        fetch = MagicMock(return_value={'status': 'success', 'data': {'resultType': 'vector', 'result': []}})
+        cache.instant(fetch, 'up', 1001)
+        cache.instant(fetch, 'up', 1009)
+        cache.instant(fetch, 'up', 1011)
+        self.assertEqual([call[0][0] for call in fetch.call_args_list], [1000, 1010])
+
+    @patch('app.api.prometheus.range_cache.time.time', return_value=100000)
+    def test_range_cache_evicts_to_memory_budget(self, mock_time):
+        cache = PrometheusCache(max_bytes=100000, chunk_steps=100, settle_delay=60, instant_align=10)
+        fetch = range_fetcher([], 15)
+        for query in ('a', 'b', 'c', 'd'):
+            cache.query_range(fetch, query, 0, 6000, 15)
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 100000)
+        self.assertGreater(stats['evictions'], 0)
+
+    def test_fetch_locks_do_not_grow_with_distinct_queries(self):
+        cache = PrometheusCache(max_bytes=10 ** 7, chunk_steps=240, settle_delay=60, instant_align=10)
+        fetch = MagicMock(return_value={'status': 'success', 'data': {'resultType': 'vector', 'result': []}})
+        locks = len(cache._fetch_locks)
+        for instance in range(500):
+            cache.instant(fetch, f'up{{instance="{instance}"}}', 1001)
+        self.assertEqual(len(cache._fetch_locks), locks)
+        self.assertEqual(cache.stats()['misses'], 500)
+
+    def test_live_stream_shares_sampler_and_sends_deltas(self):
+        samples = iter([{'a': '1', 'b': '2'}, {'a': '1', 'b': '3'}])
+        gate = threading.Semaphore(0)
+
+        def sample(key):
+            gate.acquire()
+            return prometheus_response([{'metric': {'instance': host}, 'value': [0, value]}
+                                        for host, value in next(samples).items()]).json()
+
+        evaluate = MagicMock(side_effect=sample)
+        live = LiveMetrics(evaluate, interval=0)
+        first, second = live.stream({'load': 'system_load'}), live.stream({'load': 'system_load'})
+
+        gate.release()
+        event, payload = next(first)
+        self.assertEqual(event, 'snapshot')
+        self.assertEqual(set(payload['load']['series']), {'instance=a', 'instance=b'})
+        self.assertEqual(next(second)[0], 'snapshot')
+        gate.release()
+        event, payload = next(first)
+        self.assertEqual(event, 'delta')
+        self.assertEqual(payload['load']['changed'], {'instance=b': {'metric': {'instance': 'b'}, 'value': '3'}})
+        self.assertEqual(live.stats(), {'samplers': 1, 'subscriptions': 2})
+        self.assertTrue(all(call[0][0] == 'system_load' for call in evaluate.call_args_list))
+        first.close()
+        second.close()
+        self.assertEqual(live.stats()['subscriptions'], 0)
+        gate.release()
+
+    def test_panel_queries_push_down_filters_and_grouping(self):
+        self.assertEqual(panel_queries('cpu'), 'rate(node_cpu_seconds_total[1m])')
+        self.assertEqual(panel_queries('cpu', (('instance', ('a:9100', 'b:9100')),), 'host_mode'),
+                         'sum by (instance, mode) (rate(node_cpu_seconds_total{instance=~"a:9100|b:9100"}[1m]))')
+        self.assertEqual(panel_queries('uptime', (('node', ('pve"1',)),), 'cluster'),
+                         'min(node_time_seconds{node="pve\\"1"} - node_boot_time_seconds{node="pve\\"1"})')
+        self.assertEqual(panel_queries('memory', (), 'host')['free'], 'sum by (instance) (node_memory_MemFree_bytes)')
+        with self.assertRaises(ValueError):
+            panel_queries('memory', (), 'mode')
+
+    @patch.object(dashboardProxmox._session, 'get')
+    def test_metrics_route_applies_request_filters(self, mock_get):
+        mock_get.return_value = prometheus_response([])
+        client = self.app.test_client()
+        with self.app.test_request_context():
+            token = create_access_token(identity={'user_id': '1', 'role': 'user'})
+        headers = {'Authorization': f'Bearer {token}'}
+        response = client.get('/metrics/cpu?node=pve1,pve2&group=mode', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_get.call_args[1]['params']['query'],
+                         'sum by (mode) (rate(node_cpu_seconds_total{node=~"pve1|pve2"}[1m]))')
+        self.assertEqual(client.get('/metrics/memory?group=mode', headers=headers).status_code, 400)
+        # The live stream validates its panels and options like the snapshot
+        for url in ('/metrics/stream?panels=cpu,bogus', '/metrics/stream?panels=memory&group=mode'):
+            self.assertEqual(client.get(url, headers=headers).status_code, 400)
+            self.assertEqual(client.get(url.replace('stream', 'snapshot'), headers=headers).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock
+from app import app
+from app.api.proxmox.provisioning import ProvisioningPipeline
+
+class TestProvisioningPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.proxmox_api = MagicMock()
+        self.proxmox_api.make_request.side_effect = lambda method, url, **kwargs: {
+            '/cluster/nextid': (True, '100', None),
+            '/cluster/resources': (True, [{'vmid': 101}, {'vmid': 103}], None),
+        }[url]
+        upid = 'UPID:pve1:0:0:0:qmclone:9000:root@pam:'
+        self.proxmox_api.clone_vm.return_value = (True, upid, None)
+        self.proxmox_api.update_vm.return_value = (True, None, None)
+        self.proxmox_api.start_vm.return_value = (True, upid, None)
+        self.proxmox_api.task_tracker.wait.return_value = {'status': 'stopped', 'succeeded': True, 'exitstatus': 'OK'}
+        self.pipeline = ProvisioningPipeline(self.app, self.proxmox_api)
+
+    def test_provision_skips_used_vmids_and_runs_every_stage(self):
+        success, data, status_code = self.pipeline.submit('pve1', {'template': 9000, 'count': 3, 'name': 'lab-{index:02d}',
+                                                                   'config': {'memory': 2048}, 'per_vm': [{'cores': 4}]})
+        self.assertTrue(success)
+        job = self.pipeline.jobs.get(data['id'])
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual([vm.vmid for vm in job.vms], [100, 102, 104])
+        self.assertEqual(job.vms[1].name, 'lab-01')
+        self.proxmox_api.update_vm.assert_any_call('/nodes/pve1/qemu/100/config', {'memory': 2048, 'cores': 4})
+        self.assertEqual(self.proxmox_api.start_vm.call_count, 3)
+
+    def test_failed_clone_is_reported_per_vm(self):
+        self.proxmox_api.task_tracker.wait.return_value = {'status': 'stopped', 'succeeded': False, 'exitstatus': 'no space'}
+        success, data, status_code = self.pipeline.submit('pve1', {'template': 9000, 'count': 2, 'start': False})
+        job = self.pipeline.jobs.get(data['id'])
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.to_dict()['summary'], {'failed': 2})
+        self.proxmox_api.update_vm.assert_not_called()
+
+    def test_invalid_count_is_rejected(self):
+        success, message, status_code = self.pipeline.submit('pve1', {'template': 9000, 'count': 0})
+        self.assertFalse(success)
+        self.assertEqual(status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
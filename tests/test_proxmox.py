@@ -2,8 +2,11 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import threading
+import time
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
+from requests.exceptions import HTTPError
 from app import app
 from app.api.proxmox.proxmox import ProxmoxAPI
 
@@ -32,5 +35,119 @@ class TestProxmoxAPI(unittest.TestCase):
         self.assertTrue(success)
         self.assertEqual(data, 'vm_created')
 
+    def test_list_cluster_vms(self):
+        responses = {
+            '/nodes': [{'node': 'pve1', 'status': 'online'}, {'node': 'pve2', 'status': 'online'},
+                       {'node': 'pve3', 'status': 'offline'}],
+            '/nodes/pve1/qemu': [{'vmid': 100}],
+            '/nodes/pve2/qemu': [{'vmid': 200}, {'vmid': 201}],
+        }
+
+        def request(method, url, **kwargs):
+            response = MagicMock()
+            response.json.return_value = {'data': responses[url[len(self.proxmox_api.base_url):]]}
+            return response
+
+        self.proxmox_api.session.request.side_effect = request
+        success, data, status_code = self.proxmox_api.list_cluster_vms('/nodes')
+        self.assertTrue(success)
+        self.assertEqual(sorted(vm['vmid'] for vm in data['vms']), [100, 200, 201])
+        self.assertEqual(data['nodes']['pve2']['vms'], 2)
+        self.assertEqual(data['nodes']['pve3']['status'], 'offline')
+
+    def test_get_requests_are_cached_until_invalidated(self):
+        self.proxmox_api.session.request.return_value.json.return_value = {'data': 'vm_list'}
+        self.proxmox_api.list_vms('/nodes/pve1/qemu')
+        self.proxmox_api.list_vms('/nodes/pve1/qemu')
+        self.assertEqual(self.proxmox_api.session.request.call_count, 1)
+        self.assertEqual(self.proxmox_api.cache.stats()['hits'], 1)
+
+        self.proxmox_api.start_vm('/nodes/pve1/qemu/100/status/start')
+        self.proxmox_api.list_vms('/nodes/pve1/qemu')
+        self.assertEqual(self.proxmox_api.session.request.call_count, 3)
+
+    def test_concurrent_identical_gets_share_one_call(self):
+        release = threading.Event()
+
+        def request(method, url, **kwargs):
+            release.wait(1)
+            response = MagicMock()
+            response.json.return_value = {'data': 'status'}
+            return response
+
+        self.proxmox_api.session.request.side_effect = request
+        url = '/nodes/pve1/qemu/100/status/current'
+        futures = [self.proxmox_api.executor.submit(self.proxmox_api.get_vm_status, url) for _ in range(5)]
+        time.sleep(0.1)
+        release.set()
+        self.assertTrue(all(future.result()[1] == 'status' for future in futures))
+        self.assertEqual(self.proxmox_api.session.request.call_count, 1)
+
+    def test_unauthorized_request_logs_in_and_retries_once(self):
+        calls = []
+
+        def request(method, url, **kwargs):
+            calls.append((method, url))
+            response = MagicMock()
+            if url.endswith('/access/ticket'):
+                response.json.return_value = {'data': {'ticket': 't', 'CSRFPreventionToken': 'c'}}
+            elif len(calls) == 1:
+                response.status_code = 401
+                response.raise_for_status.side_effect = HTTPError(response=response)
+            else:
+                response.json.return_value = {'data': 'vm_list'}
+            return response
+
+        self.proxmox_api.session.request.side_effect = request
+        success, data, status_code = self.proxmox_api.list_vms('/nodes/pve1/qemu')
+        self.assertTrue(success)
+        self.assertEqual(data, 'vm_list')
+        self.assertEqual([method for method, _ in calls], ['GET', 'POST', 'GET'])
+        self.assertIsNotNone(self.proxmox_api.ticket_expires_at)
+
+    def test_token_auth_skips_login(self):
+        with patch.dict(self.app.config, {'PROXMOX_TOKEN_ID': 'root@pam!dash', 'PROXMOX_TOKEN_SECRET': 'secret'}):
+            proxmox_api = ProxmoxAPI(self.app)
+        self.assertEqual(proxmox_api.session.headers['Authorization'], 'PVEAPIToken=root@pam!dash=secret')
+        proxmox_api.session = MagicMock()
+        success, data, status_code = proxmox_api.login('/access/ticket')
+        self.assertTrue(success)
+        proxmox_api.session.request.assert_not_called()
+
+    def test_bulk_vm_action_respects_per_node_limit(self):
+        lock = threading.Lock()
+        in_flight = {'pve1': 0, 'pve2': 0}
+        peak = {'pve1': 0, 'pve2': 0}
+
+        def request(method, url, **kwargs):
+            node = url.split('/nodes/')[1].split('/')[0]
+            with lock:
+                in_flight[node] += 1
+                peak[node] = max(peak[node], in_flight[node])
+            time.sleep(0.01)
+            with lock:
+                in_flight[node] -= 1
+            response = MagicMock()
+            if node == 'pve2' and url.endswith('/201/status/stop'):
+                response.status_code = 500
+                response.raise_for_status.side_effect = HTTPError(response=response)
+            response.json.return_value = {'data': 'UPID:x'}
+            return response
+
+        self.proxmox_api.session.request.side_effect = request
+        operations = [{'node': 'pve1', 'vmid': vmid, 'action': 'start'} for vmid in range(100, 110)]
+        operations += [{'node': 'pve2', 'vmid': 201, 'action': 'stop'}, {'node': 'pve2', 'vmid': 202, 'action': 'reboot'}, 1]
+        success, data, status_code = self.proxmox_api.bulk_vm_action(operations, per_node_limit=2)
+        self.assertTrue(success)
+        self.assertEqual(data['succeeded'], 10)
+        self.assertEqual([result['status_code'] for result in data['results'][-3:]], [500, 400, 400])
+        self.assertLessEqual(peak['pve1'], 2)
+
+    def test_bulk_vm_action_rejects_an_invalid_per_node_limit(self):
+        operations = [{'node': 'pve1', 'vmid': 100, 'action': 'start'}]
+        for per_node_limit in ('2', 0, -1, True, 1.5):
+            self.assertEqual(self.proxmox_api.bulk_vm_action(operations, per_node_limit), (False, None, 400))
+        self.proxmox_api.session.request.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+from unittest.mock import MagicMock
+from app.api.proxmox.tasks import TaskTracker, parse_upid
+
+UPID_A = 'UPID:pve1:000A1B2C:0001E240:66500000:qmstart:100:root@pam:'
+UPID_B = 'UPID:pve1:000A1B2D:0001E241:66500001:qmstop:101:root@pam:'
+
+class TestTaskTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.proxmox_api = MagicMock()
+        self.tracker = TaskTracker(self.proxmox_api, poll_min=0.01, poll_max=0.05, backoff=2, retention=60)
+
+    def test_parse_upid(self):
+        fields = parse_upid(UPID_A)
+        self.assertEqual(fields['node'], 'pve1')
+        self.assertEqual(fields['type'], 'qmstart')
+        self.assertEqual(fields['id'], '100')
+        self.assertIsNone(parse_upid('not-a-task'))
+
+    def test_single_task_polled_through_status_endpoint(self):
+        self.proxmox_api.make_request.return_value = (True, {'status': 'stopped', 'exitstatus': 'OK'}, None)
+        self.tracker.track(UPID_A)
+        task = self.tracker.wait(UPID_A, timeout=2)
+        self.assertEqual(task['status'], 'stopped')
+        self.assertTrue(task['succeeded'])
+        self.assertEqual(self.proxmox_api.make_request.call_args[0][1], f'/nodes/pve1/tasks/{UPID_A}/status')
+        self.proxmox_api.cache.invalidate_path.assert_called_with('/nodes/pve1/qemu/100')
+
+    def test_several_tasks_on_a_node_share_one_listing(self):
+        listing = [
+            {'upid': UPID_A, 'status': 'OK', 'endtime': 1716518000},
+            {'upid': UPID_B, 'status': 'some error', 'endtime': 1716518001},
+        ]
+        self.proxmox_api.make_request.return_value = (True, listing, None)
+        with self.tracker._cond:
+            self.tracker.track(UPID_A)
+            self.tracker.track(UPID_B)
+        self.assertFalse(self.tracker.wait(UPID_B, timeout=2)['succeeded'])
+        self.assertTrue(self.tracker.get(UPID_A)['succeeded'])
+        self.assertEqual(self.proxmox_api.make_request.call_args[0][1], '/nodes/pve1/tasks')
+        self.assertEqual(self.proxmox_api.make_request.call_count, 1)
+
+    def test_task_on_unreachable_node_becomes_unknown(self):
+        self.tracker.max_failures = 3
+        self.proxmox_api.make_request.return_value = (False, None, 500)
+        self.tracker.track(UPID_A)
+        task = self.tracker.wait(UPID_A, timeout=2)
+        self.assertEqual(task['status'], 'unknown')
+        self.assertFalse(task['succeeded'])
+        self.assertEqual(self.proxmox_api.make_request.call_count, 3)
+        self.assertEqual(self.tracker.list(active_only=True), [])
+
+    def test_task_pending_past_max_age_becomes_unknown(self):
+        self.tracker.max_age = 0
+        self.proxmox_api.make_request.return_value = (True, {'status': 'running'}, None)
+        self.tracker.track(UPID_A)
+        self.assertEqual(self.tracker.wait(UPID_A, timeout=2)['status'], 'unknown')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from app import app
+from app.ssh_connection import SSHConnection
+from app.ssh_pool import SSHPool
+
+def make_pool(**overrides):
+    settings = dict(max_size=2, max_channels=2, max_idle=60, keepalive=30, connect_timeout=5, checkout_timeout=0.05)
+    settings.update(overrides)
+    return SSHPool('control', 22, 'ansible', 'secret', **settings)
+
+@patch('app.ssh_pool.paramiko.SSHClient')
+class TestSSHPool(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_connections_are_reused_and_multiplexed(self, mock_client):
+        pool = make_pool()
+        first, second = pool.acquire(), pool.acquire()
+        self.assertIs(first, second)
+        third = pool.acquire()
+        self.assertIsNot(first, third)
+        self.assertEqual(mock_client.call_count, 2)
+        mock_client.return_value.connect.assert_called_with('control', username='ansible', password='secret',
+                                                            port=22, timeout=5)
+        for pooled in (first, second, third):
+            pool.release(pooled)
+        pool.acquire()
+        self.assertEqual(mock_client.call_count, 2)
+
+    def test_pool_size_is_bounded(self, mock_client):
+        pool = make_pool(max_size=1, max_channels=1)
+        pool.acquire()
+        with self.assertRaises(TimeoutError):
+            pool.acquire()
+
+    def test_unhealthy_and_idle_connections_are_dropped(self, mock_client):
+        pool = make_pool(max_idle=0)
+        pooled = pool.acquire()
+        pool.release(pooled)
+        mock_client.return_value.get_transport.return_value.is_active.return_value = False
+        pool.acquire()
+        self.assertEqual(mock_client.call_count, 2)
+        mock_client.return_value.get_transport.return_value.is_active.return_value = True
+        pool.release(pool.acquire())
+        pool.release(pool._transports[0])
+        self.assertEqual(pool.evict_idle(), 1)
+        self.assertEqual(pool.stats()['connections'], 0)
+
+    def test_stalled_health_check_does_not_block_the_pool(self, mock_client):
+        mock_client.side_effect = lambda: MagicMock()
+        pool = make_pool(max_channels=1, checkout_timeout=1)
+        stalled = pool.acquire()
+        pool.release(stalled)
+        unblock, checking = threading.Event(), threading.Event()
+
+        def send_ignore():
+            checking.set()
+            unblock.wait(5)
+
+        stalled.client.get_transport.return_value.send_ignore.side_effect = send_ignore
+        borrower = threading.Thread(target=pool.acquire)
+        borrower.start()
+        self.assertTrue(checking.wait(1))
+        started = time.monotonic()
+        other = pool.acquire()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertIsNot(other, stalled)
+        self.assertEqual(pool.stats()['leases'], 2)
+        unblock.set()
+        borrower.join(1)
+
+    def test_ssh_connection_borrows_from_shared_pool(self, mock_client):
+        with patch('app.ssh_connection.get_ssh_pool', return_value=make_pool()):
+            for _ in range(3):
+                with SSHConnection() as ssh:
+                    ssh.upload_file('/tmp/a', '/tmp/b')
+        self.assertEqual(mock_client.call_count, 1)
+        self.assertEqual(mock_client.return_value.open_sftp.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
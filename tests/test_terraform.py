@@ -2,10 +2,14 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import tempfile
 import unittest
 from unittest.mock import patch
+from flask_jwt_extended import create_access_token
 from flask import Flask
 from app.api.terraform.terraform import TerraformAPI
+from app.api.terraform.runner import TerraformRunner, working_dir_lock
+from app.jobs import CANCELLED, SUCCEEDED
 from app import app
 
 class TestTerraformAPI(unittest.TestCase):
@@ -41,5 +45,92 @@ class TestTerraformAPI(unittest.TestCase):
         self.assertTrue(success)
         self.assertEqual(output, 'destroy_output')
 
+FAKE_TERRAFORM = """#!/bin/sh
+echo "terraform $1 in $(basename "$PWD")"
+if [ "$1" = "apply" ]; then
+    trap 'echo "Interrupt received"; exit 1' INT
+    echo "Applying..."
+    while true; do sleep 0.05; done
+fi
+if [ "$1" = "destroy" ]; then
+    trap 'echo "Ignoring interrupt"' INT
+    echo "Destroying..."
+    while true; do sleep 0.05; done
+fi
+echo "Plan: 1 to add" >&2
+"""
+
+class TestTerraformRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app
+        self.bin_dir = tempfile.mkdtemp()
+        script = os.path.join(self.bin_dir, 'terraform')
+        with open(script, 'w') as fake:
+            fake.write(FAKE_TERRAFORM)
+        os.chmod(script, 0o755)
+        path = patch.dict(os.environ, {'PATH': self.bin_dir + os.pathsep + os.environ['PATH']})
+        path.start()
+        self.addCleanup(path.stop)
+        self.app.config['TERRAFORM_WORKING_DIR'] = self.bin_dir
+        self.runner = TerraformRunner(self.app)
+
+    def test_plan_streams_merged_output(self):
+        success, data, status_code = self.runner.submit('plan')
+        job = self.runner.jobs.get(data['id'])
+        self.assertTrue(job.wait(10))
+        self.assertEqual((job.status, job.exit_code), (SUCCEEDED, 0))
+        self.assertEqual(job.log.read()['lines'], [f'terraform plan in {os.path.basename(self.bin_dir)}', 'Plan: 1 to add'])
+        self.assertEqual(self.runner.submit('taint')[2], 400)
+
+    def test_commands_on_one_working_dir_are_serialized_and_cancel_sends_sigint(self):
+        success, data, status_code = self.runner.submit('apply')
+        apply = self.runner.jobs.get(data['id'])
+        while apply.log.next_offset < 2:
+            apply.wait(0.01)
+        success, data, status_code = self.runner.submit('plan')
+        plan = self.runner.jobs.get(data['id'])
+        self.assertFalse(plan.wait(0.3))
+        self.assertEqual(plan.log.read()['lines'], ['Waiting for another Terraform command on this working directory...'])
+        self.runner.jobs.cancel(apply.id)
+        self.assertTrue(apply.wait(10))
+        self.assertEqual((apply.status, apply.exit_code), (CANCELLED, 1))
+        self.assertEqual(apply.log.read()['lines'][-1], 'Interrupt received')
+        self.assertTrue(plan.wait(10))
+        self.assertEqual(plan.status, SUCCEEDED)
+
+    def test_cancel_kills_terraform_after_the_grace_period(self):
+        self.app.config['TERRAFORM_CANCEL_GRACE'] = 0.2
+        self.addCleanup(self.app.config.__setitem__, 'TERRAFORM_CANCEL_GRACE', 30)
+        runner = TerraformRunner(self.app)
+        success, data, status_code = runner.submit('destroy')
+        job = runner.jobs.get(data['id'])
+        while job.log.next_offset < 2:
+            job.wait(0.01)
+        runner.jobs.cancel(job.id)
+        self.assertTrue(job.wait(10))
+        self.assertEqual((job.status, job.exit_code), (CANCELLED, -9))
+        self.assertIn('[cancel] terraform did not stop after SIGINT and was killed', job.log.read()['lines'])
+        self.assertTrue(working_dir_lock(self.bin_dir).acquire(blocking=False))
+        working_dir_lock(self.bin_dir).release()
+
+    def test_config_is_not_rewritten_under_a_running_command(self):
+        client = app.test_client()
+        with app.test_request_context():
+            token = create_access_token(identity={'user_id': '1', 'role': 'admin'})
+        headers = {'Authorization': f'Bearer {token}'}
+        with patch('app.routes.terraform_api') as terraform_api:
+            terraform_api.working_dir = self.bin_dir
+            lock = working_dir_lock(self.bin_dir)
+            with lock:
+                response = client.post('/terraform/config', json={'content': 'x'}, headers=headers)
+            self.assertEqual(response.status_code, 409)
+            self.assertFalse(os.path.exists(os.path.join(self.bin_dir, 'main.tf')))
+            response = client.post('/terraform/config', json={'content': 'x'}, headers=headers)
+        self.assertTrue(response.get_json()['success'])
+        with open(os.path.join(self.bin_dir, 'main.tf')) as config_file:
+            self.assertEqual(config_file.read(), 'x')
+
+
 if __name__ == '__main__':
     unittest.main()